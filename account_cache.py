@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class AccountSnapshotCache:
+    """
+    Bounded LRU of user id -> account snapshot (name, account_number,
+    balance, card_last4 and the last few transactions).
+
+    Writers call invalidate() for every user they touch. A snapshot loaded
+    while an invalidation happened is not stored, so a read racing a
+    transfer can never put a stale balance back into the cache.
+
+    The cache is per process, so another gunicorn worker never sees those
+    invalidations. `change_count()` reads a counter every transfer bumps,
+    at most once per `check_interval` seconds (like model_store.VersionWatcher);
+    when it has moved, the whole cache is dropped. A write made by another
+    worker is therefore served for at most `check_interval` seconds, and a
+    hit costs no query. `ttl` (0 = none) additionally bounds a snapshot's age.
+    """
+
+    def __init__(self, loader, max_users=10000, ttl=0, change_count=None, check_interval=1.0):
+        self.loader = loader
+        self.max_users = max_users
+        self.ttl = ttl
+        self.change_count = change_count
+        self.check_interval = check_interval
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._seen_count = None
+        self._next_check = 0.0
+        self.stats = {"hits": 0, "misses": 0, "resets": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_changes(self, now):
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+        count = self.change_count()
+        with self._lock:
+            if count != self._seen_count:
+                # Snapshots (and loads in flight) may predate another worker's transfer
+                self._seen_count = count
+                self._epoch += 1
+                self._data.clear()
+                self.stats["resets"] += 1
+
+    def get(self, uid):
+        """Returns the snapshot for uid (loading it on a miss), or None if there is no such user."""
+        now = time.monotonic()
+        if self.change_count is not None:
+            self._check_changes(now)
+        with self._lock:
+            entry = self._data.get(uid)
+            if entry is not None and (not self.ttl or now - entry[1] <= self.ttl):
+                self._data.move_to_end(uid)
+                self.stats["hits"] += 1
+                return entry[0]
+            self.stats["misses"] += 1
+            epoch = self._epoch
+
+        snapshot = self.loader(uid)
+
+        with self._lock:
+            if snapshot is not None and epoch == self._epoch:
+                self._data[uid] = (snapshot, now)
+                self._data.move_to_end(uid)
+                while len(self._data) > self.max_users:
+                    self._data.popitem(last=False)
+                    self.stats["evictions"] += 1
+        return snapshot
+
+    def invalidate(self, *uids):
+        with self._lock:
+            self._epoch += 1
+            for uid in uids:
+                self._data.pop(uid, None)
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def stats_snapshot(self):
+        with self._lock:
+            s = dict(self.stats, size=len(self._data), max_users=self.max_users, ttl=self.ttl)
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = s["hits"] / lookups if lookups else 0.0
+        return s
@@ -0,0 +1,180 @@
+import argparse
+import os
+from collections import defaultdict
+
+# --- Rollup tables (kept up to date by chat_log.ChatLogWriter) ---
+ROLLUP_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS intent_daily_rollup (
+        day TEXT NOT NULL,
+        intent TEXT NOT NULL,
+        turns INTEGER NOT NULL DEFAULT 0,
+        confidence_sum REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, intent)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS confidence_histogram_rollup (
+        day TEXT NOT NULL,
+        bucket INTEGER NOT NULL, -- 0..9, i.e. [0.0,0.1) ... [0.9,1.0]
+        turns INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, bucket)
+    )
+    """,
+)
+
+HISTOGRAM_BUCKETS = 10
+UNKNOWN_INTENT = "unknown"
+
+
+def _bucket(confidence):
+    return min(int((confidence or 0.0) * HISTOGRAM_BUCKETS), HISTOGRAM_BUCKETS - 1)
+
+
+def _aggregate(rows, intents=None, buckets=None):
+    """Folds (timestamp, intent, confidence) rows into per-day counters."""
+    intents = intents if intents is not None else defaultdict(lambda: [0, 0.0])
+    buckets = buckets if buckets is not None else defaultdict(int)
+    for timestamp, intent, confidence in rows:
+        day = (timestamp or "")[:10] or "N/A"
+        entry = intents[(day, intent or UNKNOWN_INTENT)]
+        entry[0] += 1
+        entry[1] += confidence or 0.0
+        buckets[(day, _bucket(confidence))] += 1
+    return intents, buckets
+
+
+def _upsert(conn, intents, buckets):
+    conn.executemany(
+        """
+        INSERT INTO intent_daily_rollup (day, intent, turns, confidence_sum) VALUES (?, ?, ?, ?)
+        ON CONFLICT (day, intent) DO UPDATE SET
+            turns = turns + excluded.turns,
+            confidence_sum = confidence_sum + excluded.confidence_sum
+        """,
+        [(day, intent, n, total) for (day, intent), (n, total) in intents.items()],
+    )
+    conn.executemany(
+        """
+        INSERT INTO confidence_histogram_rollup (day, bucket, turns) VALUES (?, ?, ?)
+        ON CONFLICT (day, bucket) DO UPDATE SET turns = turns + excluded.turns
+        """,
+        [(day, bucket, n) for (day, bucket), n in buckets.items()],
+    )
+
+
+def update_rollups(conn, batch):
+    """
+    ChatLogWriter hook: folds a batch of chat_history insert tuples
+    (user_id, timestamp, message, response, intent, confidence) into the
+    rollups inside the same transaction as the insert.
+    """
+    _upsert(conn, *_aggregate((row[1], row[4], row[5]) for row in batch))
+
+
+def backfill(pool, chunk_size=5000):
+    """
+    Rebuilds the rollups from chat_history in one streaming pass.
+    Rows are read in id order up to the max id seen at the start; rows the
+    writer adds meanwhile are folded in by the final transaction, so the
+    result matches the table exactly.
+    """
+    high_water = pool.execute("SELECT COALESCE(MAX(id), 0) FROM chat_history")[0][0]
+    intents, buckets = _aggregate([])
+    last_id, scanned = 0, 0
+    while last_id < high_water:
+        rows = pool.execute(
+            "SELECT id, timestamp, detected_intent, confidence FROM chat_history "
+            "WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (last_id, high_water, chunk_size),
+        )
+        if not rows:
+            break
+        _aggregate(((r[1], r[2], r[3]) for r in rows), intents, buckets)
+        last_id = rows[-1][0]
+        scanned += len(rows)
+
+    with pool.transaction() as conn:
+        pool.begin(conn, write=True)
+        conn.execute("DELETE FROM intent_daily_rollup")
+        conn.execute("DELETE FROM confidence_histogram_rollup")
+        late = conn.execute(
+            "SELECT timestamp, detected_intent, confidence FROM chat_history WHERE id > ?", (high_water,)
+        ).fetchall()
+        _aggregate(late, intents, buckets)
+        _upsert(conn, intents, buckets)
+    return scanned + len(late)
+
+
+# --- Read side (admin analytics endpoints) ---
+def _range(where, params, start, end):
+    if start:
+        where.append("day >= ?")
+        params.append(start)
+    if end:
+        where.append("day <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+
+def daily_summary(pool, start=None, end=None):
+    """Per day: total turns, unknown turns, unknown rate, mean confidence."""
+    where_sql, params = _range([], [], start, end)
+    rows = pool.execute(
+        f"""
+        SELECT day, SUM(turns), SUM(CASE WHEN intent = ? THEN turns ELSE 0 END), SUM(confidence_sum)
+        FROM intent_daily_rollup{where_sql}
+        GROUP BY day ORDER BY day
+        """,
+        [UNKNOWN_INTENT] + params,
+    )
+    # int(): MySQL returns SUM() of an integer column as a Decimal
+    return [
+        {"day": day, "turns": int(turns), "unknown": int(unknown),
+         "unknown_rate": int(unknown) / int(turns) if turns else 0.0,
+         "mean_confidence": conf / int(turns) if turns else 0.0}
+        for day, turns, unknown, conf in rows
+    ]
+
+
+def intent_counts(pool, start=None, end=None):
+    """Per intent over the range: turns and mean confidence, most frequent first."""
+    where_sql, params = _range([], [], start, end)
+    rows = pool.execute(
+        f"""
+        SELECT intent, SUM(turns), SUM(confidence_sum) FROM intent_daily_rollup{where_sql}
+        GROUP BY intent ORDER BY SUM(turns) DESC
+        """,
+        params,
+    )
+    return [{"intent": intent, "turns": int(turns), "mean_confidence": conf / int(turns) if turns else 0.0}
+            for intent, turns, conf in rows]
+
+
+def confidence_histogram(pool, start=None, end=None):
+    """Turns per 0.1-wide confidence bucket over the range."""
+    where_sql, params = _range([], [], start, end)
+    counts = dict(pool.execute(
+        f"SELECT bucket, SUM(turns) FROM confidence_histogram_rollup{where_sql} GROUP BY bucket",
+        params,
+    ))
+    return [{"bucket": b, "min": b / HISTOGRAM_BUCKETS, "max": (b + 1) / HISTOGRAM_BUCKETS,
+             "turns": int(counts.get(b, 0))} for b in range(HISTOGRAM_BUCKETS)]
+
+
+if __name__ == "__main__":
+    import db
+
+    parser = argparse.ArgumentParser(description="Maintain the chat analytics rollups.")
+    parser.add_argument("--backfill", action="store_true", help="Rebuild rollups from chat_history.")
+    args = parser.parse_args()
+
+    db_path = os.environ.get("BANKBOT_DB_PATH", os.path.join(os.path.dirname(__file__), "data.db"))
+    pool = db.get_pool(db_path)
+    with pool.transaction() as conn:
+        for ddl in ROLLUP_TABLES:
+            conn.execute(ddl)
+    if args.backfill:
+        print(f"Rolled up {backfill(pool)} chat_history rows.")
+    else:
+        parser.print_help()
@@ -1,49 +1,167 @@
-from flask import Flask, request, jsonify, session, make_response
-import csv
-import io
-import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, request, jsonify, session, make_response, Response, stream_with_context, g
+from werkzeug.security import generate_password_hash
 import os
-import re
+import secrets
+import time
 from datetime import datetime
-import spacy
-import train as train_module # <-- KEEP ONLY THIS ONE IMPORT
+import corpus  # CSV + nlu_data readers; spaCy itself is only imported by the model loader
+import db
+import chat_log
+import nlu_engine
+import model_store
+import analytics
+import entities
+import intents
+import account_cache
+import transfers
+import migrations
+import storage
+import nlu_io
+import metrics
+import profiler
+import dialogue_state
+import auth_hashing
 
 # --- Paths ---
 APP_ROOT = os.path.dirname(__file__)
-DB_PATH = os.path.join(APP_ROOT, "data.db")
+DB_PATH = os.environ.get("BANKBOT_DB_PATH", os.path.join(APP_ROOT, "data.db"))
 MODEL_PATH = os.path.join(APP_ROOT, "models", "nlu_model")
+NLU_LEAN_LOAD = os.environ.get("BANKBOT_NLU_LEAN", "1") != "0"
+# spacy, or numpy: the compiled copy of the textcat (compiled_nlu.py), no spaCy import at serve time
+NLU_BACKEND = os.environ.get("BANKBOT_NLU_BACKEND", "spacy")
+# eager: load before serving (gunicorn.conf.py does this in the master, before fork)
+# background: serve auth/profile at once, warm the model on a thread (default)
+# lazy: load on the first chat request
+MODEL_LOAD_MODE = os.environ.get("BANKBOT_MODEL_LOAD", "background")
+MODEL_WAIT = float(os.environ.get("BANKBOT_MODEL_WAIT", "30"))  # max seconds a chat waits for warm-up
+CONFIDENCE_THRESHOLD = 0.3  # below this the model's best guess is answered as "unknown"
+METRICS_TOKEN = os.environ.get("BANKBOT_METRICS_TOKEN")  # if set, /metrics wants "Authorization: Bearer <token>"
 
 # --- Flask app setup ---
 app = Flask(__name__, static_folder="static", static_url_path="")
 app.secret_key = "replace-with-a-random-secret-key"
 
+# --- Metrics (GET /metrics, Prometheus text format; BANKBOT_METRICS=0 disables) ---
+# Registered first so the timings cover the other before_request hooks too.
+# Values are per process: with several gunicorn workers each scrape sees one worker.
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "bankbot_request_duration_seconds", "Request latency by route", ("route", "method", "status"))
+STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "bankbot_stage_duration_seconds", "Time spent per request stage", ("route", "stage", "intent"))
+NLU_RESULTS = metrics.REGISTRY.counter(
+    "bankbot_nlu_results_total", "Chat turns by how the intent was decided", ("source",))
+UNKNOWN_INTENTS = metrics.REGISTRY.counter(
+    "bankbot_unknown_intent_total", "Chat turns answered as the unknown intent", ("source",))
+LOW_CONFIDENCE = metrics.REGISTRY.counter(
+    "bankbot_low_confidence_total", f"Model predictions below the {CONFIDENCE_THRESHOLD} confidence threshold")
+AUTH_HASH_SECONDS = metrics.REGISTRY.histogram(
+    "bankbot_auth_hash_seconds", "Password hash time, queued for a pool slot and hashing", ("op", "phase"))
+
+# Optional: dump collapsed stacks of requests slower than BANKBOT_PROFILE_SLOW_MS
+slow_request_profiler = profiler.create_profiler(os.path.join(APP_ROOT, "profiles"))
+
+@app.before_request
+def start_request_timer():
+    if metrics.ENABLED:
+        g.request_started = time.perf_counter()
+        metrics.start_request()
+    if slow_request_profiler:
+        g.profile_started = time.perf_counter()
+        slow_request_profiler.request_started()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if metrics.ENABLED and "request_started" in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, route, request.method,
+                                str(response.status_code))
+        intent = g.get("intent", "")
+        for stage, seconds in metrics.finish_request():
+            STAGE_SECONDS.observe(seconds, route, stage, intent)
+    if slow_request_profiler and "profile_started" in g:
+        slow_request_profiler.request_finished(f"{request.method} {route}", time.perf_counter() - g.profile_started)
+    return response
+
 # --- Load spaCy NLU model ---
 # app.py (NEW MODEL LOADING BLOCK - START)
 # Global variable holding the model (Initialize it to None)
 nlp = None
+model_version = None  # published version being served; None = base model at MODEL_PATH
+nlu_backend = None    # backend actually serving: "spacy" or "numpy" (falls back to spacy)
+
+# LRU of normalized message -> doc.cats, cleared on every model (re)load
+intent_cache = nlu_engine.create_intent_cache()
+
+# Training phrasings answered without inference, rebuilt on every model (re)load
+match_index = None
+# Char n-gram TF-IDF over the same phrasings, tried when the model's score is too low
+ngram_index = None
 
-def load_nlu_model(path):
-    """Loads the spaCy model from the given path into the global nlp variable."""
-    global nlp
+# intent -> handler / static reply; replies reloaded on admin edits and model (re)load
+intent_registry = intents.IntentRegistry()
+
+def reload_intent_replies():
+    try:
+        intent_registry.load_replies(db_pool)
+    except Exception as e:
+        print(f"Error loading bot replies: {e}")
+
+def build_match_index(labels=None):
+    """labels: the serving model's intents; corpus rows with any other intent are left out."""
+    global match_index, ngram_index
+    index = nlu_engine.ExactMatchIndex(corpus.load_nlu_sources(), labels)
+    pairs = [(text, intent) for text, intent in corpus.load_combined_nlu_data()
+             if (labels is None or intent in labels) and text.lower() not in index.ambiguous]
+    match_index = index
+    ngram_index = nlu_engine.create_ngram_index(pairs)
+
+def load_nlu_model(path, version=None):
+    """
+    Loads the spaCy model from the given path and swaps it in as the global nlp.
+    Requests already running keep the model they started with; if loading
+    fails the previous model stays in service.
+    """
+    global nlp, model_version, nlu_backend
+    reload_intent_replies()
     try:
-        nlp = spacy.load(path) 
-        print("Successfully loaded NLU model.")
+        new_nlp = nlu_engine.load_pipeline(path, lean=NLU_LEAN_LOAD, backend=NLU_BACKEND)
     except OSError:
-        nlp = None
         print(f"NLU model not found at {path}. Bot functionality will be limited.")
+        build_match_index(nlu_engine.model_labels(nlp))
+        return False
     except Exception as e:
-        nlp = None
         print(f"Error loading NLU model: {e}")
-
-# Call the function to load the model when the app starts
-load_nlu_model(MODEL_PATH) 
+        build_match_index(nlu_engine.model_labels(nlp))
+        return False
+
+    build_match_index(nlu_engine.model_labels(new_nlp))
+    nlp = new_nlp
+    model_version = version
+    nlu_backend = getattr(new_nlp, "backend", "spacy")
+    if intent_cache:
+        intent_cache.clear()
+    print(f"Successfully loaded NLU model ({version or 'base'}, {nlu_backend}).")
+    return True
+
+def load_published_model(version):
+    return load_nlu_model(model_store.model_path(version), version)
+
+# Every worker polls the models/CURRENT pointer and hot-swaps on change
+model_watcher = model_store.VersionWatcher(load_published_model)
+
+# Optional micro-batching of concurrent chat requests (BANKBOT_NLU_BATCH_MS)
+nlu_batcher = nlu_engine.create_batcher(lambda: nlp)
 # app.py (NEW MODEL LOADING BLOCK - END)
 # --- Database setup ---
+# Shared connection pool: one WAL-mode connection per worker thread, or a
+# pooled MySQL/PostgreSQL server shared by several nodes when BANKBOT_DB_URL is set
+db_pool = db.get_pool(DB_PATH)
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    # Versioned, idempotent: only migrations newer than PRAGMA user_version run
+    migrations.migrate(db_pool, MIGRATIONS)
 
+def _create_tables(c):
     # Existing Users table
     c.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -109,24 +227,71 @@ def init_db():
         admin_pass_hash = generate_password_hash("admin")
         c.execute("INSERT INTO admin_users (username, password) VALUES (?, ?)", ("admin", admin_pass_hash))
 
-
-    conn.commit()
-    conn.close()
+    # Indexes behind the paginated admin history endpoint
+    for ddl in chat_log.HISTORY_INDEXES:
+        c.execute(ddl)
+
+    # Per-day intent / confidence rollups for the analytics endpoints
+    for ddl in analytics.ROLLUP_TABLES:
+        c.execute(ddl)
+
+    # Idempotency keys of submitted transfers
+    for ddl in transfers.TRANSFER_TABLES:
+        c.execute(ddl)
+
+# Schema history. Never edit a released migration; append a new one.
+MIGRATIONS = (
+    migrations.Migration(1, "base tables, history indexes, analytics rollups, transfer_requests", _create_tables),
+    migrations.Migration(2, "covering (user_id, id) index for mini statements", migrations.statements(
+        # Serves "WHERE user_id=? ORDER BY id DESC LIMIT n" from the index alone
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions "
+        "(user_id, id, type, amount, description, timestamp)",
+    )),
+    migrations.Migration(3, "change_counters (nlu_data edits invalidate the corpus cache)", migrations.statements(
+        "CREATE TABLE IF NOT EXISTS change_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "INSERT INTO change_counters (name, value) VALUES ('nlu_data', 0)",
+    )),
+    migrations.Migration(4, "dialogue_state (pending slot questions shared by workers)",
+                         migrations.statements(*dialogue_state.DIALOGUE_TABLES)),
+    migrations.Migration(5, "change_counters 'accounts' (transfers reset other workers' account caches)",
+                         migrations.statements(
+        "INSERT INTO change_counters (name, value) VALUES ('accounts', 0)",
+    )),
+    migrations.Migration(6, "dialogue_state.uid (pending questions tied to their user)",
+                         migrations.statements(dialogue_state.DIALOGUE_UID_COLUMN)),
+)
 # END OF init_db
 
 # --- Database Helper (Must be defined before first use) ---
 def query_db(query, args=(), one=False):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(query, args)
-    rv = cur.fetchall()
-    conn.commit()
-    conn.close()
+    # Reuses the thread's pooled connection; reads skip the commit
+    rv = db_pool.execute(query, args)
     return (rv[0] if rv else None) if one else rv
 
 # Initialize database (Must run once)
 init_db()
 
+# Background chat_history writer (batched, off the request thread)
+chat_log_writer = chat_log.create_writer(db_pool, os.path.dirname(DB_PATH),
+                                         on_batch=[analytics.update_rollups])
+
+# Initial model load (after init_db: it reads nlu_data), per BANKBOT_MODEL_LOAD
+model_watcher.loaded_version = model_store.current_version()
+model_loader = nlu_engine.ModelLoader(lambda: load_published_model(model_watcher.loaded_version))
+if MODEL_LOAD_MODE == "eager":
+    model_loader.start(background=False)
+elif MODEL_LOAD_MODE == "background":
+    model_loader.start()
+
+
+# Background retraining (child process + atomic publish)
+retrain_job = model_store.RetrainJob()
+
+@app.before_request
+def check_model_version():
+    if MODEL_LOAD_MODE != "lazy":
+        model_loader.start()  # no-op unless this worker forked while the master was still loading
+    model_watcher.check()
 
 # --- Admin Helper: Check Admin Status ---
 def is_admin():
@@ -134,94 +299,143 @@ def is_admin():
     
 # --- Get Intents Helper (Reads both CSV and DB) ---
 def get_all_intents():
-    # Uses the helper function from train.py to get intents from combined source
-    return train_module.get_intents_from_combined_source() 
+    # Uses the corpus helper (CSV + nlu_data) to get intents from the combined source
+    return corpus.get_intents_from_combined_source()
 
 # --- Helper: Extract entities (Used by NLU) ---
-def extract_entities(text):
-    ent = {}
-    text_lower = text.lower()
+# Single-pass compiled extractor: amount, account_number, card/account/loan type, date, day
+extract_entities = entities.extract_entities
 
-    # Amount extraction
-    m = re.search(r'(?:₹|\bINR\b|\bRs\b|\$)?\s?([0-9][0-9,.]*?)', text.replace(',', ''))
-    if m:
-        try:
-            ent['amount'] = float(m.group(1).replace('₹', '').replace('$', '').strip())
-        except:
-            pass
+# --- Dialogue state: a question the bot asked, answered by the next message ---
+# Per-process LRU by default; BANKBOT_DIALOGUE_STORE=db shares it between workers
+dialogue_store = dialogue_state.create_store(db_pool)
+FOLLOW_UP_MAX_WORDS = 6  # longer messages are classified as a new request
 
-    # Account number
-    m2 = re.search(r'\b(\d{4,18})\b', text)
-    if m2:
-        ent['account_number'] = m2.group(1)
-
-    return ent
+def dialogue_key():
+    """
+    The chat session's key in dialogue_store: a random id kept in the Flask
+    session while a question is pending. The next chat turn pops it, so
+    turns with nothing pending never reach the store.
+    """
+    key = session.get("dialogue_id")
+    if key is None:
+        key = session["dialogue_id"] = secrets.token_hex(8)
+    return key
+
+def ask_for_slots(turn, slots, missing, question):
+    """Remembers what the turn still needs, so the reply to `question` can fill it in."""
+    if dialogue_store:
+        pending = dialogue_state.Pending(turn.intent, slots, missing, turn.uid)
+        dialogue_store.save(dialogue_key(), pending)
+    return question
+
+def resolve_follow_up(message, pending):
+    """
+    Answers a pending question from the message's entities alone, without
+    classification. Returns recognize_intent's tuple with source
+    "dialogue_state", or None if the message fills none of the missing
+    slots, is long, or is a training phrasing of its own.
+    """
+    if len(message.split()) > FOLLOW_UP_MAX_WORDS:
+        return None
+    if match_index and match_index.lookup(message)[0] not in (None, pending.intent):
+        return None
+    with metrics.stage("entities"):
+        found = extract_entities(message, prefer=pending.missing[0] if pending.missing else None)
+    if not any(slot in found for slot in pending.missing):
+        return None
+    return pending.intent, 1.0, dict(pending.slots, **found), "dialogue_state"
 
 # --- Intent recognition helper (Must be defined before chat route) ---
+def predict_cats(text):
+    """Runs the textcat model (batched if enabled) and returns doc.cats."""
+    if nlu_batcher:
+        return nlu_batcher.predict(text)
+    doc = nlp(text)
+    return doc.cats if hasattr(doc, "cats") else {}
+
 def recognize_intent(message: str):
     """
-    Runs the NLU model on user input and returns (intent, confidence, entities).
+    Runs the NLU model on user input and returns (intent, confidence, entities, source).
+    source says how the intent was decided: exact_match / normalized_match
+    (training corpus, no inference), cache, model, ngram_match (model unsure,
+    nearest corpus phrasing by char n-grams; confidence is the similarity),
+    or no_model.
     """
-    if not nlp:
-        return "unknown", 0.0, {}
+    # Still warming up (or lazy and not started): wait for the model, bounded
+    if nlp is None:
+        with metrics.stage("model_wait"):
+            model_loader.wait(MODEL_WAIT)
+
+    # Fast path: phrasings straight from the training corpus
+    if match_index:
+        with metrics.stage("nlu"):
+            intent, source = match_index.lookup(message)
+        if intent:
+            with metrics.stage("entities"):
+                entities = extract_entities(message)
+            return intent, 1.0, entities, source
 
-    doc = nlp(message)
-    intent_scores = doc.cats if hasattr(doc, "cats") else {}
+    if not nlp:
+        return "unknown", 0.0, {}, "no_model"
+
+    with metrics.stage("nlu"):
+        source = "cache"
+        key = nlu_engine.normalize_message(message)
+        intent_scores = intent_cache.get(key) if intent_cache else None
+        if intent_scores is None:
+            source = "model"
+            generation = intent_cache.generation if intent_cache else None
+            intent_scores = predict_cats(key)
+            if intent_cache:
+                intent_cache.put(key, intent_scores, generation)
     intent = max(intent_scores, key=intent_scores.get) if intent_scores else "unknown"
     score = intent_scores.get(intent, 0.0)
-    entities = extract_entities(message)
+    with metrics.stage("entities"):
+        entities = extract_entities(message)
 
-    # Confidence threshold
-    if score < 0.3:  # Adjust this value as needed
+    # Confidence threshold; a close enough corpus phrasing still answers
+    if score < CONFIDENCE_THRESHOLD:
         intent = "unknown"
-
-    return intent, score, entities
+        LOW_CONFIDENCE.inc()
+        if ngram_index:
+            with metrics.stage("fallback"):
+                match, similarity = ngram_index.query(message)
+            if match:
+                return match, similarity, entities, "ngram_match"
+
+    return intent, score, entities, source
+
+# --- Account snapshot cache (balance / account / card / mini statement / profile) ---
+STATEMENT_SIZE = 5  # transactions kept per snapshot (mini statement length)
+
+def load_account_snapshot(uid):
+    return storage.load_account(db_pool, uid, STATEMENT_SIZE)
+
+# Writers (perform_transfer, register) invalidate the users they touch in this
+# worker; transfers made by other workers are picked up from the 'accounts'
+# change counter, read at most once per BANKBOT_ACCOUNT_CACHE_CHECK seconds
+account_snapshots = account_cache.AccountSnapshotCache(
+    load_account_snapshot,
+    max_users=int(os.environ.get("BANKBOT_ACCOUNT_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("BANKBOT_ACCOUNT_CACHE_TTL", "0")),
+    change_count=lambda: storage.account_change_count(db_pool),
+    check_interval=float(os.environ.get("BANKBOT_ACCOUNT_CACHE_CHECK", "1")),
+)
 
 # --- Transaction Helper ---
-def perform_transfer(from_user_id, to_account_number, amount):
-    if amount <= 0:
-        return {"success": False, "reply": "Enter a valid amount."}
-
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Get sender balance
-    c.execute("SELECT balance FROM users WHERE id=?", (from_user_id,))
-    row = c.fetchone()
-    if not row:
-        conn.close()
-        return {"success": False, "reply": "Sender not found."}
-
-    from_balance = row[0]
-    if from_balance < amount:
-        conn.close()
-        return {"success": False, "reply": "Insufficient balance."}
-
-    # Get recipient
-    c.execute("SELECT id FROM users WHERE account_number=?", (to_account_number,))
-    rec = c.fetchone()
-    if not rec:
-        conn.close()
-        return {"success": False, "reply": "Recipient account not found."}
-
-    to_user_id = rec[0]
-
-    # Update balances
-    c.execute("UPDATE users SET balance = balance - ? WHERE id=?", (amount, from_user_id))
-    c.execute("UPDATE users SET balance = balance + ? WHERE id=?", (amount, to_user_id))
-
-    ts = datetime.utcnow().isoformat()
-
-    # Record transactions
-    c.execute("INSERT INTO transactions (user_id,type,amount,description,timestamp) VALUES (?,?,?,?,?)",
-              (from_user_id, "debit", amount, f"Transfer to {to_account_number}", ts))
-    c.execute("INSERT INTO transactions (user_id,type,amount,description,timestamp) VALUES (?,?,?,?,?)",
-              (to_user_id, "credit", amount, f"Transfer from user {from_user_id}", ts))
-
-    conn.commit()
-    conn.close()
-
-    return {"success": True, "reply": f"Transferred ₹{amount:.2f} to account {to_account_number}."}
+# BEGIN IMMEDIATE + conditional debit, retried on SQLITE_BUSY; see transfers.TransferEngine
+transfer_engine = transfers.TransferEngine(
+    db_pool,
+    max_retries=int(os.environ.get("BANKBOT_TRANSFER_RETRIES", "5")),
+    on_commit=lambda user_ids: account_snapshots.invalidate(*user_ids),
+)
+
+def perform_transfer(from_user_id, to_account_number, amount, idempotency_key=None):
+    try:
+        return transfer_engine.transfer(from_user_id, to_account_number, amount, idempotency_key)
+    except transfers.TransferError as e:
+        return {"success": False, "reply": str(e)}
 
 # =================================================================
 # --- APPLICATION ROUTES ---
@@ -231,7 +445,83 @@ def perform_transfer(from_user_id, to_account_number, amount):
 def index():
     return app.send_static_file("index.html")
 
+# --- Probes ---
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    # Liveness: the worker is up and serving requests (auth/profile work without the model)
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    # Readiness: the NLU model is loaded and the database answers
+    try:
+        db_pool.execute("SELECT 1")
+        database = "ok"
+    except Exception as e:
+        database = f"error: {e}"
+    ready = nlp is not None and database == "ok"
+    body = {"ready": ready, "database": database,
+            "model": dict(model_loader.status(), version=model_version, backend=nlu_backend)}
+    return jsonify(body), 200 if ready else 503
+
+@metrics.REGISTRY.collector
+def component_metrics():
+    """Counters the caches, batcher, transfer engine and chat log writer already keep, read at scrape time."""
+    families = []
+
+    def counters(name, help, stats, keys, label="event"):
+        families.append((name, "counter", help, [({label: k}, stats[k]) for k in keys]))
+
+    counters("bankbot_account_cache_events_total", "Account snapshot cache events",
+             account_snapshots.stats_snapshot(), ("hits", "misses", "resets", "evictions", "invalidations"))
+    if intent_cache:
+        counters("bankbot_intent_cache_events_total", "Intent cache events",
+                 intent_cache.stats_snapshot(), ("hits", "misses", "evictions", "expired", "clears"))
+    if nlu_batcher:
+        counters("bankbot_nlu_batcher_total", "NLU micro-batcher batches and messages",
+                 nlu_batcher.stats_snapshot(), ("batches", "messages"), label="kind")
+    hasher_stats = password_hasher.stats_snapshot()
+    counters("bankbot_auth_hash_total", "Password hashes by operation, and calls turned away",
+             hasher_stats, ("generate", "check", "rejected"), label="op")
+    families.append(("bankbot_auth_hash_queue", "gauge", "Password hashes running and waiting",
+                     [({"state": k}, hasher_stats[k]) for k in ("running", "queued")]))
+    if dialogue_store:
+        counters("bankbot_dialogue_state_events_total", "Pending slot questions saved and answered",
+                 dialogue_store.stats_snapshot(), ("saved", "hits", "misses", "expired"))
+    counters("bankbot_transfers_total", "Transfer engine outcomes and retries",
+             transfer_engine.stats_snapshot(), ("committed", "replayed", "rejected", "retries", "busy"),
+             label="outcome")
+    log_stats = chat_log_writer.stats_snapshot()
+    counters("bankbot_chat_log_rows_total", "chat_history rows by fate", log_stats,
+             ("written", "dropped", "spilled"), label="fate")
+    families.append(("bankbot_chat_log_write_seconds_total", "counter",
+                     "Time spent writing chat_history batches", [({}, log_stats["write_seconds"])]))
+    families.append(("bankbot_chat_log_queued", "gauge", "chat_history rows waiting to be written",
+                     [({}, log_stats["queued"])]))
+    families.append(("bankbot_model_ready", "gauge", "1 when the NLU model is loaded",
+                     [({"version": model_version or "base"}, int(nlp is not None))]))
+    return families
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"success": False, "message": "Metrics token required."}), 403
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 # --- Authentication: Register & Login ---
+def observe_password_hash(op, wait, seconds):
+    if metrics.ENABLED:
+        AUTH_HASH_SECONDS.observe(wait, op, "queued")
+        AUTH_HASH_SECONDS.observe(seconds, op, "hash")
+
+# KDFs run in a small niced process pool (BANKBOT_AUTH_*); a login burst queues there
+# instead of starving chat requests. Identity on later requests comes from the signed
+# session cookie (user_id), so profile and chat never look users up to authenticate.
+password_hasher = auth_hashing.create_hasher(on_done=observe_password_hash)
+
+def busy_auth_response():
+    return jsonify({"success": False, "message": auth_hashing.BUSY_REPLY}), 503
+
 @app.route("/api/register", methods=["POST"])
 def register():
     data = request.get_json() or {}
@@ -243,26 +533,18 @@ def register():
     if not (name and email and account_number and password):
         return jsonify({"success": False, "message": "All fields required."}), 400
 
-    hashed = generate_password_hash(password)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute(
-            "INSERT INTO users (name,email,account_number,password,balance,card_last4) VALUES (?,?,?,?,?,?)",
-            (name, email, account_number, hashed, 50000.0, account_number[-4:])
-        )
-        user_id = c.lastrowid
-
-        # Initial transaction
-        c.execute(
-            "INSERT INTO transactions (user_id,type,amount,description,timestamp) VALUES (?,?,?,?,?)",
-            (user_id, "credit", 50000.0, "Initial balance", datetime.utcnow().isoformat())
-        )
-        conn.commit()
-        conn.close()
-    except sqlite3.IntegrityError:
-        return jsonify({"success": False, "message": "Email or account already exists."}), 400
+        hashed = password_hasher.generate(password)
+    except auth_hashing.HasherBusy:
+        return busy_auth_response()
+    try:
+        # User row plus the opening credit, in one transaction
+        user_id = storage.create_user(db_pool, name, email, account_number, hashed,
+                                      timestamp=datetime.utcnow().isoformat())
+    except storage.AlreadyExists as e:
+        return jsonify({"success": False, "message": str(e)}), 400
 
+    account_snapshots.invalidate(user_id)
     return jsonify({"success": True, "message": "Registered successfully."})
 
 @app.route("/api/login", methods=["POST"])
@@ -274,18 +556,14 @@ def login():
     if not (identifier and password):
         return jsonify({"success": False, "message": "Provide email/account and password."}), 400
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    if "@" in identifier:
-        c.execute("SELECT id, password, name, email, account_number, balance, card_last4 FROM users WHERE email=?", (identifier,))
-    else:
-        c.execute("SELECT id, password, name, email, account_number, balance, card_last4 FROM users WHERE account_number=?", (identifier,))
+    # By email if it contains "@", otherwise by account number
+    row = storage.find_login(db_pool, identifier)
 
-    row = c.fetchone()
-    conn.close()
-
-    if row and check_password_hash(row[1], password):
+    try:
+        verified = bool(row) and password_hasher.check(row[1], password)
+    except auth_hashing.HasherBusy:
+        return busy_auth_response()
+    if verified:
         user = {
             "id": row[0],
             "name": row[2],
@@ -296,6 +574,10 @@ def login():
         }
         session["user_id"] = user["id"]
         session["logged_in"] = True
+        # A question asked before this login belongs to whoever was using the session
+        key = session.pop("dialogue_id", None)
+        if dialogue_store and key:
+            dialogue_store.discard(key)
         return jsonify({"success": True, "user": user})
 
     return jsonify({"success": False, "message": "Invalid credentials."}), 401
@@ -305,6 +587,9 @@ def logout():
     session.pop("user_id", None)
     session["logged_in"] = False
     session.pop("admin_logged_in", None) # Clear admin session too
+    key = session.pop("dialogue_id", None)
+    if dialogue_store and key:
+        dialogue_store.discard(key)
     return jsonify({"success": True})
 
 @app.route("/api/profile", methods=["GET"])
@@ -313,13 +598,60 @@ def get_profile():
     if not uid:
         return jsonify({"success": False, "message": "Not logged in."}), 401
 
-    row = query_db("SELECT id, name, account_number, balance, card_last4 FROM users WHERE id=?", (uid,), one=True)
-    if not row:
+    snap = account_snapshots.get(uid)
+    if not snap:
         return jsonify({"success": False, "message": "User not found."}), 404
 
-    user = {"id": row[0], "name": row[1], "account": row[2], "balance": row[3], "card_last4": row[4]}
+    user = {"id": snap["id"], "name": snap["name"], "account": snap["account_number"],
+            "balance": snap["balance"], "card_last4": snap["card_last4"]}
     return jsonify({"success": True, "user": user})
 
+# --- Transfers (Idempotency-Key header makes client retries safe) ---
+@app.route("/api/transfer", methods=["POST"])
+def transfer():
+    uid = session.get("user_id")
+    if not uid:
+        return jsonify({"success": False, "message": "Not logged in."}), 401
+
+    data = request.get_json() or {}
+    try:
+        result = transfer_engine.transfer(uid, data.get("to_account"), data.get("amount"),
+                                          request.headers.get("Idempotency-Key"))
+    except transfers.TransferError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return jsonify(_transfer_response(result)), _transfer_status(result)
+
+@app.route("/api/transfer/batch", methods=["POST"])
+def transfer_batch():
+    uid = session.get("user_id")
+    if not uid:
+        return jsonify({"success": False, "message": "Not logged in."}), 401
+
+    # {"transfers": [{"to_account", "amount", "idempotency_key"?}, ...]}, applied in one transaction
+    items = (request.get_json() or {}).get("transfers")
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({"success": False, "message": "transfers must be a list of objects."}), 400
+    try:
+        results = transfer_engine.transfer_batch(uid, items)
+    except transfers.TransferError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    if any(r.get("busy") for r in results):
+        return jsonify({"success": False, "message": transfers.BUSY_REPLY}), 503
+    return jsonify({"success": True, "results": [_transfer_response(r) for r in results]})
+
+def _transfer_response(result):
+    body = {"success": result["success"], "message": result["reply"]}
+    if result.get("replayed"):
+        body["replayed"] = True
+    return body
+
+def _transfer_status(result):
+    if result.get("busy"):
+        return 503
+    if result.get("conflict"):
+        return 409
+    return 200 if result["success"] else 400
+
 # =================================================================
 # --- ADMIN ROUTES (CONSOLIDATED BLOCK) ---
 # =================================================================
@@ -331,9 +663,13 @@ def admin_login():
     username = data.get("username")
     password = data.get("password")
 
-    row = query_db("SELECT password FROM admin_users WHERE username=?", (username,), one=True)
-    
-    if row and check_password_hash(row[0], password):
+    password_hash = storage.admin_password_hash(db_pool, username)
+
+    try:
+        verified = bool(password_hash) and bool(password) and password_hasher.check(password_hash, password)
+    except auth_hashing.HasherBusy:
+        return busy_auth_response()
+    if verified:
         session["admin_logged_in"] = True
         return jsonify({"success": True})
     
@@ -345,32 +681,49 @@ def get_chat_history():
     if not is_admin():
         return jsonify({"success": False, "message": "Admin access required."}), 403
     
-    rows = query_db(
-        """
-        SELECT ch.timestamp, ch.user_message, ch.detected_intent, ch.confidence
-        FROM chat_history ch
-        ORDER BY ch.timestamp DESC
-        """
-    )
-    
-    history = []
-    for r in rows:
-        timestamp_str = r[0] 
-        
-        # Format timestamp to YYYY-MM-DD (Date only)
-        try:
-            date_only = datetime.fromisoformat(timestamp_str).strftime('%Y-%m-%d')
-        except ValueError:
-            date_only = "N/A" 
-
-        history.append({
-            "query": r[1],
-            "intent": r[2],
-            "confidence": r[3],
-            "date": date_only 
-        })
-        
-    return jsonify({"success": True, "history": history})
+    # Filters: from, to, intent, user_id, min_confidence, max_confidence
+    try:
+        where, params = chat_log.parse_history_filters(request.args)
+        limit = min(int(request.args.get("limit", 200)), chat_log.MAX_PAGE_SIZE)
+        cursor = request.args.get("cursor")
+        if cursor:
+            chat_log.decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid filter: {e}"}), 400
+
+    # Streaming export of everything that matches (never held in memory)
+    export = request.args.get("format", "json")
+    if export in ("ndjson", "csv"):
+        rows = chat_log.iter_history(db_pool, where, params)
+        if export == "ndjson":
+            body, mimetype = chat_log.stream_ndjson(rows), "application/x-ndjson"
+        else:
+            body, mimetype = chat_log.stream_csv(rows), "text/csv"
+        response = Response(stream_with_context(body), mimetype=mimetype)
+        response.headers["Content-Disposition"] = f"attachment; filename=chat_history.{export}"
+        return response
+
+    # One keyset page, newest first
+    rows, next_cursor = chat_log.fetch_history_page(db_pool, where, params, cursor, max(limit, 1))
+    history = [chat_log.history_item(r) for r in rows]
+    return jsonify({"success": True, "history": history, "next_cursor": next_cursor})
+
+# --- Admin: Analytics (served from rollups, never scans chat_history) ---
+@app.route("/api/admin/analytics/<view>", methods=["GET"])
+def get_analytics(view):
+    if not is_admin():
+        return jsonify({"success": False, "message": "Admin access required."}), 403
+
+    views = {
+        "daily": analytics.daily_summary,
+        "intents": analytics.intent_counts,
+        "confidence": analytics.confidence_histogram,
+    }
+    if view not in views:
+        return jsonify({"success": False, "message": "Unknown analytics view."}), 404
+    # Optional day range: from / to as YYYY-MM-DD
+    data = views[view](db_pool, request.args.get("from"), request.args.get("to"))
+    return jsonify({"success": True, view: data})
 
 # --- Admin: 2. Edit/Add New Queries/Intents (Training Data) ---
 @app.route("/api/admin/nlu", methods=["GET"])
@@ -379,7 +732,7 @@ def get_nlu_data():
         return jsonify({"success": False, "message": "Admin access required."}), 403
     
     # Select id, text, bot_reply, intent, timestamp
-    rows = query_db("SELECT id, text, bot_reply, intent, timestamp FROM nlu_data ORDER BY timestamp DESC")
+    rows = storage.list_nlu_data(db_pool)
     
     data = [
         {"id": r[0], "text": r[1], "bot_reply": r[2], "intent": r[3], "timestamp": r[4]} 
@@ -406,12 +759,10 @@ def add_nlu_query():
         
     try:
         # Insert the three fields into the database
-        query_db(
-            "INSERT INTO nlu_data (text, intent, bot_reply, timestamp) VALUES (?, ?, ?, ?)",
-            (text, intent, bot_reply, datetime.utcnow().isoformat())
-        )
+        storage.add_nlu_data(db_pool, text, intent, bot_reply, datetime.utcnow().isoformat())
+        reload_intent_replies()
         return jsonify({"success": True, "message": "Query added to DB. Please re-train."})
-    except sqlite3.IntegrityError:
+    except storage.AlreadyExists:
         # This occurs if the 'text' (query) already exists due to UNIQUE constraint
         return jsonify({"success": False, "message": "Query already exists."}), 400
     except Exception as e:
@@ -423,55 +774,169 @@ def delete_nlu_query(data_id):
     if not is_admin():
         return jsonify({"success": False, "message": "Admin access required."}), 403
         
-    query_db("DELETE FROM nlu_data WHERE id=?", (data_id,))
+    storage.delete_nlu_data(db_pool, data_id)
+    reload_intent_replies()
     return jsonify({"success": True, "message": "Query deleted from DB. Please re-train."})
 
-# --- Admin: Export Training Data as CSV (Combined) ---
+# --- Admin: Bulk import of training data (CSV or NDJSON upload) ---
+@app.route("/api/admin/nlu/import", methods=["POST"])
+def import_nlu_data():
+    if not is_admin():
+        return jsonify({"success": False, "message": "Admin access required."}), 403
+
+    # multipart "file" field, or the raw body (Content-Type text/csv / application/x-ndjson);
+    # format from ?format=, else the file name / content type; .gz or Content-Encoding: gzip is decompressed
+    upload = request.files.get("file")
+    name = upload.filename if upload else ""
+    content_type = (upload.mimetype if upload else request.mimetype) or ""
+    fmt = request.args.get("format") or ("ndjson" if name.endswith((".ndjson", ".ndjson.gz", ".jsonl"))
+                                         or "ndjson" in content_type else "csv")
+    compressed = name.endswith(".gz") or request.headers.get("Content-Encoding") == "gzip"
+    if fmt not in nlu_io.IMPORT_FORMATS:
+        return jsonify({"success": False, "message": "Unknown import format."}), 400
+    lines = nlu_io.open_text(upload.stream if upload else request.stream, compressed)
+    report = nlu_io.import_records(db_pool, nlu_io.parse(lines, fmt), datetime.utcnow().isoformat())
+    if report["inserted"]:
+        reload_intent_replies()
+    if "aborted" in report:
+        added = f" ({report['inserted']} queries before that point were added.)" if report["inserted"] else ""
+        return jsonify({"success": False, "report": report,
+                        "message": f"Could not read upload: {report['aborted']}{added}"}), 400
+    return jsonify({"success": True, "report": report,
+                    "message": f"{report['inserted']} queries added to DB. Please re-train."})
+
+# --- Admin: Export Training Data (Combined), streamed ---
 @app.route("/api/admin/nlu/export", methods=["GET"])
 def export_nlu_data():
     if not is_admin():
         return make_response(jsonify({"success": False, "message": "Admin access required."}), 403)
-    
-    # Fetch all combined data from the train module
-    combined_data = train_module.load_combined_nlu_data()
-    
-    # In-memory CSV generation
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header row (matching the original CSV structure)
-    writer.writerow(['text', 'intent']) 
-    
-    # Write data rows
-    for text, intent in combined_data:
-        writer.writerow([text, intent])
-        
-    # Create the response to force a download
-    response = make_response(output.getvalue())
-    response.headers["Content-Disposition"] = "attachment; filename=banking_queries_combined_export.csv"
-    response.headers["Content-type"] = "text/csv"
+
+    # CSV + DB examples (memoized) with each admin-added example's bot_reply
+    export = request.args.get("format", "csv")
+    if export not in nlu_io.IMPORT_FORMATS:
+        return jsonify({"success": False, "message": "Unknown export format."}), 400
+    replies = {text.lower(): reply for text, reply in storage.nlu_replies(db_pool).items()}
+    rows = ((text, intent, replies.get(text, "")) for text, intent in corpus.load_combined_nlu_data())
+    body = nlu_io.stream_ndjson(rows) if export == "ndjson" else nlu_io.stream_csv(rows)
+    filename = f"banking_queries_combined_export.{export}"
+    mimetype = "application/x-ndjson" if export == "ndjson" else "text/csv"
+    if request.args.get("gzip") in ("1", "true"):
+        body, mimetype, filename = nlu_io.gzip_stream(body), "application/gzip", filename + ".gz"
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
     return response
 
+# --- Admin: NLU serving stats ---
+@app.route("/api/admin/nlu/stats", methods=["GET"])
+def get_nlu_stats():
+    if not is_admin():
+        return jsonify({"success": False, "message": "Admin access required."}), 403
+
+    stats = {
+        "backend": nlu_backend,
+        "batcher": nlu_batcher.stats_snapshot() if nlu_batcher else None,
+        "cache": intent_cache.stats_snapshot() if intent_cache else None,
+        "match_index": {"exact": len(match_index.exact), "normalized": len(match_index.normalized)} if match_index else None,
+        "ngram_index": ngram_index.stats() if ngram_index else None,
+        "corpus": dict(corpus.corpus_cache.stats),
+        "dialogue_state": dialogue_store.stats_snapshot() if dialogue_store else None,
+    }
+    return jsonify({"success": True, "stats": stats})
+
+# --- Admin: Account snapshot cache stats ---
+@app.route("/api/admin/cache/stats", methods=["GET"])
+def get_cache_stats():
+    if not is_admin():
+        return jsonify({"success": False, "message": "Admin access required."}), 403
+
+    return jsonify({"success": True, "stats": {"accounts": account_snapshots.stats_snapshot()}})
+
 # --- Admin: 3. Retrain BankBot ---
 @app.route("/api/admin/retrain", methods=["POST"])
 def retrain_model():
     if not is_admin():
         return jsonify({"success": False, "message": "Admin access required."}), 403
-    
-    # app.py (UPDATED retrain_model route)
-# ...
-    try:
-        # Run the training script logic, which reads CSV + DB
-        train_module.train() 
-        
-        # 🚨 CRITICAL: Use the dedicated load function to reload the new model
-        load_nlu_model(MODEL_PATH)
-        
-        return jsonify({"success": True, "message": "Bot successfully re-trained and deployed."})
-# ...
-    except Exception as e:
-        print(f"Retraining error: {e}")
-        return jsonify({"success": False, "message": f"Retraining failed: {str(e)}."}), 500
+
+    # "incremental" fine-tunes the live model on new/changed rows; "full" trains from scratch
+    mode = (request.get_json(silent=True) or {}).get("mode", "full")
+    if mode not in ("full", "incremental"):
+        return jsonify({"success": False, "message": "mode must be 'full' or 'incremental'."}), 400
+
+    # Training runs in the background; every worker swaps to the new model once it is published
+    extra_args = ["--incremental"] if mode == "incremental" else []
+    started, status = retrain_job.start(extra_args, mode=mode)
+    if not started:
+        return jsonify({"success": False, "message": "Retraining is already running.", "job": status}), 409
+    return jsonify({"success": True, "message": "Retraining started.", "job": status}), 202
+
+@app.route("/api/admin/retrain/status", methods=["GET"])
+def retrain_status():
+    if not is_admin():
+        return jsonify({"success": False, "message": "Admin access required."}), 403
+
+    return jsonify({"success": True, "job": model_store.read_status(), "serving_version": model_version})
+
+# =================================================================
+# --- INTENT HANDLERS (intents that read account data) ---
+# =================================================================
+# Every other intent is answered from intent_registry's reply table.
+@intent_registry.handler("check_balance")
+def handle_check_balance(turn):
+    if not turn.logged_in:
+        return "⚠️ Please login to check your balance."
+    snap = account_snapshots.get(turn.uid)
+    balance = snap["balance"] if snap else 0
+    return f"✅ Your current balance is ₹{balance:.2f}."
+
+@intent_registry.handler("transfer_money")
+def handle_transfer_money(turn):
+    if not turn.logged_in:
+        return "⚠️ Please login first to transfer money."
+    account = turn.entities.get("account_number")
+    amount = turn.entities.get("amount")
+
+    slots = {k: v for k, v in (("amount", amount), ("account_number", account)) if v}
+    if not amount and not account:
+        return ask_for_slots(turn, slots, ("amount", "account_number"),
+                             "How much do you want to transfer, and to which account?")
+    elif not amount:
+        return ask_for_slots(turn, slots, ("amount",), "How much do you want to transfer?")
+    elif not account:
+        return ask_for_slots(turn, slots, ("account_number",), "Please provide the account number.")
+    # Same key on a retried chat request -> the transfer is posted once
+    result = perform_transfer(turn.uid, account, amount, request.headers.get("Idempotency-Key"))
+    return result["reply"]
+
+@intent_registry.handler("account_info")
+def handle_account_info(turn):
+    if not turn.logged_in:
+        return "⚠️ Please login to view account information."
+    snap = account_snapshots.get(turn.uid)
+    account_num = snap["account_number"] if snap else 'N/A'
+    return f"Your account number is {account_num}."
+
+@intent_registry.handler("mini_statement")
+def handle_mini_statement(turn):
+    if not turn.logged_in:
+        return "⚠️ Please login to get a mini statement."
+    snap = account_snapshots.get(turn.uid)
+    rows = snap["transactions"] if snap else ()
+    if not rows:
+        return "You have no transactions yet."
+    statement = "📃 Mini statement:<br>"
+    for r in rows:
+        type_str = "Debit" if r[0] == "debit" else "Credit"
+        statement += f"{type_str} of ₹{r[1]:.2f} for {r[2]} on {datetime.fromisoformat(r[3]).strftime('%Y-%m-%d')}<br>"
+    return statement
+
+@intent_registry.handler("card_details")
+def handle_card_details(turn):
+    if not turn.logged_in:
+        return "⚠️ Please login to check card details."
+    snap = account_snapshots.get(turn.uid)
+    card_last4 = snap["card_last4"] if snap else 'N/A'
+    return f"💳 You have a card ending with {card_last4}."
 
 # =================================================================
 # --- CHAT ROUTE (SINGLE, COMPLETE DEFINITION) ---
@@ -486,114 +951,31 @@ def chat():
 
     uid = session.get("user_id")
 
-    # --- Recognize intent ---
-    intent, score, entities = recognize_intent(message)
+    # --- Recognize intent (a reply to the bot's last question skips classification) ---
+    # A question asked for someone else (login / logout since) is dropped, not answered
+    key = session.pop("dialogue_id", None)
+    pending = dialogue_store.take(key) if dialogue_store and key else None
+    resolved = resolve_follow_up(message, pending) if pending and pending.uid == uid else None
+    intent, score, entities, nlu_source = resolved or recognize_intent(message)
+    g.intent = intent
+    NLU_RESULTS.inc(nlu_source)
+    if intent == "unknown":
+        UNKNOWN_INTENTS.inc(nlu_source)
 
     # --- Check login state ---
     logged_in = session.get("logged_in", False)
-    response = ""
 
-    # --- Dialogue Management ---
-    if intent == "greeting" or intent == "greeting_hi":
-        response = "Hello there! How can I help you today?"
+    # --- Dialogue Management (O(1) registry lookup) ---
+    turn = intents.Turn(message, intent, score, entities, uid, logged_in)
+    with metrics.stage("dispatch"):
+        response = intent_registry.dispatch(turn)
 
-    elif intent == "goodbye" or intent == "greeting_bye":
-        response = "It was nice assisting you. Have a great day!"
-
-    elif intent == "check_balance":
-        if not logged_in:
-            response = "⚠️ Please login to check your balance."
-        else:
-            row = query_db("SELECT balance FROM users WHERE id=?", (uid,), one=True)
-            balance = row[0] if row else 0
-            response = f"✅ Your current balance is ₹{balance:.2f}."
-
-    elif intent == "transfer_money":
-        if not logged_in:
-            response = "⚠️ Please login first to transfer money."
-        else:
-            account = entities.get("account_number")
-            amount = entities.get("amount")
-            
-            if not amount and not account:
-                 response = "How much do you want to transfer, and to which account?"
-            elif not amount:
-                response = "How much do you want to transfer?"
-            elif not account:
-                response = "Please provide the account number."
-            else:
-                result = perform_transfer(uid, account, amount) 
-                response = result["reply"]
-
-    elif intent == "account_info":
-        if not logged_in:
-            response = "⚠️ Please login to view account information."
-        else:
-            row = query_db("SELECT account_number FROM users WHERE id=?", (uid,), one=True)
-            account_num = row[0] if row else 'N/A'
-            response = f"Your account number is {account_num}."
-
-    elif intent == "mini_statement":
-        if not logged_in:
-            response = "⚠️ Please login to get a mini statement."
-        else:
-            rows = query_db(
-                "SELECT type, amount, description, timestamp FROM transactions WHERE user_id=? ORDER BY id DESC LIMIT 5",
-                (uid,)
-            )
-            if not rows:
-                response = "You have no transactions yet."
-            else:
-                statement = "📃 Mini statement:<br>"
-                for r in rows:
-                    type_str = "Debit" if r[0] == "debit" else "Credit"
-                    # NOTE: Ensure datetime is imported from datetime
-                    statement += f"{type_str} of ₹{r[1]:.2f} for {r[2]} on {datetime.fromisoformat(r[3]).strftime('%Y-%m-%d')}<br>"
-                response = statement
-
-    elif intent == "card_details":
-        if not logged_in:
-            response = "⚠️ Please login to check card details."
-        else:
-            row = query_db("SELECT card_last4 FROM users WHERE id=?", (uid,), one=True)
-            card_last4 = row[0] if row else 'N/A'
-            response = f"💳 You have a card ending with {card_last4}."
-
-    elif intent == "lost_card":
-        response = "I'm sorry to hear that. To block your card, please call our 24/7 helpline at 1800-123-4567 or visit our nearest branch."
-
-    elif intent == "apply_loan":
-        response = "We offer a variety of loans including personal, home, and student loans. Please visit our website or a branch to discuss your options with a loan officer."
-
-    elif intent == "get_interest_rate":
-        response = "Interest rates vary based on the loan type and current market conditions. Please contact a loan advisor for a personalized quote."
-
-    elif intent == "get_branch_details":
-        response = "You can find your nearest branch by using our branch locator tool on the website. Please provide your city or zip code for the best results."
-
-    elif intent == "create_account":
-        response = "You can open a new account online in minutes! Click the 'Register' button on the homepage or visit a branch with your ID and address proof."
-
-    elif intent == "close_account":
-        response = "To close an account, you must visit a branch and submit a formal request. Please bring your ID and account documents."
-
-    elif intent == "unknown":
-        response = "Sorry, I didn't understand that. Could you please rephrase?"
-    else:
-        response = "Sorry, I didn’t understand that. Could you please rephrase?"
-
-    # --- Log the interaction to the database (NEW LOGIC) ---
+    # --- Log the interaction (queued; written in batches by chat_log_writer) ---
     try:
         # Use session's user ID (uid) or None if not logged in
         user_id_to_log = uid if uid else None 
-        
-        query_db(
-            """
-            INSERT INTO chat_history (user_id, timestamp, user_message, bot_response, detected_intent, confidence) 
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (user_id_to_log, datetime.utcnow().isoformat(), message, response, intent, score)
-        )
+        with metrics.stage("log_enqueue"):
+            chat_log_writer.log(user_id_to_log, datetime.utcnow().isoformat(), message, response, intent, score)
     except Exception as e:
         print(f"Error logging chat history: {e}")
         # Continue execution even if logging fails
@@ -602,7 +984,8 @@ def chat():
         "intent": intent,
         "confidence": score,
         "entities": entities,
-        "response": response
+        "response": response,
+        "nlu_source": nlu_source
     })
 
 
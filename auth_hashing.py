@@ -0,0 +1,155 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+BUSY_REPLY = "Too many sign-ins right now. Please try again in a moment."
+
+
+class HasherBusy(RuntimeError):
+    """Raised when more hashes are waiting than the hasher admits."""
+
+
+def _lower_priority(niceness):
+    try:
+        os.nice(niceness)
+    except OSError:
+        pass
+
+
+def _timed(fn, *args):
+    # Runs in the child; the parent subtracts this from the total to get the queue wait
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+class PasswordHasher:
+    """
+    werkzeug's password KDFs (scrypt / pbkdf2), run off the request thread.
+
+    mode="process": a pool of `workers` child processes, started at a lower
+    CPU priority (`niceness`), so a burst of logins queues behind the pool
+    instead of taking the CPU from chat requests in the same worker.
+    mode="inline": on the calling thread, at most `workers` at a time.
+
+    At most `workers + max_queue` calls are admitted at once; a call that
+    cannot get in within `timeout` seconds raises HasherBusy. The pool is
+    created on first use in each process, so a gunicorn worker never uses
+    one forked from the master. Its children come from a forkserver that
+    preloads only this module: the worker already runs threads (chat log
+    writer, model loader), and forking it directly could leave a child
+    blocked on a lock one of them held. As with any non-fork start method,
+    each child imports the program's main module as __mp_main__, so a
+    script that drives the app must keep its work under
+    `if __name__ == "__main__"` (gunicorn and the benchmarks do).
+
+    on_done(op, wait_seconds, hash_seconds) runs after every hash, e.g. to
+    feed latency histograms.
+    """
+
+    def __init__(self, mode="process", workers=1, max_queue=32, timeout=10.0, niceness=10, on_done=None):
+        if mode not in ("process", "inline"):
+            raise ValueError(f"Unknown password hasher mode {mode!r} (process or inline)")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.niceness = niceness
+        self.on_done = on_done
+        self._admit = threading.BoundedSemaphore(self.workers + max_queue)
+        self._run = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._in_flight = 0
+        self.stats = {"generate": 0, "check": 0, "rejected": 0, "pool_restarts": 0,
+                      "wait_seconds": 0.0, "hash_seconds": 0.0}
+
+    def generate(self, password):
+        return self._call("generate", generate_password_hash, password)
+
+    def check(self, pwhash, password):
+        return self._call("check", check_password_hash, pwhash, password)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context,
+                    initializer=_lower_priority, initargs=(self.niceness,))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _restart_pool(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                self.stats["pool_restarts"] += 1
+        broken.shutdown(wait=False)
+
+    def _call(self, op, fn, *args):
+        if not self._admit.acquire(timeout=self.timeout):
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise HasherBusy(BUSY_REPLY)
+        started = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            if self.mode == "inline":
+                with self._run:
+                    result, seconds = _timed(fn, *args)
+            else:
+                pool = self._pool()
+                try:
+                    result, seconds = pool.submit(_timed, fn, *args).result()
+                except BrokenProcessPool:
+                    # A child died (OOM killer, signal); start a fresh pool and retry once
+                    self._restart_pool(pool)
+                    result, seconds = self._pool().submit(_timed, fn, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._admit.release()
+        wait = max(time.perf_counter() - started - seconds, 0.0)
+        with self._lock:
+            self.stats[op] += 1
+            self.stats["wait_seconds"] += wait
+            self.stats["hash_seconds"] += seconds
+        if self.on_done:
+            self.on_done(op, wait, seconds)
+        return result
+
+    def stats_snapshot(self):
+        with self._lock:
+            running = min(self._in_flight, self.workers)
+            return dict(self.stats, mode=self.mode, workers=self.workers, max_queue=self.max_queue,
+                        running=running, queued=self._in_flight - running)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def create_hasher(on_done=None):
+    """
+    Hasher configured from the environment: BANKBOT_AUTH_HASHER (process or
+    inline), BANKBOT_AUTH_WORKERS (hashes running at once, default 1),
+    BANKBOT_AUTH_QUEUE (hashes allowed to wait, default 32) and
+    BANKBOT_AUTH_TIMEOUT (seconds to wait for admission, default 10).
+    """
+    return PasswordHasher(
+        mode=os.environ.get("BANKBOT_AUTH_HASHER", "process"),
+        workers=int(os.environ.get("BANKBOT_AUTH_WORKERS", "1")),
+        max_queue=int(os.environ.get("BANKBOT_AUTH_QUEUE", "32")),
+        timeout=float(os.environ.get("BANKBOT_AUTH_TIMEOUT", "10")),
+        on_done=on_done,
+    )
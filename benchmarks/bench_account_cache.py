@@ -0,0 +1,132 @@
+"""
+Account snapshot cache under concurrent transfers: consistency check and
+hit rate.
+
+    python benchmarks/bench_account_cache.py [--senders 8] [--transfers 200]
+
+Each sender thread owns one account and moves money to a few shared sink
+accounts while reader threads poll the sinks' cached snapshots. The TTL is
+disabled so only invalidation and the 'accounts' change counter keep the
+cache correct. A second cache that no transfer ever invalidates stands in
+for another gunicorn worker. Checks:
+  * read-your-writes: after every transfer, the sender's cached balance is
+    exactly what it should be;
+  * after the run, every cached snapshot matches the database, in both
+    caches (the second one once its check interval has passed);
+  * total money is conserved.
+Runs against a throwaway copy of data.db.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--senders", type=int, default=8)
+    parser.add_argument("--sinks", type=int, default=3)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--transfers", type=int, default=200, help="per sender")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-bench-")
+    os.environ["BANKBOT_DB_PATH"] = os.path.join(tmp, "data.db")
+    shutil.copy(os.path.join(ROOT, "data.db"), os.environ["BANKBOT_DB_PATH"])
+    os.environ["BANKBOT_ACCOUNT_CACHE_TTL"] = "0"
+    sys.path.insert(0, ROOT)
+    import account_cache
+    import app
+    import storage
+
+    try:
+        client = app.app.test_client()
+        accounts = {}
+        for i in range(args.senders + args.sinks):
+            number = f"77{i:010d}"
+            client.post("/api/register", json={"name": f"U{i}", "email": f"u{i}@bench.local",
+                                               "account_number": number, "password": "x"})
+            accounts[number] = app.query_db("SELECT id FROM users WHERE account_number=?", (number,), one=True)[0]
+        numbers = list(accounts)
+        senders, sinks = numbers[:args.senders], numbers[args.senders:]
+        ids = list(accounts.values())
+        total_before = app.query_db(f"SELECT SUM(balance) FROM users WHERE id IN ({','.join('?' * len(ids))})", ids)[0][0]
+
+        # Another worker: same database, never told about these transfers
+        other = account_cache.AccountSnapshotCache(
+            app.load_account_snapshot, change_count=lambda: storage.account_change_count(app.db_pool),
+            check_interval=0.05)
+        for uid in ids:
+            other.get(uid)
+
+        errors = []
+        done = threading.Event()
+
+        def sender(number):
+            uid = accounts[number]
+            expected = app.account_snapshots.get(uid)["balance"]
+            rng = random.Random(uid)
+            for _ in range(args.transfers):
+                amount = float(rng.randint(1, 50))
+                result = app.perform_transfer(uid, rng.choice(sinks), amount)
+                if result["success"]:
+                    expected -= amount
+                cached = app.account_snapshots.get(uid)["balance"]
+                if abs(cached - expected) > 1e-6:
+                    errors.append(f"sender {uid}: cached {cached} != expected {expected}")
+
+        def reader():
+            rng = random.Random()
+            while not done.is_set():
+                app.account_snapshots.get(accounts[rng.choice(sinks)])
+                other.get(accounts[rng.choice(numbers)])
+
+        readers = [threading.Thread(target=reader) for _ in range(args.readers)]
+        writers = [threading.Thread(target=sender, args=(n,)) for n in senders]
+        start = time.perf_counter()
+        for t in readers + writers:
+            t.start()
+        for t in writers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        for t in readers:
+            t.join()
+        time.sleep(other.check_interval)
+
+        for number, uid in accounts.items():
+            cached = app.account_snapshots.get(uid)["balance"]
+            actual = app.query_db("SELECT balance FROM users WHERE id=?", (uid,), one=True)[0]
+            if abs(cached - actual) > 1e-6:
+                errors.append(f"user {uid}: cached {cached} != database {actual}")
+            seen = other.get(uid)["balance"]
+            if abs(seen - actual) > 1e-6:
+                errors.append(f"user {uid}: other worker's cache {seen} != database {actual}")
+        total_after = app.query_db(f"SELECT SUM(balance) FROM users WHERE id IN ({','.join('?' * len(ids))})", ids)[0][0]
+        if abs(total_after - total_before) > 1e-6:
+            errors.append(f"money not conserved: {total_before} -> {total_after}")
+
+        stats = app.account_snapshots.stats_snapshot()
+        print(f"{args.senders * args.transfers} transfers in {elapsed:.2f}s; cache hit rate "
+              f"{stats['hit_rate']:.1%} ({stats['hits']} hits / {stats['misses']} misses, "
+              f"{stats['invalidations']} invalidations)")
+        stats = other.stats_snapshot()
+        print(f"other worker's cache: hit rate {stats['hit_rate']:.1%}, {stats['resets']} resets "
+              f"on the change counter, {stats['invalidations']} invalidations")
+        if errors:
+            print(f"FAILED: {len(errors)} inconsistencies, e.g. {errors[:3]}")
+            sys.exit(1)
+        print("OK: cached snapshots consistent with the database, balances conserved.")
+    finally:
+        app.chat_log_writer.flush()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Chat throughput with the pooled WAL connection layer vs. a fresh
+sqlite3.connect per query (the pre-pool behaviour).
+
+    python benchmarks/bench_db.py [--requests 2000] [--threads 8]
+
+Each mode runs in its own subprocess against a throwaway copy of data.db.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MESSAGES = ["check my balance", "what is my account number", "show mini statement", "hi"]
+
+
+def run_worker(n_requests, n_threads):
+    sys.path.insert(0, ROOT)
+    import app
+
+    client = app.app.test_client()
+    client.post("/api/register", json={"name": "Bench", "email": "bench@example.com",
+                                       "account_number": "999900001111", "password": "bench"})
+    per_thread = n_requests // n_threads
+
+    def worker():
+        c = app.app.test_client()
+        c.post("/api/login", json={"email": "bench@example.com", "password": "bench"})
+        for i in range(per_thread):
+            c.post("/api/chat", json={"message": MESSAGES[i % len(MESSAGES)]})
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"requests": per_thread * n_threads, "seconds": elapsed}))
+
+
+def run_mode(pooled, args):
+    tmp = tempfile.mkdtemp(prefix="bankbot-bench-")
+    try:
+        db_path = os.path.join(tmp, "data.db")
+        shutil.copy(os.path.join(ROOT, "data.db"), db_path)
+        env = dict(os.environ, BANKBOT_DB_PATH=db_path, BANKBOT_DB_POOL="1" if pooled else "0")
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", "--requests", str(args.requests),
+             "--threads", str(args.threads)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        return json.loads(out.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--worker", action="store_true")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.requests, args.threads)
+        return
+
+    for label, pooled in (("per-call connect", False), ("pooled WAL", True)):
+        r = run_mode(pooled, args)
+        print(f"{label:18s} {r['requests'] / r['seconds']:8.1f} chat req/s "
+              f"({r['requests']} requests, {args.threads} threads)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Slot follow-ups with and without the dialogue-state store.
+
+    python benchmarks/bench_dialogue_state.py [--conversations 300] [--seed 0]
+
+Plays scripted two- and three-turn transfers through the Flask test client:
+an opening that leaves out the amount and/or the account ("i want to
+transfer money", "transfer 15", "send money to account ..."), then short
+answers to the bot's question ("500", "₹40", "to 444455556666"). Runs them
+with no store, the in-memory store and the database-backed store, and
+reports how many transfers complete, how many follow-up turns still went to
+the model, and the latency of a follow-up turn.
+Needs a trained model at models/nlu_model (run train.py first); runs
+against a throwaway copy of data.db.
+Checks: with either store every transfer completes and no follow-up is
+classified; a question saved by one DatabaseDialogueStore is answered
+through another one on its own connection pool (another worker), and when
+both workers take it at once only one gets it; a question asked before a
+login is not answered for the user who logged in; a turn with no question
+pending runs no query against dialogue_state.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAYEE = "444455556666"
+
+
+def conversation(rng):
+    """(opening, follow-ups) of one transfer of a small amount."""
+    amount = rng.randint(1, 20)
+    amount_reply = rng.choice((f"{amount}", f"₹{amount}", f"{amount} rupees", f"make it {amount}"))
+    account_reply = rng.choice((PAYEE, f"account {PAYEE}", f"to {PAYEE}", f"a/c {PAYEE}"))
+    kind = rng.choice(("both", "amount", "account"))
+    if kind == "both":
+        return rng.choice(("i want to transfer money", "transfer money")), [amount_reply, account_reply]
+    if kind == "amount":
+        return f"send money to account {PAYEE}", [amount_reply]
+    return f"transfer {amount}", [account_reply]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def play(client, conversations):
+    """(transfers completed, follow-ups classified, follow-up latencies in ms)"""
+    completed = classified = 0
+    timings = []
+    for opening, replies in conversations:
+        client.post("/api/chat", json={"message": opening})
+        for reply in replies:
+            started = time.perf_counter()
+            r = client.post("/api/chat", json={"message": reply}).get_json()
+            timings.append((time.perf_counter() - started) * 1000.0)
+            classified += r["nlu_source"] in ("model", "cache", "ngram_match")
+        completed += r["response"].startswith("Transferred")
+    return completed, classified, timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-dialogue-")
+    shutil.copy(os.path.join(ROOT, "data.db"), os.path.join(tmp, "data.db"))
+    os.environ["BANKBOT_DB_PATH"] = os.path.join(tmp, "data.db")
+    os.environ["BANKBOT_MODEL_LOAD"] = "eager"
+    os.environ["BANKBOT_NLU_CACHE_SIZE"] = "0"
+    errors = []
+    try:
+        import app
+        import db
+        import dialogue_state
+
+        if app.nlp is None:
+            print("No trained model at models/nlu_model; run train.py first.")
+            sys.exit(1)
+        client = app.app.test_client()
+        for name, email, account in (("Payer", "payer@bench", "999988887777"), ("Payee", "payee@bench", PAYEE)):
+            client.post("/api/register", json={"name": name, "email": email, "account_number": account,
+                                               "password": "pw"})
+        client.post("/api/login", json={"email": "payer@bench", "password": "pw"})
+
+        rng = random.Random(args.seed)
+        conversations = [conversation(rng) for _ in range(args.conversations)]
+        follow_ups = sum(len(replies) for _, replies in conversations)
+        stores = (("none", None), ("memory", dialogue_state.DialogueStateStore()),
+                  ("database", dialogue_state.DatabaseDialogueStore(app.db_pool)))
+        print(f"{args.conversations} transfers, {follow_ups} follow-up turns")
+        for label, store in stores:
+            app.dialogue_store = store
+            completed, classified, timings = play(client, conversations)
+            print(f"{label:<9} completed {completed:4d}/{len(conversations)}  follow-ups classified "
+                  f"{classified:4d}/{follow_ups}  follow-up p50 {percentile(timings, 50):.2f} ms, "
+                  f"p95 {percentile(timings, 95):.2f} ms")
+            if store and completed != len(conversations):
+                errors.append(f"{label}: only {completed}/{len(conversations)} transfers completed")
+            if store and classified:
+                errors.append(f"{label}: {classified} follow-ups were classified")
+
+        # Another worker: its own pool on the same file answers the question
+        app.dialogue_store = stores[2][1]
+        client.post("/api/chat", json={"message": "transfer money"})
+        with client.session_transaction() as s:
+            key = s["dialogue_id"]
+        other = dialogue_state.DatabaseDialogueStore(db.ConnectionPool(os.environ["BANKBOT_DB_PATH"]))
+        pending = other.take(key)
+        print(f"other worker sees: {pending}")
+        if not pending or pending.intent != "transfer_money":
+            errors.append("a second DatabaseDialogueStore did not see the pending question")
+
+        # Both workers take the same question at once: exactly one may answer it
+        stolen = 0
+        for _ in range(50):
+            client.post("/api/chat", json={"message": "transfer money"})
+            with client.session_transaction() as s:
+                key = s["dialogue_id"]
+            taken = []
+            racers = [threading.Thread(target=lambda store: taken.append(store.take(key)), args=(store,))
+                      for store in (app.dialogue_store, other)]
+            for t in racers:
+                t.start()
+            for t in racers:
+                t.join()
+            stolen += sum(p is not None for p in taken) != 1
+        print(f"concurrent takes: {stolen}/50 questions not taken exactly once")
+        if stolen:
+            errors.append(f"{stolen}/50 pending questions were taken twice (or not at all)")
+
+        # Once the question is answered, ordinary turns leave the store alone
+        client.post("/api/chat", json={"message": "transfer money"})
+        client.post("/api/chat", json={"message": "5"})
+        client.post("/api/chat", json={"message": PAYEE})
+        statements = []
+        app.db_pool.connection().set_trace_callback(statements.append)
+        for _ in range(10):
+            client.post("/api/chat", json={"message": "check my balance"})
+        app.db_pool.connection().set_trace_callback(None)
+        touched = [s for s in statements if "dialogue_state" in s]
+        print(f"10 turns with nothing pending: {len(touched)} dialogue_state queries")
+        if touched:
+            errors.append(f"a turn with nothing pending queried dialogue_state: {touched[0]}")
+
+        # Someone else logs in on the same browser: the question is not theirs
+        for store in stores[1:]:
+            app.dialogue_store = store[1]
+            client.post("/api/login", json={"email": "payer@bench", "password": "pw"})
+            client.post("/api/chat", json={"message": "i want to transfer money"})
+            client.post("/api/login", json={"email": "payee@bench", "password": "pw"})
+            r = client.post("/api/chat", json={"message": "500"}).get_json()
+            if r["nlu_source"] == "dialogue_state":
+                errors.append(f"{store[0]}: the payer's pending transfer was answered after the payee logged in")
+        app.chat_log_writer.flush()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if errors:
+        print("FAILED:")
+        for e in errors:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: follow-ups fill the pending slots without classification.")
+
+
+if __name__ == "__main__":
+    main()
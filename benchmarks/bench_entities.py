@@ -0,0 +1,91 @@
+"""
+Entity extraction: agreement with the labeled columns of banking_queries.csv
+and per-message extraction time, for entities.extract_entities and the
+previous two-regex extractor.
+
+    python benchmarks/bench_entities.py [--repeat 20]
+
+The CSV labels are hand-entered and partly noisy (e.g. intent names in
+card_type), so agreement is reported per column rather than asserted.
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import entities  # noqa: E402
+
+COLUMNS = ("amount", "account_number", "card_type", "account_type", "loan_type", "date", "day")
+
+
+def legacy_extract_entities(text):
+    """The extractor app.py used before entities.py (kept for comparison)."""
+    ent = {}
+    m = re.search(r'(?:₹|\bINR\b|\bRs\b|\$)?\s?([0-9][0-9,.]*?)', text.replace(',', ''))
+    if m:
+        try:
+            ent['amount'] = float(m.group(1).replace('₹', '').replace('$', '').strip())
+        except ValueError:
+            pass
+    m2 = re.search(r'\b(\d{4,18})\b', text)
+    if m2:
+        ent['account_number'] = m2.group(1)
+    return ent
+
+
+def normalize(column, value):
+    value = str(value).strip().lower()
+    if column == "amount":
+        digits = re.sub(r"[^\d.]", "", value)
+        return float(digits) if digits else value
+    if column == "account_number":
+        return re.sub(r"\D", "", value)
+    if column == "date":
+        return value.replace("/", "-")
+    return value
+
+
+def agreement(extract, rows):
+    scores = {}
+    for column in COLUMNS:
+        labeled = [r for r in rows if r.get(column)]
+        hits = 0
+        for r in labeled:
+            got = extract(r["text"]).get(column)
+            if got is not None and normalize(column, got) == normalize(column, r[column]):
+                hits += 1
+        scores[column] = (hits, len(labeled))
+    return scores
+
+
+def timing(extract, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            extract(text)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, "banking_queries.csv"), encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    texts = [r["text"] for r in rows]
+
+    for label, extract in (("legacy", legacy_extract_entities), ("entities", entities.extract_entities)):
+        scores = agreement(extract, rows)
+        print(f"{label:9s} {timing(extract, texts, args.repeat):6.2f} us/message")
+        for column, (hits, total) in scores.items():
+            print(f"    {column:15s} {hits:4d}/{total:<4d} labeled rows agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Chat latency while other clients hammer /api/login.
+
+    python benchmarks/bench_login_storm.py [--storm 8] [--chats 1000]
+
+Registers --storm users, then for each setting runs --storm threads that log
+in over and over while one client sends --chats chat messages one after
+another, all through the Flask test client in one process (one gunicorn
+worker's worth of threads). Settings:
+  * idle:    no logins, the baseline;
+  * inline:  password hashes on the request threads, all at once (the old behaviour);
+  * process: the configured auth_hashing pool (BANKBOT_AUTH_*).
+Reports chat p50/p95, login throughput and login p50.
+Needs a trained model at models/nlu_model (run train.py first); runs
+against a throwaway copy of data.db.
+Checks: chat p95 under the storm is lower with the pool than inline, no
+login is turned away, and repeated profile / chat calls of a logged-in
+client run no query against users.
+"""
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def messages():
+    with open(os.path.join(ROOT, "banking_queries.csv"), encoding="utf-8") as f:
+        return [row["text"] for row in csv.DictReader(f) if row.get("text")]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def storm(app, n, stop, timings, failures):
+    client = app.app.test_client()
+    while not stop.is_set():
+        started = time.perf_counter()
+        r = client.post("/api/login", json={"email": f"storm{n}@bench", "password": f"pw{n}"})
+        timings.append((time.perf_counter() - started) * 1000.0)
+        if r.status_code != 200:
+            failures.append(r.status_code)
+
+
+def run(app, chat_client, texts, storm_threads):
+    """(chat latencies ms, login latencies ms, login failures, seconds)"""
+    stop = threading.Event()
+    logins, failures = [], []
+    threads = [threading.Thread(target=storm, args=(app, n, stop, logins, failures), daemon=True)
+               for n in range(storm_threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    if threads:
+        time.sleep(0.5)  # let the storm build up
+    chats = []
+    for text in texts:
+        t0 = time.perf_counter()
+        chat_client.post("/api/chat", json={"message": text})
+        chats.append((time.perf_counter() - t0) * 1000.0)
+    stop.set()
+    for t in threads:
+        t.join()
+    return chats, logins, failures, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--storm", type=int, default=8)
+    parser.add_argument("--chats", type=int, default=1000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-login-storm-")
+    shutil.copy(os.path.join(ROOT, "data.db"), os.path.join(tmp, "data.db"))
+    os.environ["BANKBOT_DB_PATH"] = os.path.join(tmp, "data.db")
+    os.environ["BANKBOT_MODEL_LOAD"] = "eager"
+    os.environ["BANKBOT_NLU_CACHE_SIZE"] = "0"
+    errors = []
+    try:
+        import app
+        import auth_hashing
+
+        if app.nlp is None:
+            print("No trained model at models/nlu_model; run train.py first.")
+            sys.exit(1)
+        client = app.app.test_client()
+        for n in range(args.storm):
+            client.post("/api/register", json={"name": f"Storm {n}", "email": f"storm{n}@bench",
+                                               "account_number": f"7000{n:08d}", "password": f"pw{n}"})
+        client.post("/api/register", json={"name": "Chat", "email": "chat@bench", "account_number": "700099999999",
+                                           "password": "pw"})
+        client.post("/api/login", json={"email": "chat@bench", "password": "pw"})
+        texts = (messages() * (args.chats // len(messages()) + 1))[:args.chats]
+        run(app, client, texts[:100], 0)  # warm-up
+
+        pooled = app.password_hasher
+        stats = pooled.stats_snapshot()
+        print(f"{args.storm} login threads, {args.chats} chats; pool: {stats['mode']}, "
+              f"{stats['workers']} worker(s), queue {stats['max_queue']}")
+        print(f"{'setting':<8} {'chat p50':>9} {'chat p95':>9} {'logins/s':>9} {'login p50':>10}")
+        results = {}
+        for label, hasher, threads in (("idle", pooled, 0),
+                                       ("inline", auth_hashing.PasswordHasher("inline", workers=args.storm), args.storm),
+                                       ("process", pooled, args.storm)):
+            app.password_hasher = hasher
+            chats, logins, failures, elapsed = run(app, client, texts, threads)
+            results[label] = percentile(chats, 95)
+            print(f"{label:<8} {percentile(chats, 50):8.2f}ms {percentile(chats, 95):8.2f}ms "
+                  f"{len(logins) / elapsed:9.1f} {percentile(logins, 50):8.0f}ms")
+            if failures:
+                errors.append(f"{label}: {len(failures)} logins failed (status {sorted(set(failures))})")
+        app.password_hasher = pooled
+        print(f"pool stats: {pooled.stats_snapshot()}")
+        if results["process"] >= results["inline"]:
+            errors.append(f"chat p95 with the pool ({results['process']:.2f} ms) is not below inline "
+                          f"({results['inline']:.2f} ms)")
+
+        # Identity comes from the session cookie; account data from the snapshot cache
+        client.get("/api/profile")
+        statements = []
+        app.db_pool.connection().set_trace_callback(statements.append)
+        for _ in range(25):
+            client.get("/api/profile")
+            client.post("/api/chat", json={"message": "check my balance"})
+        app.db_pool.connection().set_trace_callback(None)
+        users = [s for s in statements if "users" in s.lower()]
+        print(f"50 profile/chat calls: {len(statements)} queries on this thread, {len(users)} against users")
+        if users:
+            errors.append(f"profile/chat queried users: {users[0]}")
+        app.chat_log_writer.flush()
+        pooled.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if errors:
+        print("FAILED:")
+        for e in errors:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: the login storm no longer slows chat down as much.")
+
+
+if __name__ == "__main__":
+    main()
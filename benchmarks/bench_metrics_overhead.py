@@ -0,0 +1,105 @@
+"""
+Cost of request instrumentation: the chat workload with BANKBOT_METRICS=1
+vs BANKBOT_METRICS=0, each in a fresh process, plus the slow-request
+profiler when --profile is given.
+
+    python benchmarks/bench_metrics_overhead.py [--requests 2000] [--runs 3] [--profile]
+
+Each run uses a throwaway copy of data.db and a logged-in test client.
+Also checks that /metrics renders and that the disabled run recorded nothing.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGES = ["hi", "check my balance", "transfer 10 to 700000000002", "mini statement",
+            "what is my account number", "card details", "blah blah qwerty", "bye"]
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import app
+client = app.app.test_client()
+for i in (1, 2):
+    client.post("/api/register", json={{"name": "M", "email": f"m{{i}}@metrics.local",
+                                        "account_number": f"70000000000{{i}}", "password": "pw"}})
+client.post("/api/login", json={{"email": "m1@metrics.local", "password": "pw"}})
+app.model_loader.wait(120)
+messages = {messages!r}
+for m in messages:  # warm-up
+    client.post("/api/chat", json={{"message": m}})
+latencies = []
+for n in range({requests}):
+    started = time.perf_counter()
+    client.post("/api/chat", json={{"message": messages[n % len(messages)]}})
+    latencies.append(time.perf_counter() - started)
+app.chat_log_writer.flush()
+text = client.get("/metrics").data.decode()
+print(json.dumps({{"latencies": latencies,
+                  "chat_series": text.count('route="/api/chat"'),
+                  "help_lines": text.count("# HELP")}}))
+"""
+
+
+def run(label, env_overrides, requests, tmp):
+    # A fresh file per run: a reused name would pick up the last run's -wal
+    db_path = tempfile.mktemp(suffix=".db", prefix=f"{label}-", dir=tmp)
+    shutil.copy(os.path.join(ROOT, "data.db"), db_path)
+    env = dict(os.environ, BANKBOT_DB_PATH=db_path, BANKBOT_PROFILE_DIR=os.path.join(tmp, "profiles"),
+               **env_overrides)
+    code = CHILD.format(root=ROOT, messages=MESSAGES, requests=requests)
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--profile", action="store_true", help="also run with the slow-request profiler on")
+    args = parser.parse_args()
+
+    configs = [("disabled", {"BANKBOT_METRICS": "0"}), ("enabled", {"BANKBOT_METRICS": "1"})]
+    if args.profile:
+        configs.append(("enabled+profiler", {"BANKBOT_METRICS": "1", "BANKBOT_PROFILE_SLOW_MS": "1000"}))
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-metrics-")
+    errors = []
+    means = {}
+    try:
+        print(f"{'config':<18} {'mean':>9} {'p50':>9} {'p99':>9}")
+        for label, overrides in configs:
+            results = [run(label, overrides, args.requests, tmp) for _ in range(args.runs)]
+            latencies = sorted(x for r in results for x in r["latencies"])
+            means[label] = statistics.mean(latencies)
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[int(len(latencies) * 0.99)]
+            print(f"{label:<18} {means[label] * 1e6:7.0f}us {p50 * 1e6:7.0f}us {p99 * 1e6:7.0f}us")
+            series = results[0]["chat_series"]
+            if label == "disabled" and series:
+                errors.append(f"metrics disabled but {series} /api/chat series were recorded")
+            if label != "disabled" and not series:
+                errors.append(f"{label}: no /api/chat series in /metrics")
+        overhead = means["enabled"] - means["disabled"]
+        print(f"instrumentation overhead: {overhead * 1e6:+.1f}us per chat request "
+              f"({overhead / means['disabled'] * 100:+.1f}%)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if errors:
+        print("FAILED:")
+        for e in errors:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: /metrics renders; disabled metrics record nothing.")
+
+
+if __name__ == "__main__":
+    main()
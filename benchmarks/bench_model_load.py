@@ -0,0 +1,54 @@
+"""
+Model load time and resident memory: full spacy.load vs. the lean serving load.
+
+    python benchmarks/bench_model_load.py [--model models/nlu_model] [--runs 3]
+
+Every measurement runs in a fresh interpreter so import and RSS numbers
+are not shared between modes.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import nlu_engine
+import spacy
+t1 = time.perf_counter()
+nlp = nlu_engine.load_pipeline({model!r}, lean={lean!r})
+t2 = time.perf_counter()
+nlp("check my balance")
+print(json.dumps({{"import_s": t1 - t0, "load_s": t2 - t1,
+                  "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+                  "pipes": nlp.pipe_names, "strings": len(nlp.vocab.strings)}}))
+"""
+
+
+def measure(model, lean):
+    code = CHILD.format(root=ROOT, model=model, lean=lean)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=os.path.join(ROOT, "models", "nlu_model"))
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for label, lean in (("full", False), ("lean", True)):
+        runs = [measure(args.model, lean) for _ in range(args.runs)]
+        best = min(runs, key=lambda r: r["load_s"])
+        print(f"{label:5s} load {best['load_s'] * 1000:7.1f} ms  import {best['import_s'] * 1000:7.1f} ms  "
+              f"peak RSS {max(r['rss_mb'] for r in runs):6.1f} MB  pipes {best['pipes']}  "
+              f"strings {best['strings']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Unknown-rate reduction and added latency of the char n-gram fallback.
+
+    python benchmarks/bench_ngram_fallback.py [--variants 2000] [--seed 0] [--min-similarity 0.5]
+
+Makes typo'd and shortened variants of banking_queries.csv phrasings
+(dropped / swapped / doubled / replaced letters, dropped words) with a fixed
+seed, and runs each through recognize_intent with the fallback off and on.
+Reports the unknown rate and accuracy of both, the precision of the turns
+the fallback answered, how many out-of-domain messages get an intent, and
+the latency it adds to a low-confidence turn.
+Needs a trained model at models/nlu_model (run train.py first); runs
+against a throwaway copy of data.db.
+Checks: fewer unknowns, no accuracy lost, and at most one out-of-domain
+message the model rejects gets an intent from the fallback.
+"""
+import argparse
+import csv
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+OUT_OF_DOMAIN = [
+    "what's the weather like tomorrow", "tell me a joke", "who won the football match",
+    "blah blah qwerty", "recommend a good movie", "how tall is mount everest",
+    "play some music", "what is the capital of france", "asdf jkl", "translate hello into spanish",
+    "order a pizza", "book me a flight to paris", "what time is it in tokyo", "sing a song",
+    "how do i bake bread", "is it going to rain", "what's 2 plus 2", "who are you really",
+    "set an alarm for 7am", "define photosynthesis",
+]
+
+
+def corpus():
+    with open(os.path.join(ROOT, "banking_queries.csv"), encoding="utf-8") as f:
+        return [(row["text"].lower(), row["intent"]) for row in csv.DictReader(f) if row.get("text")]
+
+
+def variant(text, rng):
+    """One or two random edits: a typo inside a word, or a dropped word."""
+    for _ in range(rng.choice((1, 2))):
+        words = text.split()
+        if len(words) > 2 and rng.random() < 0.3:
+            del words[rng.randrange(len(words))]
+            text = " ".join(words)
+            continue
+        i = rng.randrange(len(text))
+        edit = rng.choice(("drop", "swap", "double", "replace"))
+        if edit == "drop":
+            text = text[:i] + text[i + 1:]
+        elif edit == "swap" and i < len(text) - 1:
+            text = text[:i] + text[i + 1] + text[i] + text[i + 2:]
+        elif edit == "double":
+            text = text[:i] + text[i] + text[i:]
+        else:
+            text = text[:i] + rng.choice(string.ascii_lowercase) + text[i + 1:]
+    return text
+
+
+def evaluate(app, cases):
+    """(unknown, correct, fallback answers, correct fallback answers, low-confidence messages)"""
+    unknown = correct = fallback = fallback_correct = 0
+    low = []
+    for message, gold in cases:
+        intent, _, _, source = app.recognize_intent(message)
+        unknown += intent == "unknown"
+        correct += intent == gold
+        if source == "ngram_match":
+            fallback += 1
+            fallback_correct += intent == gold
+        if source == "ngram_match" or (intent == "unknown" and source in ("model", "cache")):
+            low.append(message)
+    return unknown, correct, fallback, fallback_correct, low
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-similarity", type=float)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-ngram-")
+    shutil.copy(os.path.join(ROOT, "data.db"), os.path.join(tmp, "data.db"))
+    os.environ["BANKBOT_DB_PATH"] = os.path.join(tmp, "data.db")
+    os.environ["BANKBOT_MODEL_LOAD"] = "eager"
+    os.environ["BANKBOT_NLU_CACHE_SIZE"] = "0"
+    if args.min_similarity is not None:
+        os.environ["BANKBOT_NLU_FALLBACK_MIN"] = str(args.min_similarity)
+    errors = []
+    try:
+        import app
+        import nlu_engine
+
+        if app.nlp is None:
+            print("No trained model at models/nlu_model; run train.py first.")
+            sys.exit(1)
+        pairs = corpus()
+        started = time.perf_counter()
+        app.build_match_index(nlu_engine.model_labels(app.nlp))
+        build = time.perf_counter() - started
+        index = app.ngram_index
+        stats = index.stats()
+        print(f"index: {stats['examples']} examples, {stats['entries']} entries, built in {build * 1000:.0f} ms, "
+              f"min similarity {index.min_similarity}")
+
+        rng = random.Random(args.seed)
+        cases = [(variant(text, rng), intent) for text, intent in (rng.choice(pairs) for _ in range(args.variants))]
+        results = {}
+        for label, fallback_index in (("model only", None), ("+ fallback", index)):
+            app.ngram_index = fallback_index
+            unknown, correct, answered, answered_correct, low = evaluate(app, cases)
+            ood = sum(app.recognize_intent(m)[0] != "unknown" for m in OUT_OF_DOMAIN)
+            results[label] = (unknown, correct, ood)
+            line = (f"{label:<11} unknown {unknown / len(cases):6.1%}  accuracy {correct / len(cases):6.1%}  "
+                    f"out-of-domain given an intent {ood}/{len(OUT_OF_DOMAIN)}")
+            if fallback_index:
+                line += f"  fallback answered {answered}, {answered_correct / max(answered, 1):.1%} correct"
+            print(line)
+
+        timings = []
+        for message in low:
+            t0 = time.perf_counter()
+            index.query(message)
+            timings.append((time.perf_counter() - t0) * 1000.0)
+        print(f"added latency per low-confidence turn ({len(timings)} turns): "
+              f"p50 {percentile(timings, 50):.3f} ms, p95 {percentile(timings, 95):.3f} ms")
+
+        (u0, c0, o0), (u1, c1, o1) = results["model only"], results["+ fallback"]
+        if u1 >= u0:
+            errors.append(f"unknown turns not reduced ({u0} -> {u1})")
+        if c1 < c0:
+            errors.append(f"accuracy dropped ({c0} -> {c1} correct)")
+        if o1 - o0 > 1:
+            errors.append(f"the fallback gave {o1 - o0} out-of-domain messages an intent")
+        app.chat_log_writer.flush()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if errors:
+        print("FAILED:")
+        for e in errors:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: the fallback answers more turns without losing accuracy.")
+
+
+if __name__ == "__main__":
+    main()
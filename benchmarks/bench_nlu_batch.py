@@ -0,0 +1,83 @@
+"""
+Throughput vs. added latency of micro-batched NLU inference.
+
+    python benchmarks/bench_nlu_batch.py [--threads 32] [--messages 3000] [--windows 0,2,5]
+
+Drives recognize_intent from many threads with messages drawn from
+banking_queries.csv. Window 0 is the unbatched nlp() per call path.
+Needs a trained model at models/nlu_model (run train.py first).
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_messages():
+    with open(os.path.join(ROOT, "banking_queries.csv"), encoding="utf-8") as f:
+        return [row["text"].lower() for row in csv.DictReader(f) if row.get("text")]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(app, nlu_engine, window_ms, threads, messages):
+    app.nlu_batcher = nlu_engine.InferenceBatcher(lambda: app.nlp, window=window_ms / 1000.0) if window_ms else None
+    latencies = []
+    lock = threading.Lock()
+    per_thread = len(messages) // threads
+
+    def worker(offset):
+        local = []
+        for msg in messages[offset * per_thread:(offset + 1) * per_thread]:
+            t0 = time.perf_counter()
+            app.recognize_intent(msg)
+            local.append((time.perf_counter() - t0) * 1000.0)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stats = app.nlu_batcher.stats_snapshot() if app.nlu_batcher else {}
+    print(f"window {window_ms:4.1f} ms  {len(latencies) / elapsed:8.1f} msg/s  "
+          f"p50 {statistics.median(latencies):6.2f} ms  p95 {percentile(latencies, 95):6.2f} ms  "
+          f"mean batch {stats.get('mean_batch_size', 1.0):5.1f}  "
+          f"mean queue wait {stats.get('queue_wait_mean_ms', 0.0):5.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--windows", default="0,2,5")
+    args = parser.parse_args()
+
+    import app
+    import nlu_engine
+
+    if app.nlp is None:
+        sys.exit("No trained model at models/nlu_model; run train.py first.")
+
+    app.intent_cache = None  # measure inference, not cache hits
+    app.match_index = None
+    corpus = load_messages()
+    messages = (corpus * (args.messages // len(corpus) + 1))[:args.messages]
+    for window in (float(w) for w in args.windows.split(",")):
+        run(app, nlu_engine, window, args.threads, messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Bulk training-data import vs one POST /api/admin/nlu per phrasing, plus an
+export round trip.
+
+    python benchmarks/bench_nlu_import.py [--rows 3000]
+
+Runs against a throwaway copy of data.db through the Flask test client.
+Checks:
+  * the bulk import inserts every row and reports the planted duplicates / bad rows;
+  * the streamed export (plain and gzip) contains the imported rows with their bot_reply;
+  * re-importing the export skips every row already in nlu_data.
+"""
+import argparse
+import csv
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=3000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-nlu-import-")
+    shutil.copy(os.path.join(ROOT, "data.db"), os.path.join(tmp, "data.db"))
+    os.environ["BANKBOT_DB_PATH"] = os.path.join(tmp, "data.db")
+    os.environ.setdefault("BANKBOT_MODEL_LOAD", "lazy")
+    errors = []
+    try:
+        import app
+
+        client = app.app.test_client()
+        client.post("/api/admin/login", json={"username": "admin", "password": "admin"})
+
+        started = time.perf_counter()
+        for i in range(args.rows):
+            client.post("/api/admin/nlu", json={"text": f"single phrase {i}", "intent": "bench_single",
+                                                "bot_reply": f"single reply {i}"})
+        single = time.perf_counter() - started
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["text", "intent", "bot_reply"])
+        for i in range(args.rows):
+            writer.writerow([f"bulk phrase {i}", "bench_bulk", f"bulk reply {i}"])
+        writer.writerow(["bulk phrase 0", "bench_bulk", "again"])  # duplicate within the upload
+        writer.writerow(["single phrase 0", "bench_single", "x"])  # already in nlu_data
+        writer.writerow(["", "bench_bulk", "no text"])             # invalid
+        started = time.perf_counter()
+        r = client.post("/api/admin/nlu/import", data=buf.getvalue().encode(), content_type="text/csv")
+        bulk = time.perf_counter() - started
+        report = r.get_json()["report"]
+
+        print(f"{args.rows} phrasings: one POST each {single:.2f}s, bulk import {bulk:.2f}s "
+              f"({single / bulk:.0f}x faster)")
+        print(f"report: inserted {report['inserted']}, duplicates {report['duplicates']}, invalid {report['invalid']}")
+        if (report["inserted"], report["duplicates"], report["invalid"]) != (args.rows, 2, 1):
+            errors.append(f"unexpected import report: {report}")
+
+        started = time.perf_counter()
+        plain = client.get("/api/admin/nlu/export").get_data()
+        packed = client.get("/api/admin/nlu/export?gzip=1").get_data()
+        print(f"export: {len(plain) / 1024:.0f} KiB csv, {len(packed) / 1024:.0f} KiB gzip "
+              f"in {time.perf_counter() - started:.2f}s")
+        if gzip.decompress(packed) != plain:
+            errors.append("gzip export differs from the plain export")
+        rows = {r["text"]: r for r in csv.DictReader(io.StringIO(plain.decode()))}
+        if rows.get(f"bulk phrase {args.rows - 1}", {}).get("bot_reply") != f"bulk reply {args.rows - 1}":
+            errors.append("export is missing an imported row or its bot_reply")
+
+        # The CSV-file examples are new to nlu_data; every admin-added one must be skipped
+        again = client.post("/api/admin/nlu/import", data=plain, content_type="text/csv").get_json()["report"]
+        if again["duplicates"] < 2 * args.rows:
+            errors.append(f"re-importing the export skipped only {again['duplicates']} existing rows")
+        app.chat_log_writer.flush()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if errors:
+        print("FAILED:")
+        for e in errors:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: bulk import, streamed export and round trip agree.")
+
+
+if __name__ == "__main__":
+    main()
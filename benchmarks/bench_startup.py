@@ -0,0 +1,92 @@
+"""
+Worker startup: time until a fresh process can answer /api/login, until
+/readyz reports the model loaded, and until the first chat reply, for each
+BANKBOT_MODEL_LOAD mode.
+
+    python benchmarks/bench_startup.py [--runs 3] [--modes legacy,eager,background,lazy]
+
+"legacy" is eager loading plus the old eager `import spacy` / `import train`
+at the top of app.py. Times are measured from process spawn, so they
+include interpreter start-up. Each run uses a throwaway copy of data.db.
+Run it where a trained model is installed at models/nlu_model, otherwise
+the model never becomes ready.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, os, sys, time
+t0 = float(os.environ["BENCH_T0"])
+sys.path.insert(0, {root!r})
+if {legacy!r}:
+    import spacy, train
+import app
+t_import = time.time() - t0
+client = app.app.test_client()
+client.post("/api/register", json={{"name": "S", "email": "s@startup.local", "account_number": "700000000001", "password": "pw"}})
+client.post("/api/login", json={{"email": "s@startup.local", "password": "pw"}})
+t_login = time.time() - t0
+spacy_at_login = "spacy" in sys.modules
+t_ready = None
+t_chat = None
+if {mode!r} == "lazy":
+    client.post("/api/chat", json={{"message": "what is the weather like on mars"}})
+    t_chat = time.time() - t0
+deadline = time.time() + 120
+while time.time() < deadline:
+    if client.get("/readyz").status_code == 200:
+        t_ready = time.time() - t0
+        break
+    time.sleep(0.01)
+if t_chat is None:
+    client.post("/api/chat", json={{"message": "what is the weather like on mars"}})
+    t_chat = time.time() - t0
+app.chat_log_writer.flush()
+print(json.dumps({{"import_s": t_import, "login_s": t_login, "ready_s": t_ready, "first_chat_s": t_chat,
+                  "spacy_at_login": spacy_at_login}}))
+"""
+
+
+def run(mode, tmp):
+    # A fresh file per run: a reused name would pick up the last run's -wal
+    db_path = tempfile.mktemp(suffix=".db", prefix=f"{mode}-", dir=tmp)
+    shutil.copy(os.path.join(ROOT, "data.db"), db_path)
+    env = dict(os.environ, BANKBOT_DB_PATH=db_path, BENCH_T0=repr(time.time()),
+               BANKBOT_MODEL_LOAD="eager" if mode == "legacy" else mode)
+    code = CHILD.format(root=ROOT, mode=mode, legacy=mode == "legacy")
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", default="legacy,eager,background,lazy")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-startup-")
+    try:
+        print(f"{'mode':<11} {'import':>8} {'login':>8} {'ready':>8} {'1st chat':>9}  spaCy imported by login")
+        for mode in args.modes.split(","):
+            results = [run(mode, tmp) for _ in range(args.runs)]
+
+            def med(key):
+                values = [r[key] for r in results if r[key] is not None]
+                return f"{statistics.median(values):7.2f}s" if values else "    n/a"
+            print(f"{mode:<11} {med('import_s')} {med('login_s')} {med('ready_s')} {med('first_chat_s'):>9}  "
+                  f"{results[0]['spacy_at_login']}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Concurrent transfer load test: several processes (like gunicorn workers),
+each with several threads, move money between a small set of accounts.
+
+    python benchmarks/bench_transfers.py [--processes 4] [--threads 8] [--transfers 800] [--legacy]
+
+Every transfer carries an idempotency key and a share of them is submitted
+twice from different workers, as a client retry would be. Afterwards the
+run checks that:
+  * the total balance is unchanged and no account went negative;
+  * every key was posted at most once (one debit row per recorded success);
+  * no request failed with "database is locked".
+--legacy runs the old read-check-update transfer instead, for comparison.
+Runs against a throwaway copy of data.db.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+START_BALANCE = 1000.0
+
+
+def legacy_transfer(pool, from_user_id, to_account_number, amount):
+    """The pre-engine perform_transfer: balance read and checked before a deferred write."""
+    with pool.transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT balance FROM users WHERE id=?", (from_user_id,))
+        if c.fetchone()[0] < amount:
+            return {"success": False, "reply": "Insufficient balance."}
+        c.execute("SELECT id FROM users WHERE account_number=?", (to_account_number,))
+        to_user_id = c.fetchone()[0]
+        c.execute("UPDATE users SET balance = balance - ? WHERE id=?", (amount, from_user_id))
+        c.execute("UPDATE users SET balance = balance + ? WHERE id=?", (amount, to_user_id))
+        ts = "legacy"
+        c.execute("INSERT INTO transactions (user_id,type,amount,description,timestamp) VALUES (?,?,?,?,?)",
+                  (from_user_id, "debit", amount, f"Transfer to {to_account_number}", ts))
+        c.execute("INSERT INTO transactions (user_id,type,amount,description,timestamp) VALUES (?,?,?,?,?)",
+                  (to_user_id, "credit", amount, f"Transfer from user {from_user_id}", ts))
+    return {"success": True}
+
+
+def worker(db_path, jobs, n_threads, legacy, out):
+    import db
+    import transfers
+
+    pool = db.get_pool(db_path)
+    engine = transfers.TransferEngine(pool)
+    counts = {"ok": 0, "rejected": 0, "replayed": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def run(chunk):
+        for from_id, to_account, amount, key in chunk:
+            try:
+                if legacy:
+                    result = legacy_transfer(pool, from_id, to_account, amount)
+                else:
+                    result = engine.transfer(from_id, to_account, amount, key)
+                outcome = "replayed" if result.get("replayed") else "ok" if result["success"] else "rejected"
+                if result.get("busy"):
+                    outcome = "errors"
+            except sqlite3.Error:
+                outcome = "errors"
+            with lock:
+                counts[outcome] += 1
+
+    threads = [threading.Thread(target=run, args=(jobs[i::n_threads],)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out.put(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--transfers", type=int, default=800)
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--retry-share", type=float, default=0.25, help="share of keys submitted twice")
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-bench-")
+    db_path = os.path.join(tmp, "data.db")
+    shutil.copy(os.path.join(ROOT, "data.db"), db_path)
+    try:
+        # Schema (including transfer_requests) via the app's own init_db
+        os.environ["BANKBOT_DB_PATH"] = db_path
+        import app
+        app.chat_log_writer.flush()
+
+        accounts = {}
+        with app.db_pool.transaction() as conn:
+            for i in range(args.accounts):
+                number = f"88{i:010d}"
+                cur = conn.execute("INSERT INTO users (name,email,account_number,password,balance,card_last4) "
+                                   "VALUES (?,?,?,?,?,?)", (f"T{i}", f"t{i}@bench.local", number, "x",
+                                                           START_BALANCE, number[-4:]))
+                accounts[cur.lastrowid] = number
+        app.db_pool.close_all()
+        ids = list(accounts)
+        placeholders = ",".join("?" * len(ids))
+
+        rng = random.Random(42)
+        jobs = []
+        for n in range(args.transfers):
+            from_id, to_id = rng.sample(ids, 2)
+            jobs.append((from_id, accounts[to_id], float(rng.randint(1, 150)), f"bench-{n}"))
+        retried = rng.sample(range(len(jobs)), int(len(jobs) * args.retry_share))
+        # Each process gets a slice; retried jobs go to a different process as well
+        slices = [jobs[i::args.processes] for i in range(args.processes)]
+        for n in retried:
+            slices[(n + 1) % args.processes].append(jobs[n])
+        for s in slices:
+            rng.shuffle(s)
+
+        ctx = multiprocessing.get_context("spawn")
+        out = ctx.Queue()
+        procs = [ctx.Process(target=worker, args=(db_path, s, args.threads, args.legacy, out)) for s in slices]
+        start = time.perf_counter()
+        for p in procs:
+            p.start()
+        totals = {"ok": 0, "rejected": 0, "replayed": 0, "errors": 0}
+        for _ in procs:
+            for k, v in out.get().items():
+                totals[k] += v
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        conn = sqlite3.connect(db_path)
+        balances = [r[0] for r in conn.execute(f"SELECT balance FROM users WHERE id IN ({placeholders})", ids)]
+        debits = conn.execute(
+            f"SELECT COUNT(*) FROM transactions WHERE type='debit' AND user_id IN ({placeholders})", ids
+        ).fetchone()[0]
+        conn.close()
+
+        submitted = len(jobs) + len(retried)
+        print(f"{'legacy' if args.legacy else 'engine'}: {submitted} requests ({len(retried)} retries) from "
+              f"{args.processes} processes x {args.threads} threads in {elapsed:.2f}s "
+              f"({submitted / elapsed:.0f} req/s)")
+        print(f"  posted {totals['ok']}, rejected {totals['rejected']}, replayed {totals['replayed']}, "
+              f"errors {totals['errors']}")
+
+        errors = []
+        if abs(sum(balances) - START_BALANCE * len(ids)) > 1e-6:
+            errors.append(f"money not conserved: {sum(balances):.2f} != {START_BALANCE * len(ids):.2f}")
+        if min(balances) < 0:
+            errors.append(f"overdrawn account: {min(balances):.2f}")
+        if debits != totals["ok"]:
+            errors.append(f"{debits} debits posted for {totals['ok']} successful transfers")
+        if totals["ok"] + totals["rejected"] != len(jobs):
+            errors.append(f"{totals['ok'] + totals['rejected'] - len(jobs)} retried requests were posted again")
+        if totals["errors"]:
+            errors.append(f"{totals['errors']} requests failed on a locked database")
+        if errors:
+            print("FAILED: " + "; ".join(errors))
+            sys.exit(1)
+        print("OK: balances conserved, nothing overdrawn, every key posted at most once.")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
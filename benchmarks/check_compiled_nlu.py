@@ -0,0 +1,141 @@
+"""
+Parity and cost of the compiled NumPy intent model against spaCy.
+
+    python benchmarks/check_compiled_nlu.py [--model models/nlu_model] [--batch 32] [--repeat 3]
+
+Classifies every banking_queries.csv text (as typed, and normalized the way
+the chat path sends it) with both backends and checks:
+  * the max abs score difference is within compiled_nlu.PARITY_TOLERANCE;
+  * the top intent is the same for every text.
+Then reports per-message latency (one at a time and in batches) and, each
+in a fresh process, load time and peak RSS. Uses the model's own compiled
+file if train.py wrote one, otherwise compiles into a temp dir.
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def texts():
+    with open(os.path.join(ROOT, "banking_queries.csv"), encoding="utf-8") as f:
+        return [row["text"] for row in csv.DictReader(f) if row.get("text")]
+
+
+def peak_rss_mb():
+    # VmHWM starts afresh at exec; ru_maxrss on Linux carries over the parent's peak from fork
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(backend, model_dir, compiled_path):
+    """Runs in a fresh interpreter: load, classify the CSV, report load time and peak RSS."""
+    import nlu_engine
+
+    started = time.perf_counter()
+    if backend == "numpy":
+        import compiled_nlu
+        model = compiled_nlu.load(compiled_path)
+    else:
+        model = nlu_engine.load_pipeline(model_dir, lean=True)
+    load_seconds = time.perf_counter() - started
+    for text in texts():
+        model(nlu_engine.normalize_message(text)).cats
+    print(json.dumps({"load_seconds": load_seconds, "max_rss_mb": peak_rss_mb(),
+                      "spacy_imported": "spacy" in sys.modules}))
+
+
+def latency(model, messages, batch, repeat):
+    single = batched = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for m in messages:
+            model(m).cats
+        single = min(single, time.perf_counter() - started)
+        started = time.perf_counter()
+        list(model.pipe(messages, batch_size=batch))
+        batched = min(batched, time.perf_counter() - started)
+    return single / len(messages) * 1000, batched / len(messages) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=os.path.join(ROOT, "models", "nlu_model"))
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", choices=("spacy", "numpy"), help=argparse.SUPPRESS)
+    parser.add_argument("--compiled", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child, args.model, args.compiled)
+
+    import numpy as np
+    import compiled_nlu
+    import nlu_engine
+
+    nlp = nlu_engine.load_pipeline(args.model, lean=True)
+    compiled_path = os.path.join(args.model, compiled_nlu.COMPILED_FILE)
+    tmp = None
+    if not os.path.exists(compiled_path):
+        tmp = tempfile.mkdtemp(prefix="bankbot-compiled-")
+        compiled_path = os.path.join(tmp, compiled_nlu.COMPILED_FILE)
+        compiled_nlu.export(nlu_engine.load_pipeline(args.model, lean=False), compiled_path)
+        print(f"No {compiled_nlu.COMPILED_FILE} in {args.model}; compiled a temporary copy.")
+    errors = []
+    try:
+        model = compiled_nlu.load(compiled_path)
+        labels = model.labels
+        raw = texts()
+        print(f"{len(raw)} texts, {len(labels)} intents, compiled file {os.path.getsize(compiled_path) / 1024:.0f} KiB")
+
+        for kind, messages in (("as typed", raw), ("normalized", [nlu_engine.normalize_message(t) for t in raw])):
+            expected = np.array([[d.cats[l] for l in labels] for d in nlp.pipe(messages, batch_size=args.batch)])
+            got = np.array([[d.cats[l] for l in labels] for d in model.pipe(messages, batch_size=args.batch)])
+            diff = float(np.abs(expected - got).max())
+            agree = int((expected.argmax(axis=1) == got.argmax(axis=1)).sum())
+            print(f"{kind:<11} max abs diff {diff:.2e}, top intent agrees {agree}/{len(messages)}")
+            if diff > compiled_nlu.PARITY_TOLERANCE:
+                errors.append(f"{kind}: scores differ by {diff:.2e} (tolerance {compiled_nlu.PARITY_TOLERANCE})")
+            if agree != len(messages):
+                errors.append(f"{kind}: top intent differs on {len(messages) - agree} texts")
+
+        messages = [nlu_engine.normalize_message(t) for t in raw]
+        print(f"\n{'backend':<8} {'single ms':>10} {f'batch{args.batch} ms':>11} {'load s':>8} {'peak RSS MB':>12}  spaCy imported")
+        for backend, engine in (("spacy", nlp), ("numpy", model)):
+            single, batched = latency(engine, messages, args.batch, args.repeat)
+            out = subprocess.run([sys.executable, __file__, "--child", backend, "--model", args.model,
+                                  "--compiled", compiled_path], capture_output=True, text=True, check=True)
+            proc = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{backend:<8} {single:10.3f} {batched:11.3f} {proc['load_seconds']:8.2f} "
+                  f"{proc['max_rss_mb']:12.0f}  {proc['spacy_imported']}")
+            if backend == "numpy" and proc["spacy_imported"]:
+                errors.append("the numpy backend imported spaCy")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    if errors:
+        print("FAILED:")
+        for e in errors:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: compiled model matches spaCy.")
+
+
+if __name__ == "__main__":
+    main()
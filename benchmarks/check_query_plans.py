@@ -0,0 +1,110 @@
+"""
+EXPLAIN QUERY PLAN check for the hot request paths: fails if any query the
+app runs while serving chat, login, profile, transfers or the history page
+falls back to a full table scan or a temp b-tree sort.
+
+    python benchmarks/check_query_plans.py
+
+The SQL is not listed by hand: the script drives the real routes and intent
+handlers against a throwaway copy of data.db and records every statement
+through sqlite3's trace callback, so new queries are checked automatically.
+It also checks that re-running the migrations is a no-op.
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HOT_STATEMENT = re.compile(r"^\s*(SELECT|UPDATE|DELETE)\b", re.IGNORECASE)
+BAD_PLAN = re.compile(r"^(SCAN (?!CONSTANT ROW)|USE TEMP B-TREE)")
+# Walking an index in order is fine when LIMIT stops it early (keyset pages)
+INDEX_WALK = re.compile(r"^SCAN \w+ USING (COVERING )?INDEX ")
+LIMITED = re.compile(r"\bLIMIT\s+\d+\s*$", re.IGNORECASE)
+
+
+def is_bad(step, sql):
+    if not BAD_PLAN.match(step):
+        return False
+    return not (INDEX_WALK.match(step) and LIMITED.search(sql))
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]).parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-plans-")
+    os.environ["BANKBOT_DB_PATH"] = os.path.join(tmp, "data.db")
+    shutil.copy(os.path.join(ROOT, "data.db"), os.environ["BANKBOT_DB_PATH"])
+    sys.path.insert(0, ROOT)
+    import app  # migrates the copy on import
+    import intents
+    import migrations
+
+    errors = []
+    try:
+        version = app.db_pool.schema_version(app.db_pool.connection())
+        before, after = migrations.migrate(app.db_pool, app.MIGRATIONS)
+        if before != after or after != app.MIGRATIONS[-1].version:
+            errors.append(f"re-running migrations moved the schema version {before} -> {after}")
+
+        # Seed a couple of users with some history
+        client = app.app.test_client()
+        for i, number in enumerate(("500000000001", "500000000002")):
+            client.post("/api/register", json={"name": f"P{i}", "email": f"p{i}@plans.local",
+                                               "account_number": number, "password": "x"})
+
+        statements = []
+        conn = app.db_pool.connection()
+        conn.set_trace_callback(statements.append)
+        app.account_snapshots.clear()
+
+        client.post("/api/login", json={"email": "p0@plans.local", "password": "x"})
+        client.post("/api/login", json={"account_number": "500000000001", "password": "x"})
+        client.get("/api/profile")
+        client.post("/api/transfer", json={"to_account": "500000000002", "amount": 10},
+                    headers={"Idempotency-Key": "plans-1"})
+        client.post("/api/transfer", json={"to_account": "500000000002", "amount": 10},
+                    headers={"Idempotency-Key": "plans-1"})
+        client.post("/api/transfer/batch", json={"transfers": [{"to_account": "500000000002", "amount": 1}]})
+        client.post("/api/chat", json={"message": "hi"})
+        uid = app.query_db("SELECT id FROM users WHERE email=?", ("p0@plans.local",), one=True)[0]
+        with app.app.test_request_context():
+            for intent in app.intent_registry.handlers:
+                app.account_snapshots.clear()
+                entities = {"amount": 5.0, "account_number": "500000000002"}
+                app.intent_registry.dispatch(intents.Turn("", intent, 1.0, entities, uid, True))
+        app.chat_log_writer.flush()
+        client.post("/api/admin/login", json={"username": "admin", "password": "admin"})
+        client.get("/api/admin/history?limit=5")
+        client.get("/api/admin/history?limit=5&intent=greeting")
+        client.get(f"/api/admin/history?limit=5&user_id={uid}")
+        conn.set_trace_callback(None)
+
+        checked = 0
+        for sql in dict.fromkeys(statements):
+            if not HOT_STATEMENT.match(sql):
+                continue
+            checked += 1
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            bad = [step for step in plan if is_bad(step, sql)]
+            if bad:
+                errors.append(f"{' '.join(sql.split())}\n      -> {'; '.join(bad)}")
+        print(f"schema v{version}: checked {checked} distinct hot-path statements")
+    finally:
+        app.chat_log_writer.flush()
+        app.db_pool.close_all()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if errors:
+        print("FAILED:")
+        for e in errors:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: no full scans or temp sorts on the hot paths; migrations are idempotent.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Storage backend check: the same app workload against the local SQLite file
+and the pooled server backend, plus two app "nodes" sharing one database.
+
+    python benchmarks/check_storage_backends.py [--url mysql://user:pw@host/db]
+
+Without --url the server backend is the in-process stand-in
+(standin:///<tmp file>): real ServerPool, ServerConnection and dialect
+code over SQLite, so it runs anywhere. With --url (or BANKBOT_TEST_DB_URL)
+the same checks also run against that server; use an empty database.
+Checks:
+  * every route in the workload returns the same responses on each backend;
+  * two node processes transferring concurrently through their own pools
+    conserve the total balance and honour shared idempotency keys;
+  * the MySQL / PostgreSQL translations of the app's schema and upserts.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def workload():
+    """Runs in a child process with BANKBOT_DB_URL / BANKBOT_DB_PATH set; prints the responses as JSON."""
+    import app
+
+    client = app.app.test_client()
+    out = []
+
+    def call(method, path, **kwargs):
+        r = getattr(client, method)(path, **kwargs)
+        body = r.get_json(silent=True) or {}
+        for volatile in ("id", "timestamp", "date", "user", "history", "data", "next_cursor", "intents"):
+            body.pop(volatile, None)
+        out.append([method.upper(), path, r.status_code, body])
+        return r
+
+    for i in range(2):
+        call("post", "/api/register", json={"name": f"S{i}", "email": f"s{i}@storage.local",
+                                             "account_number": f"60000000000{i}", "password": "pw"})
+    call("post", "/api/register", json={"name": "dup", "email": "s0@storage.local",
+                                         "account_number": "600000000009", "password": "pw"})
+    call("post", "/api/login", json={"email": "s0@storage.local", "password": "wrong"})
+    call("post", "/api/login", json={"account_number": "600000000000", "password": "pw"})
+    call("get", "/api/profile")
+    call("post", "/api/transfer", json={"to_account": "600000000001", "amount": 125.5},
+         headers={"Idempotency-Key": "k-1"})
+    call("post", "/api/transfer", json={"to_account": "600000000001", "amount": 125.5},
+         headers={"Idempotency-Key": "k-1"})
+    call("post", "/api/transfer/batch", json={"transfers": [
+        {"to_account": "600000000001", "amount": 49000}, {"to_account": "600000000001", "amount": 49000},
+        {"to_account": "nope", "amount": 1}]})
+    profile = client.get("/api/profile").get_json()["user"]
+    out.append(["balance", profile["balance"]])
+    call("post", "/api/chat", json={"message": "hi"})
+    app.chat_log_writer.flush()
+
+    call("post", "/api/admin/login", json={"username": "admin", "password": "admin"})
+    call("post", "/api/admin/nlu", json={"text": "storage check phrase", "intent": "greeting", "bot_reply": "Hi!"})
+    call("post", "/api/admin/nlu", json={"text": "storage check phrase", "intent": "greeting", "bot_reply": "Hi!"})
+    rows = client.get("/api/admin/nlu").get_json()["data"]
+    added = [r for r in rows if r["text"] == "storage check phrase"]
+    out.append(["nlu rows", len(added)])
+    call("delete", f"/api/admin/nlu/{added[0]['id']}")
+    history = client.get("/api/admin/history?limit=5").get_json()
+    out.append(["history", [h["query"] for h in history["history"]]])
+    call("get", "/api/admin/analytics/intents")
+    print(json.dumps(out))
+
+
+def transfer_node(count):
+    """One app node: `count` keyed transfers from account ...0 to ...1, keys shared with the other node."""
+    import app
+
+    uid = app.storage.find_login(app.db_pool, "600000000000")[0]
+    posted = 0
+    for n in range(count):
+        result = app.perform_transfer(uid, "600000000001", 1.0, f"node-{n}")
+        posted += bool(result["success"] and not result.get("replayed"))
+    print(json.dumps({"posted": posted}))
+
+
+def node_env(target):
+    """Environment for an app process on a file path or a database URL."""
+    env = dict(os.environ)
+    env.pop("BANKBOT_DB_URL", None)
+    if "://" in target:
+        env["BANKBOT_DB_URL"] = target
+    else:
+        env["BANKBOT_DB_PATH"] = target
+    return env
+
+
+def last_json(stdout):
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def check_backend(name, target, reference, errors):
+    proc = subprocess.run([sys.executable, __file__, "--workload", target], env=node_env(target),
+                          capture_output=True, text=True, check=True)
+    responses = last_json(proc.stdout)
+    if reference is not None and responses != reference:
+        diff = [(a, b) for a, b in zip(reference, responses) if a != b]
+        errors.append(f"{name}: responses differ from SQLite, e.g. {diff[:2]}")
+
+    # Two nodes, one database: concurrent keyed transfers with the same keys
+    procs = [subprocess.Popen([sys.executable, __file__, "--transfer-node", target, "200"],
+                              env=node_env(target), stdout=subprocess.PIPE, text=True) for _ in range(2)]
+    posted = sum(last_json(p.communicate()[0])["posted"] for p in procs)
+    if posted != 200:
+        errors.append(f"{name}: {posted} transfers posted for 200 idempotency keys")
+    print(f"{name}: {len(responses)} workload checks, 2 nodes posted {posted}/200 shared keys")
+    return responses
+
+
+def check_translations(errors):
+    import app
+    import db
+
+    class Recorder:
+        def __init__(self):
+            self.sql = []
+
+        def execute(self, sql, args=()):
+            self.sql.append(sql)
+            return self
+
+        def fetchone(self):
+            return (1,)
+
+    rec = Recorder()
+    for m in app.MIGRATIONS:
+        m.apply(rec)
+    upsert = "INSERT INTO t (a, n) VALUES (?, ?) ON CONFLICT (a) DO UPDATE SET n = n + excluded.n"
+    for dialect in (db.MySQLDialect(), db.PostgresDialect()):
+        for sql in rec.sql + [upsert]:
+            out = dialect.translate(sql, True)
+            if "AUTOINCREMENT" in out or "?" in out or "excluded.n" in out and dialect.name == "mysql":
+                errors.append(f"{dialect.name}: untranslated SQL: {' '.join(out.split())[:120]}")
+        print(f"{dialect.name}: {' '.join(dialect.translate(upsert, True).split())}")
+    if "TEXT" in db.MySQLDialect().translate("CREATE TABLE x (email TEXT UNIQUE)", False):
+        errors.append("mysql: keyed TEXT column not converted to VARCHAR")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--workload":
+        return workload()
+    if len(sys.argv) > 3 and sys.argv[1] == "--transfer-node":
+        return transfer_node(int(sys.argv[3]))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=os.environ.get("BANKBOT_TEST_DB_URL"))
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-storage-")
+    os.environ["BANKBOT_DB_PATH"] = os.path.join(tmp, "translations.db")
+    errors = []
+    try:
+        reference = check_backend("sqlite", os.path.join(tmp, "local.db"), None, errors)
+        check_backend("standin", f"standin://{os.path.join(tmp, 'server.db')}", reference, errors)
+        if args.url:
+            check_backend("server", args.url, reference, errors)
+        check_translations(errors)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if errors:
+        print("FAILED:")
+        for e in errors:
+            print("  " + e)
+        sys.exit(1)
+    print("OK: backends agree, shared-database nodes conserve balances and keys.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Load test for the Flask API: register, login, chat, transfers and the admin
+endpoints, in-process through the Flask test client or over HTTP against a
+local gunicorn. Reports throughput and p50/p95/p99 latency per phase.
+
+    python benchmarks/loadtest.py [--target client|gunicorn] [--users 20] [--concurrency 4]
+        [--chats 50] [--transfers 10] [--admin 20] [--workers 2] [--seed 0]
+        [--save-baseline benchmarks/baseline.json] [--compare benchmarks/baseline.json] [--tolerance 0.25]
+
+Runs offline and seeds its own database: a fresh file in a temp dir gets
+the schema migrations and the default admin, and the run registers its own
+users. Chat messages are drawn from banking_queries.csv with a fixed seed,
+so the intent mix follows the CSV. Chat uses whatever model is installed
+at models/nlu_model; without one every turn takes the exact-match / no_model path.
+Each logged-in user has its own session, and each session is driven by one
+thread at a time, --concurrency threads in all.
+
+--save-baseline writes the results as JSON. --compare reads such a file and
+fails (exit 1) when a phase's p95 latency grows, or its throughput drops,
+by more than --tolerance. Any failed request also fails the run. Compare
+baselines from the same machine and the same options.
+"""
+import argparse
+import csv
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ADMIN_PATHS = ["/api/admin/history?limit=50", "/api/admin/nlu", "/api/admin/analytics/intents",
+               "/api/admin/nlu/export", "/api/admin/nlu/stats"]
+
+
+# --- Drivers: one session each ---
+class ClientDriver:
+    """Flask test client in this process."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def call(self, method, path, body=None, headers=None):
+        r = self.client.open(path, method=method, json=body, headers=headers or {})
+        return r.status_code, r.get_data()
+
+
+class HttpDriver:
+    """urllib with a cookie jar, against a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def call(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers=dict({"Content-Type": "application/json"}, **(headers or {})))
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+# --- Targets ---
+def start_gunicorn(db_path, workers):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, BANKBOT_DB_PATH=db_path, WEB_CONCURRENCY=str(workers))
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                             "-b", f"127.0.0.1:{port}", "app:app"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    # gunicorn.conf.py loads the model in the master before forking, so /healthz implies loaded
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited during start-up")
+        try:
+            with urllib.request.urlopen(base_url + "/healthz", timeout=2):
+                return proc, base_url
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not start within 120s")
+
+
+# --- Phases ---
+def run_phase(name, lanes):
+    """
+    lanes: one list of (driver, method, path, body, headers) per thread, run
+    in order. Returns the phase summary.
+    """
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(jobs):
+        mine, failed = [], []
+        for driver, method, path, body, headers in jobs:
+            started = time.perf_counter()
+            status, data = driver.call(method, path, body, headers)
+            mine.append(time.perf_counter() - started)
+            if status >= 400:
+                failed.append(f"{method} {path} -> {status} {data[:120]!r}")
+        with lock:
+            latencies.extend(mine)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=worker, args=(jobs,)) for jobs in lanes if jobs]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return summarize(name, latencies, errors, wall)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100.0))]
+
+
+def summarize(name, latencies, errors, wall):
+    values = sorted(latencies)
+    summary = {
+        "requests": len(values),
+        "errors": len(errors),
+        "seconds": round(wall, 3),
+        "rps": round(len(values) / wall, 1) if wall else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+    }
+    for p in (50, 95, 99):
+        summary[f"p{p}_ms"] = round(percentile(values, p) * 1000, 3)
+    if errors:
+        summary["error_samples"] = errors[:5]
+    print(f"{name:<10} {summary['requests']:>6} {summary['errors']:>6} {summary['rps']:>9.1f} "
+          f"{summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f}")
+    return summary
+
+
+def chat_messages():
+    with open(os.path.join(ROOT, "banking_queries.csv"), encoding="utf-8") as f:
+        return [row["text"] for row in csv.DictReader(f) if row.get("text")]
+
+
+def lanes_by_user(users, concurrency, jobs_for):
+    """Every job of a user goes to the same lane, so no session is shared between threads."""
+    lanes = [[] for _ in range(concurrency)]
+    for i, user in enumerate(users):
+        lanes[i % concurrency].extend(jobs_for(user))
+    return lanes
+
+
+def run_load(new_driver, args):
+    rng = random.Random(args.seed)
+    messages = chat_messages()
+    users = [{"driver": new_driver(), "email": f"lt{i}@loadtest.local", "account": f"8000000{i:05d}",
+              "messages": [rng.choice(messages) for _ in range(args.chats)]} for i in range(args.users)]
+    c = args.concurrency
+    phases = {}
+    print(f"{'phase':<10} {'reqs':>6} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+
+    phases["register"] = run_phase("register", lanes_by_user(users, c, lambda u: [
+        (u["driver"], "POST", "/api/register",
+         {"name": "Load", "email": u["email"], "account_number": u["account"], "password": "pw"}, None)]))
+    phases["login"] = run_phase("login", lanes_by_user(users, c, lambda u: [
+        (u["driver"], "POST", "/api/login", {"email": u["email"], "password": "pw"}, None)]))
+    phases["chat"] = run_phase("chat", lanes_by_user(users, c, lambda u: [
+        (u["driver"], "POST", "/api/chat", {"message": m}, None) for m in u["messages"]]))
+
+    def transfers(u):
+        i = users.index(u)
+        to_account = users[(i + 1) % len(users)]["account"]
+        return [(u["driver"], "POST", "/api/transfer", {"to_account": to_account, "amount": 1.0},
+                 {"Idempotency-Key": f"lt-{i}-{n}"}) for n in range(args.transfers)]
+    phases["transfer"] = run_phase("transfer", lanes_by_user(users, c, transfers))
+    phases["profile"] = run_phase("profile", lanes_by_user(users, c, lambda u: [
+        (u["driver"], "GET", "/api/profile", None, None)] * 5))
+
+    admins = [new_driver() for _ in range(c)]
+    for admin in admins:
+        admin.call("POST", "/api/admin/login", {"username": "admin", "password": "admin"})
+    phases["admin"] = run_phase("admin", [
+        [(admin, "GET", ADMIN_PATHS[n % len(ADMIN_PATHS)], None, None) for n in range(args.admin)]
+        for admin in admins])
+    return phases
+
+
+# --- Baseline comparison ---
+def compare(phases, baseline, tolerance):
+    problems = []
+    for name, now in phases.items():
+        if now["errors"]:
+            problems.append(f"{name}: {now['errors']} failed requests, e.g. {now['error_samples'][0]}")
+        base = baseline["phases"].get(name)
+        if not base:
+            continue
+        p95_change = now["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rps_change = now["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        print(f"{name:<10} p95 {base['p95_ms']:8.2f} -> {now['p95_ms']:8.2f} ms ({p95_change:+.0%})   "
+              f"req/s {base['rps']:8.1f} -> {now['rps']:8.1f} ({rps_change:+.0%})")
+        if p95_change > tolerance:
+            problems.append(f"{name}: p95 {p95_change:+.0%} vs baseline")
+        if rps_change < -tolerance:
+            problems.append(f"{name}: throughput {rps_change:+.0%} vs baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=("client", "gunicorn"), default="client")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chats", type=int, default=50, help="chat messages per user")
+    parser.add_argument("--transfers", type=int, default=10, help="transfers per user")
+    parser.add_argument("--admin", type=int, default=20, help="admin requests per thread")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bankbot-loadtest-")
+    db_path = os.path.join(tmp, "loadtest.db")
+    server = None
+    try:
+        if args.target == "gunicorn":
+            server, base_url = start_gunicorn(db_path, args.workers)
+            phases = run_load(lambda: HttpDriver(base_url), args)
+        else:
+            os.environ["BANKBOT_DB_PATH"] = db_path
+            os.environ.setdefault("BANKBOT_MODEL_LOAD", "eager")
+            import app
+            phases = run_load(lambda: ClientDriver(app.app), args)
+            app.chat_log_writer.flush()
+    finally:
+        if server:
+            server.terminate()
+            server.wait(30)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    result = {
+        "meta": {"target": args.target, "users": args.users, "concurrency": args.concurrency,
+                 "chats": args.chats, "transfers": args.transfers, "admin": args.admin,
+                 "workers": args.workers if args.target == "gunicorn" else None, "seed": args.seed,
+                 "python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count(), "created": datetime.utcnow().isoformat(timespec="seconds")},
+        "phases": phases,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    problems = [f"{n}: {p['errors']} failed requests, e.g. {p['error_samples'][0]}"
+                for n, p in phases.items() if p["errors"]]
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("target") != args.target:
+            print(f"Warning: baseline target is {baseline['meta'].get('target')}, this run is {args.target}")
+        problems = compare(phases, baseline, args.tolerance)
+
+    if problems:
+        print("FAILED:")
+        for p in problems:
+            print("  " + p)
+        sys.exit(1)
+    print("OK: no failed requests" + (f", within {args.tolerance:.0%} of the baseline." if args.compare else "."))
+
+
+if __name__ == "__main__":
+    main()
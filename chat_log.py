@@ -0,0 +1,343 @@
+import atexit
+import csv
+import glob
+import io
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+INSERT_SQL = """
+    INSERT INTO chat_history (user_id, timestamp, user_message, bot_response, detected_intent, confidence)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+OVERFLOW_POLICIES = ("block", "drop", "spill")
+ORPHAN_SCAN_INTERVAL = 60.0  # seconds between looks for spill files of exited workers
+
+
+class ChatLogWriter:
+    """
+    Background sink for chat_history rows.
+    Turns are queued by the request thread and written by a single daemon
+    thread with executemany, one transaction per batch. A batch is flushed
+    once batch_size rows are waiting or flush_interval seconds have passed.
+
+    When the queue is full the overflow policy decides what happens:
+      block - the request thread waits for room
+      drop  - the row is discarded (counted in stats["dropped"])
+      spill - the row is appended to this process's spill file and replayed on the next flush
+
+    Each process spills to its own file (spill_path with the pid before the
+    extension), so gunicorn workers never read or remove rows another one is
+    appending. Files left by exited processes are claimed with an atomic
+    rename and replayed by whichever worker gets there first.
+
+    on_batch(conn, rows) hooks run inside each batch's transaction, e.g.
+    analytics.update_rollups.
+    """
+
+    def __init__(self, pool, batch_size=200, flush_interval=0.5, max_queue=10000,
+                 overflow="block", spill_path=None, on_batch=()):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        if overflow == "spill" and not spill_path:
+            raise ValueError("spill_path is required for the 'spill' overflow policy")
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.on_batch = list(on_batch)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._next_orphan_scan = 0.0
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self.stats = {"written": 0, "batches": 0, "dropped": 0, "spilled": 0, "errors": 0, "write_seconds": 0.0}
+
+    # --- Producer side (request threads) ---
+    def log(self, user_id, timestamp, user_message, bot_response, intent, confidence):
+        self._ensure_started()
+        row = (user_id, timestamp, user_message, bot_response, intent, confidence)
+        if self.overflow == "block":
+            self._queue.put(row)
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.overflow == "drop":
+                self._count("dropped")
+            else:
+                self._spill([row])
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each gunicorn worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+            self._thread.start()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    # --- Consumer side (writer thread) ---
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+        self._write(self._drain())
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _write(self, batch):
+        batch = self._take_spilled() + batch
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            with self.pool.transaction() as conn:
+                conn.executemany(INSERT_SQL, batch)
+                for hook in self.on_batch:
+                    hook(conn, batch)
+            with self._stats_lock:
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["write_seconds"] += time.perf_counter() - started
+        except Exception as e:
+            self._count("errors")
+            print(f"Error logging chat history: {e}")
+            if self.spill_path:
+                self._spill(batch)
+
+    # --- Spill files ---
+    def _spill_file(self, pid):
+        root, ext = os.path.splitext(self.spill_path)
+        return f"{root}.{pid}{ext}"
+
+    def _spill(self, rows):
+        with self._spill_lock:
+            with open(self._spill_file(os.getpid()), "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+        self._count("spilled", len(rows))
+
+    def _orphaned_spill_files(self):
+        """Spill files of processes that no longer run, plus the old shared spill_path."""
+        root, ext = os.path.splitext(self.spill_path)
+        orphans = [self.spill_path]
+        for path in glob.glob(glob.escape(root) + ".*" + ext):
+            pid = path[len(root) + 1:len(path) - len(ext)]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                orphans.append(path)
+            except OSError:
+                pass  # alive, owned by another user
+        return orphans
+
+    def _claim(self, path):
+        """Renames path to a name only this process uses and returns its rows."""
+        claimed = f"{path}.replay-{os.getpid()}"
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            return []  # nothing spilled, or another worker claimed it first
+        with open(claimed, "r", encoding="utf-8") as f:
+            rows = [tuple(json.loads(line)) for line in f if line.strip()]
+        os.remove(claimed)
+        return rows
+
+    def _take_spilled(self):
+        if not self.spill_path:
+            return []
+        with self._spill_lock:
+            rows = self._claim(self._spill_file(os.getpid()))
+            if time.monotonic() >= self._next_orphan_scan:
+                self._next_orphan_scan = time.monotonic() + ORPHAN_SCAN_INTERVAL
+                for path in self._orphaned_spill_files():
+                    rows.extend(self._claim(path))
+        return rows
+
+    # --- Shutdown ---
+    def flush(self, timeout=5.0):
+        """Writes everything queued so far and waits for the writer to finish."""
+        if self._thread is None or self._pid != os.getpid():
+            self._write(self._drain())
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats_snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats, queued=self._queue.qsize())
+
+
+def create_writer(pool, spill_dir, on_batch=()):
+    """Builds the app's writer from BANKBOT_CHATLOG_* settings and flushes it at exit."""
+    writer = ChatLogWriter(
+        pool,
+        batch_size=int(os.environ.get("BANKBOT_CHATLOG_BATCH", "200")),
+        flush_interval=float(os.environ.get("BANKBOT_CHATLOG_INTERVAL", "0.5")),
+        max_queue=int(os.environ.get("BANKBOT_CHATLOG_QUEUE", "10000")),
+        overflow=os.environ.get("BANKBOT_CHATLOG_OVERFLOW", "block"),
+        spill_path=os.path.join(spill_dir, "chat_history.spill.jsonl"),
+        on_batch=on_batch,
+    )
+    atexit.register(writer.flush)
+    return writer
+
+
+# =================================================================
+# --- Reading chat_history (admin history endpoint) ---
+# =================================================================
+
+# Indexes for keyset pagination, newest first, optionally narrowed by intent or user
+HISTORY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_chat_history_ts ON chat_history (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_history_intent_ts ON chat_history (detected_intent, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_history_user_ts ON chat_history (user_id, timestamp, id)",
+)
+
+HISTORY_COLUMNS = "ch.id, ch.timestamp, ch.user_id, ch.user_message, ch.detected_intent, ch.confidence"
+MAX_PAGE_SIZE = 1000
+
+
+def parse_history_filters(args):
+    """
+    Turns request args into (where_clauses, params).
+    Supported: from / to (ISO date or datetime), intent, user_id,
+    min_confidence / max_confidence. Raises ValueError on bad input.
+    """
+    where, params = [], []
+    if args.get("from"):
+        where.append("ch.timestamp >= ?")
+        params.append(datetime.fromisoformat(args["from"]).isoformat())
+    if args.get("to"):
+        to = datetime.fromisoformat(args["to"])
+        if len(args["to"]) == 10:
+            # A bare date includes the whole day
+            where.append("ch.timestamp < ?")
+            params.append((to + timedelta(days=1)).isoformat())
+        else:
+            where.append("ch.timestamp <= ?")
+            params.append(to.isoformat())
+    if args.get("intent"):
+        where.append("ch.detected_intent = ?")
+        params.append(args["intent"])
+    if args.get("user_id"):
+        where.append("ch.user_id = ?")
+        params.append(int(args["user_id"]))
+    if args.get("min_confidence"):
+        where.append("ch.confidence >= ?")
+        params.append(float(args["min_confidence"]))
+    if args.get("max_confidence"):
+        where.append("ch.confidence <= ?")
+        params.append(float(args["max_confidence"]))
+    return where, params
+
+
+def encode_cursor(row):
+    return f"{row[1]}|{row[0]}"
+
+
+def decode_cursor(cursor):
+    timestamp, _, row_id = cursor.rpartition("|")
+    if not timestamp:
+        raise ValueError("Invalid cursor.")
+    return timestamp, int(row_id)
+
+
+def fetch_history_page(pool, where, params, cursor=None, limit=100):
+    """
+    One page of history, newest first, using keyset pagination on
+    (timestamp, id). Returns (rows, next_cursor); next_cursor is None on the
+    last page.
+    """
+    where, params = list(where), list(params)
+    if cursor:
+        where.append("(ch.timestamp, ch.id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    sql = f"SELECT {HISTORY_COLUMNS} FROM chat_history ch"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ch.timestamp DESC, ch.id DESC LIMIT ?"
+    rows = pool.execute(sql, params + [limit + 1])
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def iter_history(pool, where, params, chunk_size=MAX_PAGE_SIZE):
+    """Yields every matching row, fetching one keyset page at a time."""
+    cursor = None
+    while True:
+        rows, cursor = fetch_history_page(pool, where, params, cursor, chunk_size)
+        yield from rows
+        if cursor is None:
+            return
+
+
+def history_item(row):
+    """Row -> the dict the admin page renders (date is the YYYY-MM-DD prefix of the ISO timestamp)."""
+    timestamp = row[1] or ""
+    return {
+        "id": row[0],
+        "query": row[3],
+        "intent": row[4],
+        "confidence": row[5],
+        "user_id": row[2],
+        "date": timestamp[:10] if len(timestamp) >= 10 and timestamp[4] == "-" else "N/A",
+    }
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(history_item(row)) + "\n"
+
+
+def stream_csv(rows, chunk=500):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["id", "timestamp", "user_id", "query", "intent", "confidence"])
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % chunk == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
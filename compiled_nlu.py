@@ -0,0 +1,604 @@
+import json
+import mmap
+import os
+import re
+import struct
+
+import numpy as np
+
+# Pure-NumPy copy of the trained textcat_multilabel model (TextCatEnsemble.v2:
+# bag-of-words SparseLinear | hashed-embedding CNN, then Linear + Logistic).
+# train.py compiles every saved model into COMPILED_FILE next to it; the app
+# serves from it with BANKBOT_NLU_BACKEND=numpy, without importing spaCy.
+# The tokenizer, string hashing and feature hashing are re-implemented here
+# so the scores match spaCy's to within PARITY_TOLERANCE.
+
+COMPILED_FILE = "textcat.compiled"
+MAGIC = b"BANKNLU1"
+ALIGN = 64                # byte alignment of each array in the file
+PARITY_TOLERANCE = 1e-4   # max abs score difference accepted by verify()
+ARCHITECTURE = "spacy.TextCatEnsemble.v2"
+FEATURE_COLUMNS = ["NORM", "LOWER", "PREFIX", "SUFFIX", "SHAPE"]
+ORTH, NORM = 65, 67       # spaCy attribute ids used in tokenizer rules
+TOKEN_CACHE_SIZE = 20000  # memoized per-token rows (about 350 bytes each)
+
+_M32 = 0xFFFFFFFF
+
+
+class CompiledModelError(ValueError):
+    """The model cannot be compiled, or the compiled file cannot be read."""
+
+
+# --- String ids (spaCy's StringStore hashing) ---
+def hash_string(text, seed=1):
+    """MurmurHash64A of the UTF-8 bytes, as spaCy's hash_string."""
+    data = text.encode("utf-8")
+    m, r, mask = 0xC6A4A7935BD1E995, 47, 0xFFFFFFFFFFFFFFFF
+    h = (seed ^ (len(data) * m)) & mask
+    n = len(data) // 8
+    for k in struct.unpack_from(f"<{n}Q", data):
+        k = (k * m) & mask
+        k ^= k >> r
+        k = (k * m) & mask
+        h = ((h ^ k) * m) & mask
+    tail = data[n * 8:]
+    if tail:
+        h = ((h ^ int.from_bytes(tail, "little")) * m) & mask
+    h ^= h >> r
+    h = (h * m) & mask
+    return h ^ (h >> r)
+
+
+# --- Feature hashing (thinc's MurmurHash3 variants, vectorized over uint64 keys) ---
+def _rotl32(x, r):
+    return (x << np.uint32(r)) | (x >> np.uint32(32 - r))
+
+
+def _rotl64(x, r):
+    return (x << np.uint64(r)) | (x >> np.uint64(64 - r))
+
+
+def _fmix64(k):
+    k = k ^ (k >> np.uint64(33))
+    k = k * np.uint64(0xFF51AFD7ED558CCD)
+    k = k ^ (k >> np.uint64(33))
+    k = k * np.uint64(0xC4CEB9FE1A85EC53)
+    return k ^ (k >> np.uint64(33))
+
+
+def murmur3_32(keys, seed):
+    """MurmurHash3_x86_32 of each uint64 key's 8 bytes (SparseLinear buckets)."""
+    c1, c2 = np.uint32(0xCC9E2D51), np.uint32(0x1B873593)
+    h = np.full(keys.shape, seed, dtype=np.uint32)
+    for block in ((keys & np.uint64(_M32)).astype(np.uint32), (keys >> np.uint64(32)).astype(np.uint32)):
+        k = _rotl32(block * c1, 15) * c2
+        h = _rotl32(h ^ k, 13) * np.uint32(5) + np.uint32(0xE6546B64)
+    h = h ^ np.uint32(8)
+    h = h ^ (h >> np.uint32(16))
+    h = h * np.uint32(0x85EBCA6B)
+    h = h ^ (h >> np.uint32(13))
+    h = h * np.uint32(0xC2B2AE35)
+    return h ^ (h >> np.uint32(16))
+
+
+def murmur3_128(keys, seed):
+    """MurmurHash3_x64_128 of each uint64 key as four uint32 words (HashEmbed rows)."""
+    k1 = _rotl64(keys * np.uint64(0x87C37B91114253D5), 31) * np.uint64(0x4CF5AD432745937F)
+    h1 = (np.uint64(seed) ^ k1) ^ np.uint64(8)
+    h2 = np.full(keys.shape, seed ^ 8, dtype=np.uint64)
+    h1 = h1 + h2
+    h2 = h2 + h1
+    h1, h2 = _fmix64(h1), _fmix64(h2)
+    h1 = h1 + h2
+    h2 = h2 + h1
+    lo = np.uint64(_M32)
+    return np.stack([h1 & lo, h1 >> np.uint64(32), h2 & lo, h2 >> np.uint64(32)], axis=1)
+
+
+# --- Token features (spaCy's lexical attribute getters) ---
+def word_shape(text):
+    if len(text) >= 100:
+        return "LONG"
+    shape, last, seq = [], "", 0
+    for char in text:
+        if char.isalpha():
+            shape_char = "X" if char.isupper() else "x"
+        elif char.isdigit():
+            shape_char = "d"
+        else:
+            shape_char = char
+        if shape_char == last:
+            seq += 1
+        else:
+            seq = 0
+            last = shape_char
+        if seq < 4:
+            shape.append(shape_char)
+    return "".join(shape)
+
+
+# --- Tokenizer (port of spacy.tokenizer.Tokenizer for the exported rules) ---
+class Tokenizer:
+    """
+    Whitespace split, special cases, prefix/suffix/infix regexes, url match
+    and the special-case matcher pass, in spaCy's order. Returns
+    [(orth, norm or None)] per text; norm is only set by special cases.
+    """
+
+    def __init__(self, spec):
+        def compiled(pattern):
+            return re.compile(pattern) if pattern else None
+
+        self.prefix = compiled(spec["prefix"])
+        self.suffix = compiled(spec["suffix"])
+        self.infix = compiled(spec["infix"])
+        self.token_match = compiled(spec["token_match"])
+        self.url_match = compiled(spec["url_match"])
+        self.rules = {string: [tuple(t) for t in tokens] for string, tokens in spec["rules"]}
+        # Special cases that affix splitting can break up are re-joined afterwards
+        self.patterns = {}
+        self._cache = {}
+        for string in self.rules:
+            if self._find(self.prefix, string) or self._find(self.suffix, string) \
+                    or self._infixes(string) or " " in string:
+                orths = tuple(t[0] for t in self._tokenize(string, False))
+                self.patterns.setdefault(len(orths), set()).add(orths)
+        self.pattern_starts = {p[0] for patterns in self.patterns.values() for p in patterns}
+
+    @staticmethod
+    def _find(regex, string):
+        match = regex.search(string) if regex else None
+        return match.end() - match.start() if match else 0
+
+    def _infixes(self, string):
+        return list(self.infix.finditer(string)) if self.infix else []
+
+    def __call__(self, text):
+        tokens = self._tokenize(text, True)
+        if self.patterns and len(tokens) > 1:
+            tokens = self._apply_special_cases(tokens)
+        return [(orth, norm) for orth, norm, _ in tokens]
+
+    def _tokenize(self, text, specials):
+        """[(orth, norm, space_after)] before the matcher pass."""
+        tokens = []
+        if not text:
+            return tokens
+        start, in_ws = 0, text[0].isspace()
+        for i, char in enumerate(text):
+            if char.isspace() != in_ws:
+                if start < i:
+                    self._span(text[start:i], tokens, specials)
+                if char == " ":
+                    tokens[-1] = tokens[-1][:2] + (True,)
+                    start = i + 1
+                else:
+                    start = i
+                in_ws = not in_ws
+        if start < len(text):
+            self._span(text[start:], tokens, specials)
+        return tokens
+
+    def _special(self, string, tokens, specials):
+        rule = self.rules.get(string) if specials else None
+        if rule:
+            tokens.extend((orth, norm, False) for orth, norm in rule)
+        return bool(rule)
+
+    def _span(self, string, tokens, specials):
+        cached = self._cache.get((string, specials))
+        if cached is None:
+            cached = []
+            self._split_span(string, cached, specials)
+            if len(self._cache) >= TOKEN_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[(string, specials)] = cached
+        tokens.extend(cached)
+
+    def _split_span(self, string, tokens, specials):
+        if self._special(string, tokens, specials):
+            return
+        prefixes, suffixes = [], []
+        last_size = 0
+        while string and len(string) != last_size:
+            if self.token_match and self.token_match.match(string):
+                break
+            if specials and string in self.rules:
+                break
+            last_size = len(string)
+            pre_len = self._find(self.prefix, string)
+            if pre_len:
+                prefix, minus_pre = string[:pre_len], string[pre_len:]
+                if minus_pre and specials and minus_pre in self.rules:
+                    string = minus_pre
+                    prefixes.append(prefix)
+                    break
+            suf_len = self._find(self.suffix, string[pre_len:])
+            if suf_len:
+                suffix, minus_suf = string[-suf_len:], string[:-suf_len]
+                if minus_suf and specials and minus_suf in self.rules:
+                    string = minus_suf
+                    suffixes.append(suffix)
+                    break
+            if pre_len and suf_len and pre_len + suf_len <= len(string):
+                string = string[pre_len:-suf_len]
+                prefixes.append(prefix)
+                suffixes.append(suffix)
+            elif pre_len:
+                string = minus_pre
+                prefixes.append(prefix)
+            elif suf_len:
+                string = minus_suf
+                suffixes.append(suffix)
+
+        tokens.extend((p, None, False) for p in prefixes)
+        if string and not self._special(string, tokens, specials):
+            if (self.token_match and self.token_match.match(string)) or \
+                    (self.url_match and self.url_match.match(string)):
+                tokens.append((string, None, False))
+            else:
+                start = 0
+                for match in self._infixes(string):
+                    if match.start() == 0:
+                        continue
+                    if match.start() != start:
+                        tokens.append((string[start:match.start()], None, False))
+                    if match.start() != match.end():
+                        tokens.append((string[match.start():match.end()], None, False))
+                    start = match.end()
+                if string[start:]:
+                    tokens.append((string[start:], None, False))
+        tokens.extend((s, None, False) for s in reversed(suffixes))
+
+    def _apply_special_cases(self, tokens):
+        orths = [t[0] for t in tokens]
+        matches = [(n, i) for i, orth in enumerate(orths) if orth in self.pattern_starts
+                   for n, patterns in self.patterns.items() if tuple(orths[i:i + n]) in patterns]
+        if not matches:
+            return tokens
+        # Longest first, then rightmost; overlapping matches are dropped
+        taken, spans = set(), {}
+        for n, i in sorted(matches, reverse=True):
+            if i not in taken and i + n - 1 not in taken:
+                spans[i] = n
+            taken.update(range(i, i + n))
+        out, i = [], 0
+        while i < len(tokens):
+            n = spans.get(i)
+            if n is None:
+                out.append(tokens[i])
+                i += 1
+                continue
+            text = "".join(t[0] + (" " if t[2] and j < n - 1 else "") for j, t in enumerate(tokens[i:i + n]))
+            rule = self.rules.get(text)
+            if rule:
+                out.extend((orth, norm, False) for orth, norm in rule)
+                out[-1] = out[-1][:2] + (tokens[i + n - 1][2],)
+            else:
+                out.extend(tokens[i:i + n])
+            i += n
+        return out
+
+
+# --- Dense layers ---
+def _maxout(X, W, b, pieces):
+    Y = X @ W + b
+    return Y.reshape(len(X), pieces, -1).max(axis=1)
+
+
+def _layer_norm(X, G, b):
+    centered = X - X.mean(axis=1, keepdims=True)
+    var = (centered * centered).mean(axis=1, keepdims=True) + np.float32(1e-8)
+    return centered / np.sqrt(var) * G + b
+
+
+def _sigmoid(X):
+    return np.float32(1.0) / (np.float32(1.0) + np.exp(-X))
+
+
+def _expand_window(X, window):
+    """Each row concatenated with its `window` neighbours on both sides (zeros past the ends)."""
+    n = len(X)
+    padded = np.concatenate([np.zeros((window, X.shape[1]), X.dtype), X,
+                             np.zeros((window, X.shape[1]), X.dtype)])
+    return np.concatenate([padded[i:i + n] for i in range(2 * window + 1)], axis=1)
+
+
+class CompiledDoc:
+    """Stand-in for a spaCy Doc: the chat path only reads .cats."""
+    __slots__ = ("cats",)
+
+    def __init__(self, cats):
+        self.cats = cats
+
+
+class CompiledIntentModel:
+    """
+    Loaded COMPILED_FILE: callable like an nlp object (model(text).cats,
+    model.pipe(texts)), and predict(texts) returns the (n, labels) scores.
+    The weight arrays are read-only views of the memory-mapped file, so
+    forked workers share one copy of them.
+    """
+    backend = "numpy"
+
+    def __init__(self, header, arrays, source=None):
+        self.header = header
+        self.source = source
+        self.labels = header["labels"]
+        self.tokenizer = Tokenizer(header["tokenizer"])
+        self.symbols = header["symbols"]
+        self.norms = header["norm_exceptions"]
+        self.pad = header["pad"]
+        self.window = header["window"]
+        self.pieces = header["pieces"]
+        self.bow_length = header["bow_length"]
+        self.seeds = header["embed_seeds"]
+        self.a = arrays
+        self._string_ids = {}
+        self._token_cache = {}
+
+    def _string_id(self, text):
+        sid = self._string_ids.get(text)
+        if sid is None:
+            if not text:
+                sid = 0
+            else:
+                sid = self.symbols.get(text)
+                if sid is None:
+                    sid = hash_string(text)
+            if len(self._string_ids) > TOKEN_CACHE_SIZE:
+                self._string_ids.clear()
+            self._string_ids[text] = sid
+        return sid
+
+    def _features(self, orth, norm):
+        """[ORTH, NORM, LOWER, PREFIX, SUFFIX, SHAPE] string ids of one token."""
+        lower = orth.lower()
+        return [self._string_id(s) for s in (
+            orth, norm if norm is not None else self.norms.get(orth, lower), lower, orth[:1], orth[-3:],
+            word_shape(orth))]
+
+    def _token_vectors(self, tokens):
+        """
+        Per-token (bag-of-words scores, embedding) rows. Both depend on the
+        token alone, so they are memoized; tokens not seen before are hashed
+        and embedded together in one vectorized pass. The result is built
+        from what this call found or computed, never read back from the
+        shared cache another request thread may clear in between.
+        """
+        a, cache = self.a, self._token_cache
+        found, missing = {}, []
+        for t in dict.fromkeys(tokens):
+            hit = cache.get(t)
+            if hit is None:
+                missing.append(t)
+            else:
+                found[t] = hit
+        if missing:
+            if len(cache) + len(missing) > TOKEN_CACHE_SIZE:
+                cache.clear()
+            feats = np.array([self._features(orth, norm) for orth, norm in missing], dtype=np.uint64)
+            # Bag of words: two hashed buckets of the ORTH id; unused buckets hit the zero row
+            bow = np.zeros((len(missing), len(self.labels)), dtype=np.float32)
+            for seed in (0, 1):
+                bucket = murmur3_32(feats[:, 0], seed) % np.uint32(self.bow_length)
+                pos = np.minimum(np.searchsorted(a["bow_buckets"], bucket), len(a["bow_buckets"]) - 1)
+                bow += a["bow_rows"][np.where(a["bow_buckets"][pos] == bucket, pos, len(a["bow_buckets"]))]
+            # Hashed embeddings of NORM, LOWER, PREFIX, SUFFIX, SHAPE -> Maxout -> LayerNorm
+            embedded = []
+            for col, seed in enumerate(self.seeds):
+                E = a[f"embed{col}"]
+                rows = (murmur3_128(feats[:, col + 1], seed) % np.uint64(len(E))).astype(np.intp)
+                embedded.append(E[rows].sum(axis=1))
+            X = _layer_norm(_maxout(np.concatenate(embedded, axis=1), a["reduce_W"], a["reduce_b"], self.pieces),
+                            a["reduce_G"], a["reduce_beta"])
+            for i, token in enumerate(missing):
+                found[token] = cache[token] = (bow[i], X[i])
+        vectors = [found[t] for t in tokens]
+        return np.stack([v[0] for v in vectors]), np.stack([v[1] for v in vectors])
+
+    def predict(self, texts):
+        a = self.a
+        docs = [self.tokenizer(text) for text in texts]
+        lengths = np.array([len(doc) for doc in docs], dtype=np.int64)
+        n_docs, n_tokens = len(docs), int(lengths.sum())
+        if n_tokens == 0:
+            return np.zeros((n_docs, len(self.labels)), dtype=np.float32)
+        bow, X = self._token_vectors([token for doc in docs for token in doc])
+        doc_of = np.repeat(np.arange(n_docs), lengths)
+        segments = np.zeros((n_docs, n_tokens), dtype=np.float32)
+        segments[doc_of, np.arange(n_tokens)] = 1.0
+        bow = _sigmoid(segments @ bow + a["bow_b"])
+
+        # CNN encoder runs over the whole batch with `pad` zero rows around each
+        # doc, as thinc's with_array does (the pad rows stop being zero after layer 1)
+        rows = np.arange(n_tokens) + self.pad * (doc_of + 1)
+        flat = np.zeros((n_tokens + self.pad * (n_docs + 1), X.shape[1]), dtype=np.float32)
+        flat[rows] = X
+        for layer in range(self.header["encoder_depth"]):
+            Y = _maxout(_expand_window(flat, self.window), a[f"enc{layer}_W"], a[f"enc{layer}_b"], self.pieces)
+            flat = flat + _layer_norm(Y, a[f"enc{layer}_G"], a[f"enc{layer}_beta"])
+        X = flat[rows]
+
+        # Parametric attention: per-doc softmax of X @ Q, weighted sum
+        att = X @ a["attn_Q"]
+        doc_max = np.full(n_docs, -np.inf, dtype=np.float32)
+        np.maximum.at(doc_max, doc_of, att)
+        att = np.exp(att - doc_max[doc_of])
+        att = att / (segments @ att)[doc_of]
+        pooled = segments @ (X * att[:, None])
+        pooled = pooled + _layer_norm(_maxout(pooled, a["tail_W"], a["tail_b"], self.pieces),
+                                      a["tail_G"], a["tail_beta"])
+
+        return _sigmoid(np.concatenate([bow, pooled], axis=1) @ a["out_W"] + a["out_b"])
+
+    def pipe(self, texts, batch_size=32):
+        texts = list(texts)
+        for i in range(0, len(texts), batch_size):
+            chunk = texts[i:i + batch_size]
+            for scores in self.predict(chunk):
+                yield CompiledDoc(dict(zip(self.labels, scores.tolist())))
+
+    def __call__(self, text):
+        return next(self.pipe([text]))
+
+
+# --- Export (needs spaCy; run by train.py) ---
+def _textcat_arrays(model):
+    """Walks the thinc model of a TextCatEnsemble.v2 textcat; returns (header fields, arrays)."""
+    by_name = {}
+    for node in model.walk():
+        by_name.setdefault(node.name, []).append(node)
+
+    def nodes(name, count):
+        found = sorted(by_name.get(name, []), key=lambda n: n.id)
+        if len(found) != count:
+            raise CompiledModelError(f"Unsupported textcat model: expected {count} '{name}' layers, got {len(found)}.")
+        return found
+
+    def param(node, name):
+        return np.ascontiguousarray(node.get_param(name), dtype=np.float32)
+
+    def maxout(node):
+        # (nO, nP, nI) -> (nI, nP * nO): X @ W gives the pieces as contiguous blocks
+        W = param(node, "W").transpose(1, 0, 2)
+        return W.reshape(-1, W.shape[2]).T.copy(), param(node, "b").T.reshape(-1).copy()
+
+    ngrams, = nodes("extract_ngrams", 1)
+    features, = nodes("extract_features", 1)
+    sparse, = nodes("sparse_linear", 1)
+    attention, = nodes("para-attn", 1)
+    output, = nodes("linear", 1)
+    embeds = sorted(nodes("hashembed", len(FEATURE_COLUMNS)), key=lambda n: n.attrs["column"])
+    windows = nodes("expand_window", 2)
+    maxouts = nodes("maxout", 4)
+    norms = nodes("layernorm", 4)
+    padded = [n for name, found in by_name.items() if name.startswith("with_array(") for n in found
+              if n.attrs.get("pad")]
+    if ngrams.attrs["ngram_size"] != 1 or ngrams.attrs["attr"] != ORTH:
+        raise CompiledModelError("Unsupported textcat model: bag of words must be ORTH unigrams.")
+    if list(features.attrs["columns"]) != FEATURE_COLUMNS:
+        raise CompiledModelError(f"Unsupported textcat model: embedding features {features.attrs['columns']}.")
+    if sparse.attrs.get("v1_indexing"):
+        raise CompiledModelError("Unsupported textcat model: SparseLinear v1 indexing.")
+    if len(padded) != 1 or len({w.attrs["window_size"] for w in windows}) != 1:
+        raise CompiledModelError("Unsupported textcat model: encoder layout.")
+
+    n_labels, length = sparse.get_dim("nO"), sparse.get_dim("length")
+    W = param(sparse, "W").reshape(n_labels, length)
+    buckets = np.flatnonzero(np.any(W != 0, axis=0)).astype(np.uint32)
+    arrays = {
+        "bow_buckets": buckets,
+        # one row per used bucket, plus a zero row for buckets no training token hit
+        "bow_rows": np.concatenate([W[:, buckets].T, np.zeros((1, n_labels), np.float32)]),
+        "bow_b": param(sparse, "b"),
+        "attn_Q": param(attention, "Q"),
+        "out_W": param(output, "W").T.copy(),
+        "out_b": param(output, "b"),
+    }
+    for col, node in enumerate(embeds):
+        arrays[f"embed{col}"] = param(node, "E")
+    for prefix, mo, ln in zip(["reduce", "enc0", "enc1", "tail"], maxouts, norms):
+        arrays[f"{prefix}_W"], arrays[f"{prefix}_b"] = maxout(mo)
+        arrays[f"{prefix}_G"], arrays[f"{prefix}_beta"] = param(ln, "G"), param(ln, "b")
+    return {
+        "bow_length": length,
+        "embed_seeds": [node.attrs["seed"] for node in embeds],
+        "pieces": maxouts[0].get_dim("nP"),
+        "window": windows[0].attrs["window_size"],
+        "pad": padded[0].attrs["pad"],
+        "encoder_depth": 2,
+    }, arrays
+
+
+def _tokenizer_spec(tokenizer):
+    def pattern(fn):
+        if fn is None:
+            return None
+        regex = getattr(fn, "__self__", None)
+        if not hasattr(regex, "pattern"):
+            raise CompiledModelError("Tokenizer uses a custom (non-regex) affix function.")
+        return regex.pattern
+
+    return {
+        "prefix": pattern(tokenizer.prefix_search),
+        "suffix": pattern(tokenizer.suffix_search),
+        "infix": pattern(tokenizer.infix_finditer),
+        "token_match": pattern(tokenizer.token_match),
+        "url_match": pattern(tokenizer.url_match),
+        "rules": [[string, [[t[ORTH], t.get(NORM)] for t in tokens]]
+                  for string, tokens in sorted(tokenizer.rules.items())],
+    }
+
+
+def _norm_exceptions(nlp, base_norms):
+    """Lexeme NORM overrides: the vocab's lexeme_norm table, then spaCy's base norms."""
+    norms = dict(base_norms)
+    if nlp.vocab.lookups.has_table("lexeme_norm"):
+        norms.update(nlp.vocab.lookups.get_table("lexeme_norm").items())
+    return norms
+
+
+def export(nlp, path, pipe="textcat_multilabel"):
+    """Compiles nlp's textcat into `path` (written atomically); returns the byte size."""
+    from spacy.lang.norm_exceptions import BASE_NORMS
+    from spacy.symbols import IDS
+
+    textcat = nlp.get_pipe(pipe)
+    config = nlp.config["components"][pipe]["model"]
+    if config.get("@architectures") != ARCHITECTURE:
+        raise CompiledModelError(f"Unsupported textcat architecture: {config.get('@architectures')}.")
+    fields, arrays = _textcat_arrays(textcat.model)
+    header = dict(fields, architecture=ARCHITECTURE, labels=list(textcat.labels),
+                  tokenizer=_tokenizer_spec(nlp.tokenizer), symbols={k: v for k, v in IDS.items() if k},
+                  norm_exceptions=_norm_exceptions(nlp, BASE_NORMS),
+                  arrays={})
+
+    offset = 0
+    for name, arr in arrays.items():
+        header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+    raw = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(raw)) // ALIGN) * ALIGN
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(raw)) + raw)
+        for name, arr in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+    return data_start + offset
+
+
+def verify(nlp, model, texts, pipe="textcat_multilabel", batch_size=64):
+    """Max abs score difference between spaCy and the compiled model on texts."""
+    texts = list(texts)
+    if not texts:
+        return 0.0
+    labels = list(nlp.get_pipe(pipe).labels)
+    expected = np.array([[doc.cats[label] for label in labels] for doc in nlp.pipe(texts, batch_size=batch_size)],
+                        dtype=np.float32)
+    got = np.concatenate([model.predict(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+    return float(np.abs(expected - got).max())
+
+
+# --- Load ---
+def load(path):
+    """Memory-maps a COMPILED_FILE; raises OSError if missing, CompiledModelError if unreadable."""
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buf[:len(MAGIC)] != MAGIC:
+        raise CompiledModelError(f"{path} is not a compiled NLU model.")
+    size, = struct.unpack_from("<Q", buf, len(MAGIC))
+    header_end = len(MAGIC) + 8 + size
+    header = json.loads(buf[len(MAGIC) + 8:header_end].decode("utf-8"))
+    data_start = -(-header_end // ALIGN) * ALIGN
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(buf, dtype=dtype, count=count,
+                                     offset=data_start + spec["offset"]).reshape(shape)
+    return CompiledIntentModel(header, arrays, source=path)
@@ -0,0 +1,131 @@
+import csv
+import os
+import sqlite3
+import sys
+import threading
+from collections import namedtuple
+import db
+import storage
+
+# --- Paths ---
+APP_ROOT = os.path.dirname(__file__)
+CSV_PATH = os.path.join(APP_ROOT, "banking_queries.csv")
+DB_PATH = os.environ.get("BANKBOT_DB_PATH", os.path.join(APP_ROOT, "data.db"))
+
+
+# --- Helper function to load data from CSV ---
+def load_csv_nlu_data():
+    csv_data = []
+    try:
+        with open(CSV_PATH, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                text = row.get('text', '').strip()
+                intent = row.get('intent', '').strip()
+                if text and intent:
+                    csv_data.append((text, intent))
+    except FileNotFoundError:
+        print(f"Warning: {CSV_PATH} not found. Using only DB data.")
+    except Exception as e:
+        print(f"Error reading CSV file: {e}")
+    return csv_data
+
+# --- Helper function to load data from DB (Admin-added) ---
+def load_db_nlu_data():
+    db_data = []
+    try:
+        db_data = storage.nlu_pairs(db.get_pool(DB_PATH))
+    except sqlite3.OperationalError:
+        print("Warning: Database or nlu_data table not found. Using only CSV data.")
+    except Exception as e:
+        print(f"Error reading DB nlu_data: {e}")
+    return db_data
+
+# --- Helper function to load ALL data (CSV + DB) ---
+def read_nlu_sources():
+    """CSV examples followed by DB examples, as stored (uncached, not deduplicated)."""
+    return load_csv_nlu_data() + load_db_nlu_data()
+
+def merge_nlu_data(pairs):
+    # Use a dictionary to store combined data and automatically handle duplicates
+    combined = {}
+    for text, intent in pairs:
+        # Ensure text is lowercase for consistency
+        combined[text.lower()] = intent
+
+    return list(combined.items()) # Returns [(text, intent), ...]
+
+def read_combined_nlu_data():
+    """Reads and merges CSV + DB examples from scratch (uncached)."""
+    return merge_nlu_data(read_nlu_sources())
+
+# --- Memoized corpus ---
+# examples: ((text, intent), ...) with interned intent strings; intents: sorted tuple;
+# sources: every (text, intent) row as read, before later rows override earlier ones
+Corpus = namedtuple("Corpus", ["examples", "intents", "sources"])
+
+
+def change_token():
+    """
+    (CSV mtime/size, nlu_data change counter); None when the counter cannot
+    be read, which disables caching. The counter lives in the database, so an
+    edit made through any worker or node invalidates every process's cache.
+    """
+    try:
+        st = os.stat(CSV_PATH)
+        csv_part = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        csv_part = None
+    try:
+        return csv_part, storage.nlu_change_count(db.get_pool(DB_PATH))
+    except Exception:
+        return None
+
+
+class CorpusCache:
+    """
+    Holds the merged corpus until token() changes. A hit costs one stat()
+    and one single-row read instead of re-parsing the CSV and scanning nlu_data.
+    """
+
+    def __init__(self, read=read_nlu_sources, token=change_token):
+        self.read = read
+        self.token = token
+        self._lock = threading.Lock()
+        self._token = None
+        self._corpus = None
+        self.stats = {"hits": 0, "loads": 0}
+
+    def get(self):
+        token = self.token()  # read before loading: an edit racing the load just forces another reload
+        with self._lock:
+            if token is not None and token == self._token:
+                self.stats["hits"] += 1
+                return self._corpus
+        sources = tuple((text, sys.intern(intent)) for text, intent in self.read())
+        examples = tuple(merge_nlu_data(sources))
+        corpus = Corpus(examples, tuple(sorted({intent for _, intent in examples if intent})), sources)
+        with self._lock:
+            self._token, self._corpus = token, corpus
+            self.stats["loads"] += 1
+        return corpus
+
+    def clear(self):
+        with self._lock:
+            self._token = self._corpus = None
+
+
+corpus_cache = CorpusCache()
+
+
+def load_combined_nlu_data():
+    """[(text, intent), ...] from CSV + DB, memoized; treat the result as read-only."""
+    return corpus_cache.get().examples
+
+def load_nlu_sources():
+    """Every CSV + DB row before merging (a text may appear with several intents), memoized."""
+    return corpus_cache.get().sources
+
+# --- Helper function to get intents from ALL data ---
+def get_intents_from_combined_source():
+    return list(corpus_cache.get().intents)
@@ -0,0 +1,512 @@
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import unquote, urlsplit
+
+# --- Connection settings ---
+# WAL lets readers run alongside the single writer, and synchronous=NORMAL
+# only fsyncs at checkpoints instead of on every commit.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache per connection
+    "PRAGMA mmap_size=134217728",    # 128 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+BUSY_TIMEOUT = 5.0          # seconds to wait on a locked database
+STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
+
+
+class ConnectionPool:
+    """
+    Hands out one sqlite3 connection per thread and keeps it open for reuse.
+    Connections are tagged with the pid that opened them so a gunicorn worker
+    never reuses a handle inherited from the master process. A connection
+    whose thread has exited is closed the next time a thread opens one, so
+    short-lived threads do not leave file handles behind.
+    With pooled=False every call gets a fresh connection (the old behaviour).
+    """
+
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+
+    def __init__(self, path, pooled=True):
+        self.path = path
+        self.pooled = pooled
+        self.dialect = Dialect()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = []  # (pid, thread, connection) of every pooled connection
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+        )
+        if self.pooled:
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+        return conn
+
+    def connection(self):
+        """Returns this thread's connection, opening it on first use."""
+        if not self.pooled:
+            return self._open()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._open()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            with self._lock:
+                dead = self._prune()
+                self._conns.append((os.getpid(), threading.current_thread(), conn))
+            for old in dead:
+                self._close(old)
+        return conn
+
+    def _prune(self):
+        """Drops entries of exited threads and other processes; returns this process's ones to close."""
+        pid = os.getpid()
+        dead, live = [], []
+        for entry in self._conns:
+            if entry[0] != pid:
+                continue  # inherited across fork: never touch the parent's handle
+            (live if entry[1].is_alive() else dead).append(entry)
+        self._conns = live
+        return [entry[2] for entry in dead]
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def release(self, conn):
+        """Closes the connection if it is not a pooled one."""
+        if not self.pooled:
+            conn.close()
+
+    def execute(self, query, args=()):
+        """Runs one statement, committing only if it opened a write transaction."""
+        conn = self.connection()
+        try:
+            cur = conn.execute(query, args)
+            rv = cur.fetchall()
+            if conn.in_transaction:
+                conn.commit()
+            return rv
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Yields a connection; commits on success and rolls back on error."""
+        conn = self.connection()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def begin(self, conn, write=False):
+        """Opens a transaction; write=True takes the write lock up front."""
+        conn.execute(self.dialect.begin_write if write else self.dialect.begin_read)
+
+    def is_busy(self, error):
+        """True if error means the database was locked by another writer."""
+        return self.dialect.is_busy(error)
+
+    def schema_version(self, conn):
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def set_schema_version(self, conn, version):
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+
+    def close_all(self):
+        """Closes every pooled connection opened by this process."""
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for pid, _, conn in conns:
+            if pid == os.getpid():
+                self._close(conn)
+        self._local = threading.local()
+
+
+# --- Shared pools (one per database file) ---
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """
+    Returns the process-wide pool for a database path, or for the server
+    database in BANKBOT_DB_URL when that is set (see open_server_pool).
+    """
+    url = os.environ.get("BANKBOT_DB_URL")
+    key = url or os.path.abspath(path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if url:
+                pool = _pools[key] = open_server_pool(url)
+            else:
+                pooled = os.environ.get("BANKBOT_DB_POOL", "1") != "0"
+                pool = _pools[key] = ConnectionPool(key, pooled=pooled)
+        return pool
+
+
+# =================================================================
+# --- Server databases (MySQL / PostgreSQL), shared by several app nodes ---
+# =================================================================
+# Queries throughout the app are written for SQLite; a Dialect rewrites the
+# few constructs that differ (placeholders, DDL types, upserts, BEGIN).
+
+_PLACEHOLDER_RE = re.compile(r"'[^']*'|%|\?")
+_AUTOINCREMENT_RE = re.compile(r"INTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT", re.IGNORECASE)
+_TEXT_COLUMN_RE = re.compile(r"\b(\w+)\s+TEXT\b", re.IGNORECASE)
+_UPSERT_RE = re.compile(r"ON\s+CONFLICT\s*\([^)]*\)\s*DO\s+UPDATE\s+SET", re.IGNORECASE)
+_INSERT_TABLE_RE = re.compile(r"INSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+
+
+class Dialect:
+    """SQLite itself; also what the in-process stand-in server speaks."""
+
+    name = "sqlite"
+    placeholder = "?"
+    begin_read = "BEGIN"
+    begin_write = "BEGIN IMMEDIATE"
+
+    def __init__(self, driver=sqlite3):
+        self.Error = driver.Error
+        self.IntegrityError = driver.IntegrityError
+        self._cache = {}
+
+    def translate(self, sql, has_args):
+        key = (sql, has_args)
+        out = self._cache.get(key)
+        if out is None:
+            out = sql
+            head = sql.lstrip()[:6].upper()
+            if head == "CREATE":
+                out = self.ddl(out)
+            elif head == "INSERT" and _UPSERT_RE.search(out):
+                out = self.upsert(out)
+            if self.placeholder != "?":
+                out = self._placeholders(out, has_args)
+            self._cache[key] = out
+        return out
+
+    def _placeholders(self, sql, has_args):
+        # "?" -> "%s"; a literal "%" must be doubled once the driver formats args
+        def sub(m):
+            token = m.group(0)
+            if token == "?":
+                return self.placeholder
+            if token == "%":
+                return "%%" if has_args else "%"
+            return token
+        return _PLACEHOLDER_RE.sub(sub, sql)
+
+    def ddl(self, sql):
+        return sql
+
+    def upsert(self, sql):
+        return sql
+
+    def is_busy(self, error):
+        message = str(error).lower()
+        return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+    def ignorable(self, error, sql):
+        return False
+
+
+class MySQLDialect(Dialect):
+    name = "mysql"
+    placeholder = "%s"
+    begin_read = "START TRANSACTION WITH CONSISTENT SNAPSHOT"
+    begin_write = None  # InnoDB row locks; the conditional debit is atomic as is
+    # Free-text columns; every other TEXT column is keyed or indexed and
+    # MySQL cannot index TEXT without a prefix length
+    LONG_TEXT_COLUMNS = {"user_message", "bot_response", "bot_reply", "result"}
+
+    def ddl(self, sql):
+        sql = _AUTOINCREMENT_RE.sub("INTEGER PRIMARY KEY AUTO_INCREMENT", sql)
+        sql = _TEXT_COLUMN_RE.sub(
+            lambda m: f"{m.group(1)} {'TEXT' if m.group(1) in self.LONG_TEXT_COLUMNS else 'VARCHAR(191)'}", sql
+        )
+        return re.sub(r"CREATE\s+INDEX\s+IF\s+NOT\s+EXISTS", "CREATE INDEX", sql, flags=re.IGNORECASE)
+
+    def upsert(self, sql):
+        sql = _UPSERT_RE.sub("ON DUPLICATE KEY UPDATE", sql)
+        return re.sub(r"\bexcluded\.(\w+)", r"VALUES(\1)", sql)
+
+    def is_busy(self, error):
+        # Lock wait timeout, deadlock
+        return getattr(error, "errno", None) in (1205, 1213)
+
+    def ignorable(self, error, sql):
+        # CREATE INDEX has no IF NOT EXISTS: "duplicate key name" means it is already there
+        return getattr(error, "errno", None) == 1061
+
+
+class PostgresDialect(Dialect):
+    name = "postgresql"
+    placeholder = "%s"
+    begin_read = None   # the driver opens the transaction implicitly
+    begin_write = None
+
+    def ddl(self, sql):
+        sql = _AUTOINCREMENT_RE.sub("SERIAL PRIMARY KEY", sql)
+        # SQLite REAL is 8 bytes; PostgreSQL REAL is only 4
+        return re.sub(r"\bREAL\b", "DOUBLE PRECISION", sql, flags=re.IGNORECASE)
+
+    def upsert(self, sql):
+        # "turns = turns + excluded.turns" is ambiguous in PostgreSQL; qualify the existing row
+        table = _INSERT_TABLE_RE.search(sql).group(1)
+        return re.sub(r"\b(\w+)\s*=\s*\1\s*\+", rf"\1 = {table}.\1 +", sql)
+
+    def is_busy(self, error):
+        # serialization_failure, deadlock_detected, lock_not_available
+        return getattr(error, "pgcode", None) in ("40001", "40P01", "55P03")
+
+
+class ServerCursor:
+    """DB-API cursor that accepts the app's SQLite-flavoured SQL."""
+
+    def __init__(self, raw, conn):
+        self._raw = raw
+        self._conn = conn
+
+    def execute(self, sql, args=()):
+        dialect = self._conn.dialect
+        self._conn.in_transaction = True
+        try:
+            if args:
+                self._raw.execute(dialect.translate(sql, True), tuple(args))
+            else:
+                self._raw.execute(dialect.translate(sql, False))
+        except dialect.Error as e:
+            if not dialect.ignorable(e, sql):
+                raise
+        return self
+
+    def executemany(self, sql, seq):
+        self._conn.in_transaction = True
+        self._raw.executemany(self._conn.dialect.translate(sql, True), [tuple(args) for args in seq])
+        return self
+
+    def __getattr__(self, name):
+        # fetchone / fetchall / rowcount / lastrowid / description
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self._raw.fetchall())
+
+
+class ServerConnection:
+    """Wraps a driver connection with the sqlite3.Connection methods the app uses."""
+
+    def __init__(self, raw, dialect):
+        self.raw = raw
+        self.dialect = dialect
+        self.in_transaction = False
+
+    def cursor(self):
+        return ServerCursor(self.raw.cursor(), self)
+
+    def execute(self, sql, args=()):
+        return self.cursor().execute(sql, args)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def commit(self):
+        self.raw.commit()
+        self.in_transaction = False
+
+    def rollback(self):
+        self.raw.rollback()
+        self.in_transaction = False
+
+    def close(self):
+        self.raw.close()
+
+
+SCHEMA_VERSION_TABLE = "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied_at TEXT)"
+
+
+class ServerPool:
+    """
+    Same interface as ConnectionPool, backed by a shared server database.
+    Connections are checked out per call or transaction (and reused if the
+    thread re-enters), at most max_connections at a time per process, and
+    kept open for reuse. Like ConnectionPool, idle connections inherited
+    across a fork are discarded, never shared with the parent.
+    """
+
+    def __init__(self, connect, dialect, max_connections=10):
+        self._connect = connect
+        self.dialect = dialect
+        self.Error = dialect.Error
+        self.IntegrityError = dialect.IntegrityError
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._local = threading.local()
+
+    def connection(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+        self._slots.acquire()
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = ServerConnection(self._connect(), self.dialect)
+        except Exception:
+            self._slots.release()
+            raise
+        self._local.conn, self._local.depth = conn, 1
+        return conn
+
+    def release(self, conn):
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._idle.append(conn)
+        self._slots.release()
+
+    def execute(self, query, args=()):
+        conn = self.connection()
+        try:
+            cur = conn.execute(query, args)
+            rv = cur.fetchall() if cur.description else []
+            if conn.in_transaction and self._local.depth == 1:
+                conn.commit()
+            return rv
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def begin(self, conn, write=False):
+        sql = self.dialect.begin_write if write else self.dialect.begin_read
+        if sql:
+            conn.execute(sql)
+
+    def is_busy(self, error):
+        return self.dialect.is_busy(error)
+
+    def schema_version(self, conn):
+        conn.execute(SCHEMA_VERSION_TABLE)
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+    def set_schema_version(self, conn, version):
+        conn.execute("INSERT INTO schema_version (version, applied_at) VALUES (?, CURRENT_TIMESTAMP)", (version,))
+
+    def close_all(self):
+        with self._lock:
+            conns, self._idle = self._idle, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def _mysql_connect(url):
+    import mysql.connector  # optional: only needed for mysql:// URLs
+
+    def connect():
+        return mysql.connector.connect(
+            host=url.hostname, port=url.port or 3306, user=unquote(url.username or ""),
+            password=unquote(url.password or ""), database=url.path.lstrip("/"), autocommit=False,
+        )
+    return connect, MySQLDialect(mysql.connector)
+
+
+def _postgres_connect(url):
+    import psycopg2  # optional: only needed for postgresql:// URLs
+
+    def connect():
+        return psycopg2.connect(url.geturl())
+    return connect, PostgresDialect(psycopg2)
+
+
+def _standin_connect(url):
+    # In-process stand-in for a server: separate SQLite connections to one
+    # file, driven through ServerPool exactly like a real server
+    path = url.path
+
+    def connect():
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    return connect, Dialect(sqlite3)
+
+
+SERVER_SCHEMES = {
+    "mysql": _mysql_connect,
+    "postgresql": _postgres_connect,
+    "postgres": _postgres_connect,
+    "standin": _standin_connect,
+}
+
+
+def open_server_pool(url, max_connections=None):
+    """ServerPool for a mysql://, postgresql:// or standin:///path URL."""
+    parsed = urlsplit(url)
+    if parsed.scheme not in SERVER_SCHEMES:
+        raise ValueError(f"Unsupported database URL scheme: {parsed.scheme!r}")
+    connect, dialect = SERVER_SCHEMES[parsed.scheme](parsed)
+    if max_connections is None:
+        max_connections = int(os.environ.get("BANKBOT_DB_POOL_SIZE", "10"))
+    return ServerPool(connect, dialect, max_connections)
@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# An intent waiting for the user to fill its missing slots, e.g. a transfer
+# that still needs an amount. slots: the entities collected so far;
+# missing: the slot names the bot asked for, most wanted first; uid: the
+# user it was asked for (None when logged out), so it never answers for another.
+Pending = namedtuple("Pending", ["intent", "slots", "missing", "uid"])
+
+DIALOGUE_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS dialogue_state (
+        session_key TEXT PRIMARY KEY,
+        intent TEXT NOT NULL,
+        slots TEXT NOT NULL,   -- JSON object of the slots filled so far
+        missing TEXT NOT NULL, -- comma-separated slot names still wanted
+        expires REAL NOT NULL  -- unix time after which the state is ignored
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_dialogue_state_expires ON dialogue_state (expires)",
+)
+# Added by a later migration; DIALOGUE_TABLES is what migration 4 released
+DIALOGUE_UID_COLUMN = "ALTER TABLE dialogue_state ADD COLUMN uid INTEGER"
+
+DEFAULT_TTL = 300.0  # seconds a pending question stays answerable
+
+
+class DialogueStateStore:
+    """
+    Pending intent per chat session, in process memory. Bounded LRU of
+    session key -> Pending; entries older than `ttl` are treated as absent.
+    take() removes the state it returns, so every turn either answers the
+    pending question or abandons it.
+
+    Per process: with several gunicorn workers a follow-up may land on a
+    worker that never saw the question; use DatabaseDialogueStore there.
+    """
+
+    backing = "memory"
+
+    def __init__(self, max_sessions=10000, ttl=DEFAULT_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"saved": 0, "hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def save(self, key, pending):
+        with self._lock:
+            self._data[key] = (pending, time.monotonic())
+            self._data.move_to_end(key)
+            self.stats["saved"] += 1
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def take(self, key):
+        """Removes and returns the session's Pending, or None."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if self.ttl and time.monotonic() - entry[1] > self.ttl:
+                self.stats["expired"] += 1
+                return None
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats_snapshot(self):
+        with self._lock:
+            return dict(self.stats, backing=self.backing, size=len(self._data),
+                        max_sessions=self.max_sessions, ttl=self.ttl)
+
+
+class DatabaseDialogueStore:
+    """
+    Same interface, kept in the dialogue_state table of the shared database
+    so every gunicorn worker (or app node, on a server database) sees the
+    question another one asked. Only the turn right after a question reaches
+    the table (app.chat pops the session's key); expired rows are purged
+    every `purge_every` saves.
+
+    take() looks the row up with a plain read; only when there is one does
+    it open a write transaction, which deletes the row and returns it if
+    that DELETE removed it, so two requests of the same session racing on
+    different workers cannot both answer one question.
+    """
+
+    backing = "database"
+
+    def __init__(self, pool, ttl=DEFAULT_TTL, purge_every=100):
+        self.pool = pool
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._lock = threading.Lock()
+        self.stats = {"saved": 0, "hits": 0, "misses": 0, "expired": 0, "purged": 0}
+
+    def _count(self, event, n=1):
+        with self._lock:
+            self.stats[event] += n
+            return self.stats[event]
+
+    def save(self, key, pending):
+        self.pool.execute(
+            "INSERT INTO dialogue_state (session_key, intent, slots, missing, uid, expires) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (session_key) DO UPDATE SET intent = excluded.intent, slots = excluded.slots, "
+            "missing = excluded.missing, uid = excluded.uid, expires = excluded.expires",
+            (key, pending.intent, json.dumps(pending.slots), ",".join(pending.missing), pending.uid,
+             time.time() + (self.ttl or 365 * 86400)))
+        if self._count("saved") % self.purge_every == 0:
+            self.purge()
+
+    def take(self, key):
+        select = "SELECT intent, slots, missing, uid, expires FROM dialogue_state WHERE session_key = ?"
+        row = None
+        if self.pool.execute(select, (key,)):
+            # Only now queue for the write lock; most turns answer no question
+            with self.pool.transaction() as conn:
+                self.pool.begin(conn, write=True)
+                row = conn.execute(select, (key,)).fetchone()
+                # Lost the race if another request's DELETE got there first
+                if row is not None and conn.execute("DELETE FROM dialogue_state WHERE session_key = ?",
+                                                    (key,)).rowcount != 1:
+                    row = None
+        if row is None:
+            self._count("misses")
+            return None
+        intent, slots, missing, uid, expires = row
+        if expires < time.time():
+            self._count("expired")
+            return None
+        self._count("hits")
+        return Pending(intent, json.loads(slots), tuple(m for m in missing.split(",") if m), uid)
+
+    def discard(self, key):
+        self.pool.execute("DELETE FROM dialogue_state WHERE session_key = ?", (key,))
+
+    def purge(self):
+        with self.pool.transaction() as conn:
+            cur = conn.execute("DELETE FROM dialogue_state WHERE expires < ?", (time.time(),))
+            removed = max(cur.rowcount, 0)
+        self._count("purged", removed)
+        return removed
+
+    def stats_snapshot(self):
+        rows = self.pool.execute("SELECT COUNT(*) FROM dialogue_state")
+        with self._lock:
+            return dict(self.stats, backing=self.backing, size=rows[0][0] if rows else 0, ttl=self.ttl)
+
+
+def create_store(pool):
+    """
+    Store picked by BANKBOT_DIALOGUE_STORE: memory (default), db (shared by
+    every worker) or off. BANKBOT_DIALOGUE_TTL sets how long a question
+    stays pending, BANKBOT_DIALOGUE_SIZE the in-memory session bound.
+    """
+    kind = os.environ.get("BANKBOT_DIALOGUE_STORE", "memory")
+    ttl = float(os.environ.get("BANKBOT_DIALOGUE_TTL", DEFAULT_TTL))
+    if kind == "off":
+        return None
+    if kind == "db":
+        return DatabaseDialogueStore(pool, ttl=ttl)
+    if kind != "memory":
+        raise ValueError(f"Unknown BANKBOT_DIALOGUE_STORE {kind!r} (memory, db or off)")
+    return DialogueStateStore(max_sessions=int(os.environ.get("BANKBOT_DIALOGUE_SIZE", "10000")), ttl=ttl)
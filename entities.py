@@ -0,0 +1,93 @@
+import re
+
+# One compiled pattern, scanned once per message. Alternatives are ordered so
+# that at any position the most specific reading wins (a date before a bare
+# number, a "card" before a "loan", a currency amount before an account).
+# Every entity starts at a word boundary, so the leading (?<!\w) lets the
+# scanner skip positions inside words without trying each alternative.
+_NUMBER = r"\d+(?:,\d+)*(?:\.\d+)?"
+
+_ENTITY_RE = re.compile(
+    r"(?<!\w)(?:"
+    r"(?P<date>\b\d{1,2}[/-]\d{1,2}[/-](?:\d{4}|\d{2})\b)"
+    rf"|(?:₹|\binr\b|\brs\b\.?|\$)\s*(?P<cur_amount>{_NUMBER})"
+    r"|\b(?:a/c|acct|actno|account(?:\s+(?:number|no\.?))?|ac)\s*[:#]?\s*(?P<account>\d{4,18})\b"
+    rf"|(?P<unit_amount>{_NUMBER})\s*(?:rupees?\b|rs\b\.?|inr\b|dollars?\b|usd\b|bucks\b)"
+    r"|(?P<day>\b(?:yesterday|today|tomorrow)\b"
+    r"|\b(?:last|this|next|past)\s+(?:\d+\s+)?(?:days?|weeks?|months?|years?)\b"
+    r"|\b\d+\s+(?:days|weeks|months)\b)"
+    r"|(?P<card>\b(?:credit|debit|visa|atm|prepaid|rupay|business|platinum|gold|master)\s*card\b"
+    r"|\bmastercard\b)"
+    r"|(?P<loan>\b(?:personal|home|education|student|business|car|gold|mortgage|agriculture|property)"
+    r"\s+loans?\b)"
+    r"|(?P<account_type>\b(?:joint|salary|student|zero\s+balance|fixed\s+deposit|recurring\s+deposit)"
+    r"\s+account\b|\bsavings\b(?:\s+account\b)?|\bchecking\b(?:\s+account\b)?"
+    r"|\bcurrent\s+account\b|(?<=my\s)current\b)"
+    rf"|(?P<number>\b{_NUMBER}\b)"
+    r")",
+    re.IGNORECASE,
+)
+
+_SPACES_RE = re.compile(r"\s+")
+_PREV_WORD_RE = re.compile(r"(\w+)\W*$")
+
+# Canonical names (keys are lowercased, single-spaced matches)
+_CARD_NAMES = {"master card": "mastercard"}
+_ACCOUNT_TYPE_NAMES = {
+    "savings account": "savings",
+    "current account": "current",
+    "checking": "checking account",
+}
+
+
+def _canonical(text, names):
+    key = _SPACES_RE.sub(" ", text.lower())
+    if key.endswith("loans"):
+        key = key[:-1]
+    return names.get(key, key)
+
+
+def extract_entities(text, prefer=None):
+    """
+    Pulls banking slots out of a message in one regex pass.
+    Returns a dict with any of: amount (float), account_number (digits),
+    card_type, account_type, loan_type, date, day.
+
+    A number with a currency (₹, INR, Rs, $) or unit (rupees, dollars) is an
+    amount; one after "account"/"a/c"/"AC" is an account number. Remaining
+    bare numbers fill the amount first, unless they follow "to" and are
+    long enough (6+ digits) to be an account, and then the account number,
+    so the same digits are never used for both. prefer="account_number"
+    (the bot just asked for an account) fills the account first instead.
+    """
+    ent = {}
+    bare = []
+    for m in _ENTITY_RE.finditer(text):
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind in ("cur_amount", "unit_amount"):
+            ent.setdefault("amount", float(value.replace(",", "")))
+        elif kind == "account":
+            ent.setdefault("account_number", value)
+        elif kind == "number":
+            prev = _PREV_WORD_RE.search(text, 0, m.start())
+            bare.append((value, prev.group(1).lower() if prev else ""))
+        elif kind == "card":
+            ent.setdefault("card_type", _canonical(value, _CARD_NAMES))
+        elif kind == "loan":
+            ent.setdefault("loan_type", _canonical(value, {}))
+        elif kind == "account_type":
+            ent.setdefault("account_type", _canonical(value, _ACCOUNT_TYPE_NAMES))
+        else:
+            ent.setdefault(kind, value.lower() if kind == "day" else value)
+
+    for value, prev in bare:
+        digits = value.isdigit()
+        looks_like_account = digits and 4 <= len(value) <= 18
+        if prefer == "account_number" and "account_number" not in ent and looks_like_account:
+            ent["account_number"] = value
+        elif "amount" not in ent and not (prev == "to" and looks_like_account and len(value) >= 6):
+            ent["amount"] = float(value.replace(",", ""))
+        elif "account_number" not in ent and looks_like_account:
+            ent["account_number"] = value
+    return ent
@@ -0,0 +1,17 @@
+# Picked up automatically by `gunicorn app:app` (see Procfile).
+import gc
+import os
+
+# Import the app once in the master: migrations run once, and the spaCy model
+# is loaded before fork so every worker shares its pages copy-on-write
+# instead of loading (and holding) its own copy.
+preload_app = True
+os.environ.setdefault("BANKBOT_MODEL_LOAD", "eager")
+
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the cyclic GC's reach; otherwise the
+    # first collection in each worker touches (and so copies) every shared page
+    gc.freeze()
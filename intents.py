@@ -0,0 +1,65 @@
+import threading
+from collections import namedtuple
+
+# Everything a handler may need about the current chat turn
+Turn = namedtuple("Turn", ["message", "intent", "score", "entities", "uid", "logged_in"])
+
+# Built-in replies for intents that need no account data.
+# Admin-entered nlu_data.bot_reply values override these.
+DEFAULT_REPLIES = {
+    "greeting": "Hello there! How can I help you today?",
+    "greeting_hi": "Hello there! How can I help you today?",
+    "goodbye": "It was nice assisting you. Have a great day!",
+    "greeting_bye": "It was nice assisting you. Have a great day!",
+    "lost_card": "I'm sorry to hear that. To block your card, please call our 24/7 helpline at 1800-123-4567 or visit our nearest branch.",
+    "apply_loan": "We offer a variety of loans including personal, home, and student loans. Please visit our website or a branch to discuss your options with a loan officer.",
+    "get_interest_rate": "Interest rates vary based on the loan type and current market conditions. Please contact a loan advisor for a personalized quote.",
+    "get_branch_details": "You can find your nearest branch by using our branch locator tool on the website. Please provide your city or zip code for the best results.",
+    "create_account": "You can open a new account online in minutes! Click the 'Register' button on the homepage or visit a branch with your ID and address proof.",
+    "close_account": "To close an account, you must visit a branch and submit a formal request. Please bring your ID and account documents.",
+    "unknown": "Sorry, I didn't understand that. Could you please rephrase?",
+}
+FALLBACK_REPLY = "Sorry, I didn’t understand that. Could you please rephrase?"
+
+
+class IntentRegistry:
+    """
+    intent -> reply, resolved with one dict lookup per turn.
+    Code handlers (registered with @registry.handler) cover intents that
+    read account data; every other intent is answered from a static reply
+    table built from DEFAULT_REPLIES plus nlu_data.bot_reply. The table is
+    rebuilt by load_replies() after admin edits and model reloads, never
+    per request, and swapped in as a whole.
+    """
+
+    def __init__(self, default_replies=DEFAULT_REPLIES, fallback=FALLBACK_REPLY):
+        self.default_replies = dict(default_replies)
+        self.fallback = fallback
+        self.handlers = {}
+        self.replies = dict(default_replies)
+        self._reload_lock = threading.Lock()
+
+    def handler(self, *intent_names):
+        """Decorator: registers fn(turn) -> reply for the given intents."""
+        def register(fn):
+            for name in intent_names:
+                self.handlers[name] = fn
+            return fn
+        return register
+
+    def load_replies(self, pool):
+        """Rebuilds the static reply table; the newest nlu_data row per intent wins."""
+        with self._reload_lock:
+            rows = pool.execute(
+                "SELECT intent, bot_reply FROM nlu_data "
+                "WHERE bot_reply IS NOT NULL AND bot_reply != '' ORDER BY timestamp, id"
+            )
+            replies = dict(self.default_replies)
+            replies.update(rows)
+            self.replies = replies
+
+    def dispatch(self, turn):
+        fn = self.handlers.get(turn.intent)
+        if fn is not None:
+            return fn(turn)
+        return self.replies.get(turn.intent, self.fallback)
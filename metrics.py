@@ -0,0 +1,169 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# BANKBOT_METRICS=0 turns every observe()/inc()/stage() into an early return
+ENABLED = os.environ.get("BANKBOT_METRICS", "1") != "0"
+
+# Seconds: from sub-millisecond cache hits up to a cold model load
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, count in items:
+            yield f"{self.name}{_labels(self.labels, values)} {_number(count)}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._values.items())
+        for values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(self.labels, values, ('le', _number(bound)))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {count}"
+
+
+class Registry:
+    """
+    Metrics owned here plus collectors: callables returning
+    [(name, type, help, [(labels_dict, value), ...]), ...] read at scrape
+    time, for stats other components already keep (caches, chat log writer).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                lines.append(f"# collector {getattr(fn, '__name__', fn)} failed: {_escape(e)}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# --- Per-request stage timing ---
+# Stages are collected per thread while a request runs and observed once it
+# finishes, when the labels (route, intent) are known.
+_current = threading.local()
+
+
+def start_request():
+    if ENABLED:
+        _current.stages = []
+
+
+def finish_request():
+    """Returns [(stage, seconds), ...] recorded since start_request(), repeats of a stage summed."""
+    stages = getattr(_current, "stages", None)
+    _current.stages = None
+    totals = {}
+    for name, seconds in stages or ():
+        totals[name] = totals.get(name, 0.0) + seconds
+    return list(totals.items())
+
+
+@contextmanager
+def stage(name):
+    stages = getattr(_current, "stages", None)
+    if stages is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages.append((name, time.perf_counter() - started))
@@ -0,0 +1,50 @@
+from collections import namedtuple
+
+# version: schema version the migration brings the database to (1, 2, ...)
+# apply(cursor): runs inside the migration transaction; must be safe to run
+# against a database that already has some of its objects (IF NOT EXISTS)
+Migration = namedtuple("Migration", ["version", "description", "apply"])
+
+
+def statements(*ddl):
+    """Migration body that runs the given SQL statements in order."""
+    def apply(c):
+        for sql in ddl:
+            c.execute(sql)
+    return apply
+
+
+def migrate(pool, migrations, target=None):
+    """
+    Brings the database up to the newest migration (or `target`) and records
+    the version (PRAGMA user_version on SQLite, a schema_version table on
+    server databases). Each migration commits on its own, so a failure
+    leaves the database at the last version that fully applied.
+    On SQLite, BEGIN IMMEDIATE serialises gunicorn workers starting at the
+    same time: the first one migrates, the others find nothing left to do.
+    On a server, a node that loses the race to record a version skips it.
+    Returns (version_before, version_after).
+    """
+    migrations = sorted(migrations, key=lambda m: m.version)
+    target = migrations[-1].version if target is None else target
+    with pool.transaction() as conn:
+        before = pool.schema_version(conn)
+    if before > migrations[-1].version:
+        print(f"Database schema v{before} is newer than this code (v{migrations[-1].version}).")
+
+    for m in migrations:
+        if m.version > target:
+            break
+        try:
+            with pool.transaction() as conn:
+                pool.begin(conn, write=True)
+                if pool.schema_version(conn) >= m.version:
+                    continue
+                m.apply(conn.cursor())
+                pool.set_schema_version(conn, m.version)
+        except pool.IntegrityError:
+            continue  # another node recorded this version first
+        print(f"Applied schema migration v{m.version}: {m.description}")
+
+    with pool.transaction() as conn:
+        return before, pool.schema_version(conn)
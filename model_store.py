@@ -0,0 +1,201 @@
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- Paths ---
+APP_ROOT = os.path.dirname(__file__)
+MODELS_DIR = os.path.join(APP_ROOT, "models")
+BASE_MODEL_PATH = os.path.join(MODELS_DIR, "nlu_model")    # used until a version is published
+VERSIONS_DIR = os.path.join(MODELS_DIR, "versions")
+CURRENT_POINTER = os.path.join(MODELS_DIR, "CURRENT")      # name of the live version
+STATUS_PATH = os.path.join(MODELS_DIR, "retrain_status.json")
+STATUS_LOCK_PATH = STATUS_PATH + ".lock"                  # flock()ed while a job is being claimed
+TRAIN_SCRIPT = os.path.join(APP_ROOT, "train.py")
+
+KEEP_VERSIONS = 3          # published versions kept on disk (the live one is never pruned)
+STALE_JOB_AFTER = 3600     # seconds before a "running" status is ignored even if its worker still runs
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+# --- Versions ---
+def new_version():
+    """Returns (name, path) for a fresh, not yet published model directory."""
+    name = datetime.utcnow().strftime("v%Y%m%d-%H%M%S-%f")
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    return name, os.path.join(VERSIONS_DIR, name)
+
+
+def current_version():
+    """Name of the published version, or None if serving the base model."""
+    try:
+        with open(CURRENT_POINTER, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if name and os.path.isdir(os.path.join(VERSIONS_DIR, name)) else None
+
+
+def model_path(version):
+    return os.path.join(VERSIONS_DIR, version) if version else BASE_MODEL_PATH
+
+
+def publish(name):
+    """Atomically points CURRENT at a trained version and prunes old ones."""
+    _write_atomic(CURRENT_POINTER, name + "\n")
+    prune()
+
+
+def prune(keep=KEEP_VERSIONS):
+    if not os.path.isdir(VERSIONS_DIR):
+        return
+    live = current_version()
+    versions = sorted(d for d in os.listdir(VERSIONS_DIR) if d.startswith("v"))
+    for name in versions[:-keep] if keep else versions:
+        if name != live:
+            shutil.rmtree(os.path.join(VERSIONS_DIR, name), ignore_errors=True)
+
+
+def read_report(path):
+    """The train_report.json written next to a trained model, if any."""
+    try:
+        with open(os.path.join(path, "train_report.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+# --- Retrain status (shared by all workers through the status file) ---
+def read_status():
+    try:
+        with open(STATUS_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"state": "idle"}
+
+
+def write_status(**status):
+    _write_atomic(STATUS_PATH, json.dumps(status))
+    return status
+
+
+@contextmanager
+def status_lock():
+    """Exclusive lock across workers, held from reading the status to claiming a job."""
+    os.makedirs(os.path.dirname(STATUS_LOCK_PATH), exist_ok=True)
+    with open(STATUS_LOCK_PATH, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _job_abandoned(status):
+    """True if a "running" status was left by a worker that died or was restarted."""
+    pid = status.get("pid")
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True  # RetrainJob.start checked first: no job thread runs in this worker
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # alive, owned by another user
+    return False
+
+
+class RetrainJob:
+    """
+    Runs `python train.py --output <version dir>` in a child process so the
+    web worker keeps serving, then publishes the new version. Workers notice
+    the CURRENT pointer change and hot-swap their model on their own.
+    """
+
+    def __init__(self, train_args=()):
+        self.train_args = list(train_args)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, extra_args=(), mode="full"):
+        """Starts a job; returns (started, status)."""
+        with self._lock, status_lock():
+            status = read_status()
+            if self._thread is not None and self._thread.is_alive():
+                return False, status
+            if (status.get("state") == "running" and not _job_abandoned(status)
+                    and time.time() - status.get("started_ts", 0) < STALE_JOB_AFTER):
+                return False, status
+
+            name, path = new_version()
+            status = write_status(state="running", version=name, mode=mode, started_ts=time.time(),
+                                  started_at=datetime.utcnow().isoformat(), pid=os.getpid())
+            self._thread = threading.Thread(target=self._run, args=(name, path, status, list(extra_args)),
+                                            name="retrain-job", daemon=True)
+            self._thread.start()
+            return True, status
+
+    def _run(self, name, path, status, extra_args):
+        t0 = time.perf_counter()
+        cmd = [sys.executable, TRAIN_SCRIPT, "--output", path] + self.train_args + extra_args
+        try:
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0 or not os.path.isdir(path):
+                output = (proc.stderr or proc.stdout).strip().splitlines()
+                raise RuntimeError(output[-1] if output else f"train.py exited with {proc.returncode}")
+            publish(name)
+            write_status(**dict(status, state="succeeded", finished_at=datetime.utcnow().isoformat(),
+                                duration_s=round(time.perf_counter() - t0, 2), report=read_report(path)))
+        except Exception as e:
+            shutil.rmtree(path, ignore_errors=True)
+            write_status(**dict(status, state="failed", error=str(e),
+                                finished_at=datetime.utcnow().isoformat(),
+                                duration_s=round(time.perf_counter() - t0, 2)))
+            print(f"Retraining error: {e}")
+
+
+class VersionWatcher:
+    """
+    Per-worker check of the CURRENT pointer, throttled to one file read per
+    `interval` seconds. When it changes, `reload(version)` runs on a
+    background thread; requests keep using the old model until it swaps.
+    """
+
+    def __init__(self, reload, interval=1.0):
+        self.reload = reload
+        self.interval = interval
+        self.loaded_version = None
+        self._next_check = 0.0
+        self._loading = threading.Lock()
+
+    def check(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.interval
+        version = current_version()
+        if version == self.loaded_version or not self._loading.acquire(blocking=False):
+            return
+        threading.Thread(target=self._reload, args=(version,), name="model-reload", daemon=True).start()
+
+    def _reload(self, version):
+        try:
+            self.reload(version)
+        finally:
+            # A version that failed to load is not retried on every check
+            self.loaded_version = version
+            self._loading.release()
@@ -0,0 +1,103 @@
+import zlib
+
+import numpy as np
+
+from nlu_engine import normalize_for_match
+
+# Second-stage intent lookup for turns the model is not confident about:
+# hashed character n-gram TF-IDF vectors of every corpus example (CSV +
+# nlu_data), stored as a sparse column-major matrix. A query is one sparse
+# matrix-vector product (a gather over the query's columns plus a bincount),
+# so typos and shortened variants of known phrasings still find their intent.
+
+N_FEATURES = 1 << 18     # hashed n-gram buckets
+NGRAM_SIZES = (2, 3, 4)  # character n-grams of " text ", word boundaries included
+MIN_SIMILARITY = 0.5     # cosine similarity below this is no match
+
+
+def char_ngrams(text, sizes=NGRAM_SIZES):
+    padded = f" {text} "
+    return [padded[i:i + n] for n in sizes for i in range(len(padded) - n + 1)]
+
+
+def hash_ngrams(text, n_features=N_FEATURES):
+    """Bucket of every n-gram of the normalized text (crc32, stable across processes)."""
+    grams = char_ngrams(normalize_for_match(text))
+    return np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype=np.uint32) % np.uint32(n_features)
+
+
+def _weights(buckets, idf):
+    """Sublinear tf * idf for one text's buckets; returns (unique buckets, weights)."""
+    features, counts = np.unique(buckets, return_counts=True)
+    return features, (1.0 + np.log(counts)).astype(np.float32) * idf[features]
+
+
+class NgramIndex:
+    """
+    Nearest corpus example to a message by cosine similarity of TF-IDF
+    weighted char n-grams. Built from (text, intent) pairs; query() returns
+    (intent, similarity), or (None, best similarity) under min_similarity.
+    """
+
+    def __init__(self, pairs, min_similarity=MIN_SIMILARITY, n_features=N_FEATURES):
+        self.min_similarity = min_similarity
+        self.n_features = n_features
+        examples = {}
+        for text, intent in pairs:
+            if text and intent and normalize_for_match(text):
+                examples.setdefault(normalize_for_match(text), intent)
+        self.intents = list(examples.values())
+        docs = [hash_ngrams(text, n_features) for text in examples]
+
+        # Smoothed idf; n-grams no example has get the highest weight
+        df = np.zeros(n_features, dtype=np.int64)
+        for buckets in docs:
+            df[np.unique(buckets)] += 1
+        self.idf = (np.log((1.0 + len(docs)) / (1.0 + df)) + 1.0).astype(np.float32)
+
+        features, doc_ids, values = [], [], []
+        for i, buckets in enumerate(docs):
+            f, w = _weights(buckets, self.idf)
+            features.append(f)
+            doc_ids.append(np.full(len(f), i, dtype=np.int32))
+            values.append(w / np.linalg.norm(w))
+        features = np.concatenate(features) if docs else np.zeros(0, np.uint32)
+        order = np.argsort(features, kind="stable")
+        # CSC layout over the buckets that occur: column c holds rows indptr[c]:indptr[c + 1]
+        self.columns, starts = np.unique(features[order], return_index=True)
+        self.indptr = np.append(starts, len(order)).astype(np.int64)
+        self.doc_ids = np.concatenate(doc_ids)[order] if docs else np.zeros(0, np.int32)
+        self.values = np.concatenate(values)[order].astype(np.float32) if docs else np.zeros(0, np.float32)
+
+    def __len__(self):
+        return len(self.intents)
+
+    def scores(self, text):
+        """Cosine similarity of the text to every example."""
+        features, weights = _weights(hash_ngrams(text, self.n_features), self.idf)
+        if not len(features) or not len(self.columns):
+            return np.zeros(len(self.intents), dtype=np.float32)
+        weights /= np.linalg.norm(weights)
+        cols = np.searchsorted(self.columns, features)
+        found = cols < len(self.columns)
+        found[found] = self.columns[cols[found]] == features[found]
+        cols, weights = cols[found], weights[found]
+        starts, lengths = self.indptr[cols], self.indptr[cols + 1] - self.indptr[cols]
+        # Entries of all the query's columns in one gather, then summed per example
+        idx = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.bincount(self.doc_ids[idx], weights=self.values[idx] * np.repeat(weights, lengths),
+                           minlength=len(self.intents))
+
+    def query(self, text):
+        if not self.intents:
+            return None, 0.0
+        scores = self.scores(text)
+        best = int(scores.argmax())
+        similarity = float(scores[best])
+        if similarity < self.min_similarity:
+            return None, similarity
+        return self.intents[best], similarity
+
+    def stats(self):
+        return {"examples": len(self.intents), "columns": len(self.columns), "entries": len(self.values),
+                "min_similarity": self.min_similarity}
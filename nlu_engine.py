@@ -0,0 +1,356 @@
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+
+
+def normalize_message(text):
+    """Cache key for a chat message: lowercased, trimmed, single-spaced."""
+    return _WHITESPACE_RE.sub(" ", text.strip().lower())
+
+
+def normalize_for_match(text):
+    """Looser key for corpus lookups: also drops punctuation."""
+    return _WHITESPACE_RE.sub(" ", _PUNCT_RE.sub(" ", text.lower())).strip()
+
+
+class ExactMatchIndex:
+    """
+    Lookup of training-corpus phrasings -> intent, used before the model.
+    Built from corpus.load_nlu_sources() pairs. A message matches either
+    verbatim (lowercased) or after normalize_for_match. Pairs whose intent
+    is not in `labels` (the serving model's intents; e.g. a CSV line with an
+    unquoted comma parsed into a junk label) are skipped, and texts that
+    carry more than one intent (verbatim or normalized) are left out so the
+    model decides those; their lowercased forms are kept in `ambiguous`.
+    """
+
+    def __init__(self, pairs, labels=None):
+        exact, normalized = {}, {}
+        for text, intent in pairs:
+            if not (text and intent) or (labels is not None and intent not in labels):
+                continue
+            exact.setdefault(text.lower(), set()).add(intent)
+            normalized.setdefault(normalize_for_match(text), set()).add(intent)
+        self.exact = {k: next(iter(v)) for k, v in exact.items() if len(v) == 1}
+        self.normalized = {k: next(iter(v)) for k, v in normalized.items() if k and len(v) == 1}
+        self.ambiguous = frozenset(k for k, v in exact.items() if len(v) > 1)
+
+    def __len__(self):
+        return len(self.exact)
+
+    def lookup(self, message):
+        """Returns (intent, match_kind) or (None, None)."""
+        intent = self.exact.get(message.strip().lower())
+        if intent:
+            return intent, "exact_match"
+        intent = self.normalized.get(normalize_for_match(message))
+        if intent:
+            return intent, "normalized_match"
+        return None, None
+
+
+class IntentCache:
+    """
+    Bounded LRU of normalized message -> doc.cats, with an optional TTL.
+    Cleared whenever a new model is loaded so stale predictions never leak
+    across a retrain. Each clear starts a new generation; a put() tagged with
+    an older generation (a prediction made while the model was swapped) is
+    ignored.
+    """
+
+    def __init__(self, max_size=4096, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "clears": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            cats, stored_at = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return cats
+
+    def put(self, key, cats, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (cats, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+            self.stats["clears"] += 1
+
+    def stats_snapshot(self):
+        with self._lock:
+            s = dict(self.stats, size=len(self._data), max_size=self.max_size, ttl=self.ttl)
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = s["hits"] / lookups if lookups else 0.0
+        return s
+
+
+# Pipes the chat path actually reads (doc.cats); everything else is excluded
+SERVING_COMPONENTS = ("textcat_multilabel",)
+
+
+NLU_BACKENDS = ("spacy", "numpy")
+
+
+def load_pipeline(path, lean=True, backend="spacy"):
+    """
+    Loads the spaCy model at `path`.
+    In lean mode only the tokenizer and SERVING_COMPONENTS are built; other
+    pipes are excluded and the vocab (strings, lookups, vectors) is not read
+    from disk. textcat_multilabel hashes token features on the fly, so the
+    scores are identical to a full load.
+    With backend="numpy" the compiled copy train.py saved next to the model
+    (compiled_nlu.COMPILED_FILE) is memory-mapped instead and spaCy is not
+    imported; a model without one falls back to spaCy.
+    """
+    if backend == "numpy":
+        import compiled_nlu
+
+        compiled_path = os.path.join(path, compiled_nlu.COMPILED_FILE)
+        try:
+            return compiled_nlu.load(compiled_path)
+        except (OSError, compiled_nlu.CompiledModelError) as e:
+            print(f"No usable compiled model at {compiled_path} ({e}); falling back to spaCy.")
+    elif backend != "spacy":
+        raise ValueError(f"Unknown NLU backend {backend!r}; expected one of {NLU_BACKENDS}.")
+
+    import spacy
+
+    if not lean:
+        return spacy.load(path)
+    config = spacy.util.load_config(os.path.join(path, "config.cfg"))
+    exclude = [name for name in config["nlp"]["pipeline"] if name not in SERVING_COMPONENTS]
+    return spacy.load(path, exclude=exclude + ["vocab"])
+
+
+def model_labels(nlp):
+    """The intents a loaded model can predict (spaCy or compiled), or None if unknown."""
+    if nlp is None:
+        return None
+    labels = getattr(nlp, "labels", None)
+    if labels is None:
+        for name in SERVING_COMPONENTS:
+            if name in getattr(nlp, "pipe_names", ()):
+                labels = nlp.get_pipe(name).labels
+                break
+    return frozenset(labels) if labels is not None else None
+
+
+class ModelLoader:
+    """
+    Runs the initial model load once per process, inline or on a daemon
+    thread, and tracks it for the readiness probe. load() returns True when a
+    model is in service. A model loaded in the gunicorn master before fork is
+    inherited by the workers; a load still running at fork time is restarted
+    in each worker, since threads do not survive fork.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.state = "idle"  # idle -> loading -> ready | unavailable
+        self.seconds = None
+        self.error = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def start(self, background=True):
+        with self._lock:
+            if self.state == "ready" or (self._pid == os.getpid() and self.state != "idle"):
+                return
+            self._pid = os.getpid()
+            self.state = "loading"
+            self._done = threading.Event()
+        if background:
+            threading.Thread(target=self._run, name="model-loader", daemon=True).start()
+        else:
+            self._run()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            self.state = "ready" if self.load() else "unavailable"
+        except Exception as e:
+            self.error = str(e)
+            self.state = "unavailable"
+        finally:
+            self.seconds = time.perf_counter() - started
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """Starts the load if needed and waits up to timeout seconds; returns ready."""
+        self.start()
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self):
+        return {"state": self.state, "load_seconds": self.seconds, "error": self.error}
+
+
+class _PendingMessage:
+    __slots__ = ("text", "enqueued", "done", "cats", "error")
+
+    def __init__(self, text):
+        self.text = text
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.cats = None
+        self.error = None
+
+
+class InferenceBatcher:
+    """
+    Micro-batches concurrent NLU calls into one nlp.pipe run.
+    The first queued message opens a window of `window` seconds; everything
+    that arrives before it closes (up to max_batch messages) is classified
+    together and each caller gets its own doc.cats back.
+    get_nlp is called per batch so a reloaded model is picked up immediately.
+    """
+
+    def __init__(self, get_nlp, window=0.003, max_batch=32):
+        self.get_nlp = get_nlp
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.stats = {"batches": 0, "messages": 0, "max_batch_size": 0,
+                      "queue_wait_total_ms": 0.0, "queue_wait_max_ms": 0.0}
+
+    def predict(self, text):
+        """Blocks until the message's batch has run; returns its doc.cats."""
+        self._ensure_started()
+        item = _PendingMessage(text)
+        self._queue.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.cats
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="nlu-batcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            nlp = self.get_nlp()
+            if nlp is None:
+                for item in batch:
+                    item.cats = {}
+            else:
+                docs = nlp.pipe([item.text for item in batch], batch_size=len(batch))
+                for item, doc in zip(batch, docs):
+                    item.cats = dict(doc.cats)
+        except Exception as e:
+            for item in batch:
+                item.error = e
+        finally:
+            waits = [(started - item.enqueued) * 1000.0 for item in batch]
+            with self._stats_lock:
+                s = self.stats
+                s["batches"] += 1
+                s["messages"] += len(batch)
+                s["max_batch_size"] = max(s["max_batch_size"], len(batch))
+                s["queue_wait_total_ms"] += sum(waits)
+                s["queue_wait_max_ms"] = max(s["queue_wait_max_ms"], max(waits))
+            for item in batch:
+                item.done.set()
+
+    def stats_snapshot(self):
+        with self._stats_lock:
+            s = dict(self.stats)
+        s["mean_batch_size"] = s["messages"] / s["batches"] if s["batches"] else 0.0
+        s["queue_wait_mean_ms"] = s.pop("queue_wait_total_ms") / s["messages"] if s["messages"] else 0.0
+        s["window_ms"] = self.window * 1000.0
+        return s
+
+
+def create_batcher(get_nlp):
+    """
+    Builds the app's batcher from BANKBOT_NLU_BATCH_MS / BANKBOT_NLU_BATCH_MAX.
+    Returns None when the window is 0 (the default), i.e. one nlp() call per
+    request, which is what a single-threaded sync worker wants.
+    """
+    window_ms = float(os.environ.get("BANKBOT_NLU_BATCH_MS", "0"))
+    if window_ms <= 0:
+        return None
+    return InferenceBatcher(get_nlp, window=window_ms / 1000.0,
+                            max_batch=int(os.environ.get("BANKBOT_NLU_BATCH_MAX", "32")))
+
+
+def create_intent_cache():
+    """
+    Builds the app's prediction cache from BANKBOT_NLU_CACHE_SIZE (0 disables
+    it) and BANKBOT_NLU_CACHE_TTL (seconds, 0 means no expiry).
+    """
+    size = int(os.environ.get("BANKBOT_NLU_CACHE_SIZE", "4096"))
+    if size <= 0:
+        return None
+    ttl = float(os.environ.get("BANKBOT_NLU_CACHE_TTL", "0")) or None
+    return IntentCache(max_size=size, ttl=ttl)
+
+
+def create_ngram_index(pairs):
+    """
+    Builds the low-confidence fallback (ngram_index.NgramIndex) over the
+    corpus pairs. BANKBOT_NLU_FALLBACK=0 disables it (returns None);
+    BANKBOT_NLU_FALLBACK_MIN sets the minimum cosine similarity.
+    """
+    if os.environ.get("BANKBOT_NLU_FALLBACK", "1") == "0":
+        return None
+    import ngram_index
+
+    return ngram_index.NgramIndex(pairs, min_similarity=float(
+        os.environ.get("BANKBOT_NLU_FALLBACK_MIN", ngram_index.MIN_SIMILARITY)))
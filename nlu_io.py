@@ -0,0 +1,161 @@
+import csv
+import gzip
+import io
+import json
+import zlib
+
+import storage
+
+# Bulk import / streaming export of admin training data (nlu_data).
+# Uploads are parsed a row at a time and inserted in chunked transactions,
+# so a file of any size never has to fit in memory.
+
+IMPORT_FORMATS = ("csv", "ndjson")
+IMPORT_CHUNK = 500       # rows per executemany transaction (also bounds the IN (...) lookup)
+MAX_REPORTED_ERRORS = 100
+EXPORT_COLUMNS = ["text", "intent", "bot_reply"]
+
+
+class ImportFormatError(ValueError):
+    """The upload as a whole cannot be read (unknown format, missing CSV header)."""
+
+
+# Errors reading the upload itself, as opposed to one bad row
+READ_ERRORS = (ImportFormatError, UnicodeDecodeError, csv.Error, OSError, EOFError, zlib.error)
+
+
+# --- Parsing (one record at a time) ---
+def open_text(stream, compressed=False):
+    """Binary upload stream -> text stream; gzip is decompressed on the fly."""
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def iter_csv(lines):
+    """Yields (line_no, record_dict_or_None, error); the header must have text and intent."""
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or not {"text", "intent"} <= {f.strip() for f in reader.fieldnames}:
+        raise ImportFormatError("CSV header must include 'text' and 'intent' columns.")
+    for row in reader:
+        yield reader.line_num, {k.strip(): v for k, v in row.items() if k}, None
+
+
+def iter_ndjson(lines):
+    """Yields (line_no, record_dict_or_None, error); blank lines are skipped."""
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "expected a JSON object"
+            continue
+        yield line_no, record, None
+
+
+def parse(lines, fmt):
+    if fmt == "csv":
+        return iter_csv(lines)
+    if fmt == "ndjson":
+        return iter_ndjson(lines)
+    raise ImportFormatError(f"Unknown import format: {fmt}")
+
+
+def clean(record):
+    """Record -> (text, intent, bot_reply or None); raises ValueError when unusable."""
+    text = str(record.get("text") or "").strip()
+    intent = str(record.get("intent") or "").strip()
+    bot_reply = str(record.get("bot_reply") or "").strip() or None
+    if not (text and intent):
+        raise ValueError("text and intent are required")
+    return text, intent, bot_reply
+
+
+# --- Import ---
+def import_records(pool, records, timestamp, chunk_size=IMPORT_CHUNK):
+    """
+    Inserts parsed records, skipping texts already in nlu_data or earlier in
+    the same upload. Each chunk is one transaction. Returns the report:
+    counts plus the first MAX_REPORTED_ERRORS per-row problems as
+    {"line", "error"}, ordered by line. If the upload stops being readable
+    (bad header, encoding, truncated gzip) the valid rows before that point
+    are still inserted and report["aborted"] says why it stopped.
+    """
+    report = {"received": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "errors": []}
+    seen = set()
+    chunk = []
+
+    def problem(line_no, error):
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_no, "error": error})
+
+    def flush():
+        existing = storage.insert_new_nlu_data(pool, [fields for _, fields in chunk], timestamp)
+        for line_no, fields in chunk:
+            if fields[0] in existing:
+                report["duplicates"] += 1
+                problem(line_no, "already in nlu_data")
+            else:
+                report["inserted"] += 1
+        chunk.clear()
+
+    try:
+        for line_no, record, error in records:
+            report["received"] += 1
+            if error is None:
+                try:
+                    fields = clean(record)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                report["invalid"] += 1
+                problem(line_no, error)
+                continue
+            if fields[0] in seen:
+                report["duplicates"] += 1
+                problem(line_no, "duplicate of an earlier row")
+                continue
+            seen.add(fields[0])
+            chunk.append((line_no, fields))
+            if len(chunk) >= chunk_size:
+                flush()
+    except READ_ERRORS as e:
+        report["aborted"] = str(e)
+    if chunk:
+        flush()
+    report["errors"].sort(key=lambda e: e["line"])
+    report["errors_truncated"] = report["invalid"] + report["duplicates"] > len(report["errors"])
+    return report
+
+
+# --- Export (generators; wrap in stream_with_context) ---
+def stream_csv(rows, chunk=500):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % chunk == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n"
+
+
+def gzip_stream(chunks, level=6):
+    """Compresses a text stream into one gzip member, chunk by chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip header + trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,103 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+_UNSAFE_RE = re.compile(r"[^\w.-]+")
+
+
+def _collapse(frame, max_depth):
+    """Stack as 'outer;...;inner' with file:function:line frames (collapsed-stack format)."""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler for slow requests.
+    While requests are in flight, a daemon thread snapshots their threads'
+    stacks every `interval` seconds with sys._current_frames(), so the
+    request itself runs untraced. When a request takes at least `threshold`
+    seconds its samples are written to out_dir as a .folded file
+    ("frame;frame;frame count" lines), ready for flamegraph.pl or speedscope;
+    faster requests just drop theirs.
+    """
+
+    def __init__(self, threshold, interval=0.005, out_dir="profiles", max_depth=64):
+        self.threshold = threshold
+        self.interval = interval
+        self.out_dir = out_dir
+        self.max_depth = max_depth
+        self._active = {}  # thread ident -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.stats = {"profiled": 0, "dumped": 0, "samples": 0}
+
+    def request_started(self):
+        self._ensure_started()
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def request_finished(self, label, elapsed):
+        """Returns the path written for a slow request, else None."""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        self.stats["profiled"] += 1
+        if not samples or elapsed < self.threshold:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = f"slow-{int(time.time() * 1000)}-{os.getpid()}-{_UNSAFE_RE.sub('_', label).strip('_')}.folded"
+        path = os.path.join(self.out_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.stats["dumped"] += 1
+        return path
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each gunicorn worker starts its own sampler
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._active = {}
+            self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own:
+                        samples[_collapse(frame, self.max_depth)] += 1
+                        self.stats["samples"] += 1
+
+
+def create_profiler(out_dir):
+    """
+    Builds the app's profiler from BANKBOT_PROFILE_SLOW_MS (unset or 0: off),
+    BANKBOT_PROFILE_INTERVAL_MS and BANKBOT_PROFILE_DIR.
+    """
+    threshold_ms = float(os.environ.get("BANKBOT_PROFILE_SLOW_MS", "0"))
+    if threshold_ms <= 0:
+        return None
+    return SlowRequestProfiler(
+        threshold_ms / 1000.0,
+        interval=float(os.environ.get("BANKBOT_PROFILE_INTERVAL_MS", "5")) / 1000.0,
+        out_dir=os.environ.get("BANKBOT_PROFILE_DIR", out_dir),
+    )
@@ -244,6 +244,7 @@ const addNLUForm = document.getElementById("addNLUForm");
 const retrainBtn = document.getElementById("retrainBtn");
 const retrainStatus = document.getElementById("retrainStatus");
 const refreshHistoryBtn = document.getElementById("refreshHistoryBtn");
+const loadMoreHistoryBtn = document.getElementById("loadMoreHistoryBtn");
 
 // --- Admin Helper Functions ---
 function saveAdminState(isLoggedIn) {
@@ -309,16 +310,20 @@ adminLogoutBtn?.addEventListener("click", () => {
 });
 
 // --- 1. Load Chat History (MODIFIED) ---
-// --- 1. Load Chat History (MODIFIED) ---
-async function loadChatHistory() {
+// The endpoint returns one page (newest first) plus next_cursor; "Load More" fetches the next page
+let historyCursor = null;
+
+async function loadChatHistory(append = false) {
     if (!chatHistoryTableBody) return;
     
     try {
-        const response = await fetch("/api/admin/history");
+        let url = "/api/admin/history";
+        if (append && historyCursor) url += `?cursor=${encodeURIComponent(historyCursor)}`;
+        const response = await fetch(url);
         if (response.status === 403) return alert("Session expired. Please log in.");
         
         const data = await response.json();
-        chatHistoryTableBody.innerHTML = ''; // Clear existing
+        if (!append) chatHistoryTableBody.innerHTML = ''; // Clear existing
         
         data.history.forEach(item => {
             const tr = document.createElement("tr");
@@ -333,6 +338,9 @@ async function loadChatHistory() {
             `;
             chatHistoryTableBody.appendChild(tr);
         });
+
+        historyCursor = data.next_cursor || null;
+        if (loadMoreHistoryBtn) loadMoreHistoryBtn.style.display = historyCursor ? "" : "none";
     } catch (error) {
         console.error("Error loading chat history:", error);
     }
@@ -419,6 +427,22 @@ async function deleteNLUQuery(e) {
 }
 
 // --- 3. Retrain Bot ---
+// Training runs in the background on the server; poll its status until it finishes.
+async function pollRetrainStatus() {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const response = await fetch("/api/admin/retrain/status");
+        const result = await response.json();
+        const job = result.job || {};
+        if (job.state === "succeeded") {
+            return `✅ Bot successfully re-trained and deployed (${job.version}).`;
+        }
+        if (job.state === "failed") {
+            throw new Error(job.error || "Retraining failed.");
+        }
+    }
+}
+
 retrainBtn?.addEventListener("click", async () => {
     retrainBtn.disabled = true;
     retrainStatus.textContent = "⏳ Training model... this may take a moment.";
@@ -428,12 +452,12 @@ retrainBtn?.addEventListener("click", async () => {
         const result = await response.json();
 
         if (result.success) {
-            retrainStatus.textContent = `✅ ${result.message}`;
+            retrainStatus.textContent = await pollRetrainStatus();
         } else {
             retrainStatus.textContent = `❌ ${result.message}`;
         }
     } catch (error) {
-        retrainStatus.textContent = "❌ Retraining failed due to a server error.";
+        retrainStatus.textContent = `❌ ${error.message || "Retraining failed due to a server error."}`;
         console.error("Retrain error:", error);
     } finally {
         retrainBtn.disabled = false;
@@ -460,6 +484,7 @@ document.addEventListener("DOMContentLoaded", () => {
         updateAdminUI();
         
         // CRUCIAL FIX: Attach the listener here to ensure the element is ready.
-        refreshHistoryBtn?.addEventListener("click", loadChatHistory);
+        refreshHistoryBtn?.addEventListener("click", () => loadChatHistory());
+        loadMoreHistoryBtn?.addEventListener("click", () => loadChatHistory(true));
     }
 });
\ No newline at end of file
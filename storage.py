@@ -0,0 +1,142 @@
+# Queries for the core tables (users, admin_users, nlu_data), written once
+# and run through whichever pool db.get_pool() returns: the local SQLite
+# file, a shared MySQL/PostgreSQL server (BANKBOT_DB_URL) or the in-process
+# stand-in. Money movement lives in transfers.py, chat_history in chat_log.py.
+
+OPENING_BALANCE = 50000.0
+
+
+class AlreadyExists(ValueError):
+    """A UNIQUE column (email, account number, nlu_data text) is already taken."""
+
+
+# --- users / transactions ---
+def create_user(pool, name, email, account_number, password_hash, balance=OPENING_BALANCE, timestamp=None):
+    """Inserts the user plus the opening credit in one transaction; returns the new id."""
+    try:
+        with pool.transaction() as conn:
+            conn.execute(
+                "INSERT INTO users (name,email,account_number,password,balance,card_last4) VALUES (?,?,?,?,?,?)",
+                (name, email, account_number, password_hash, balance, account_number[-4:]),
+            )
+            # Looked up rather than cursor.lastrowid, which not every driver fills in
+            user_id = conn.execute("SELECT id FROM users WHERE account_number=?", (account_number,)).fetchone()[0]
+            conn.execute(
+                "INSERT INTO transactions (user_id,type,amount,description,timestamp) VALUES (?,?,?,?,?)",
+                (user_id, "credit", balance, "Initial balance", timestamp),
+            )
+    except pool.IntegrityError:
+        raise AlreadyExists("Email or account already exists.")
+    return user_id
+
+
+def find_login(pool, identifier):
+    """(id, password, name, email, account_number, balance, card_last4) by email or account number."""
+    column = "email" if "@" in identifier else "account_number"
+    rows = pool.execute(
+        f"SELECT id, password, name, email, account_number, balance, card_last4 FROM users WHERE {column}=?",
+        (identifier,),
+    )
+    return rows[0] if rows else None
+
+
+def load_account(pool, uid, statement_size):
+    """User row plus the newest statement_size transactions, read from one snapshot."""
+    with pool.transaction() as conn:
+        pool.begin(conn)
+        row = conn.execute(
+            "SELECT id, name, account_number, balance, card_last4 FROM users WHERE id=?", (uid,)
+        ).fetchone()
+        if not row:
+            return None
+        transactions = conn.execute(
+            "SELECT type, amount, description, timestamp FROM transactions WHERE user_id=? ORDER BY id DESC LIMIT ?",
+            (uid, statement_size),
+        ).fetchall()
+    return {
+        "id": row[0], "name": row[1], "account_number": row[2], "balance": row[3],
+        "card_last4": row[4], "transactions": tuple(transactions),
+    }
+
+
+def account_change_count(pool):
+    """Bumped by every committed transfer; polled by the account snapshot cache."""
+    rows = pool.execute("SELECT value FROM change_counters WHERE name='accounts'")
+    return rows[0][0] if rows else 0
+
+
+# --- admin_users ---
+def admin_password_hash(pool, username):
+    rows = pool.execute("SELECT password FROM admin_users WHERE username=?", (username,))
+    return rows[0][0] if rows else None
+
+
+# --- nlu_data ---
+def list_nlu_data(pool):
+    """(id, text, bot_reply, intent, timestamp), newest first."""
+    return pool.execute("SELECT id, text, bot_reply, intent, timestamp FROM nlu_data ORDER BY timestamp DESC")
+
+
+def nlu_pairs(pool):
+    """(text, intent) for every admin-added example."""
+    return pool.execute("SELECT text, intent FROM nlu_data")
+
+
+def nlu_change_count(pool):
+    """Bumped with every nlu_data insert/delete; part of corpus.change_token()."""
+    rows = pool.execute("SELECT value FROM change_counters WHERE name='nlu_data'")
+    return rows[0][0] if rows else 0
+
+
+def _bump_nlu_changes(conn):
+    conn.execute("UPDATE change_counters SET value = value + 1 WHERE name='nlu_data'")
+
+
+def add_nlu_data(pool, text, intent, bot_reply, timestamp):
+    try:
+        with pool.transaction() as conn:
+            conn.execute(
+                "INSERT INTO nlu_data (text, intent, bot_reply, timestamp) VALUES (?, ?, ?, ?)",
+                (text, intent, bot_reply, timestamp),
+            )
+            _bump_nlu_changes(conn)
+    except pool.IntegrityError:
+        raise AlreadyExists("Query already exists.")
+
+
+def insert_new_nlu_data(pool, rows, timestamp, attempts=3):
+    """
+    Inserts the (text, intent, bot_reply) rows whose text is not in nlu_data
+    yet: one lookup and one executemany in one transaction. Returns the set
+    of texts that already existed. A concurrent insert of the same text
+    makes the chunk retry, and the retry sees that row as existing.
+    """
+    texts = [r[0] for r in rows]
+    for attempt in range(attempts):
+        try:
+            with pool.transaction() as conn:
+                pool.begin(conn, write=True)
+                existing = {r[0] for r in conn.execute(
+                    f"SELECT text FROM nlu_data WHERE text IN ({','.join('?' * len(texts))})", texts
+                ).fetchall()}
+                new = [(t, i, b, timestamp) for t, i, b in rows if t not in existing]
+                if new:
+                    conn.executemany(
+                        "INSERT INTO nlu_data (text, intent, bot_reply, timestamp) VALUES (?, ?, ?, ?)", new
+                    )
+                    _bump_nlu_changes(conn)
+            return existing
+        except pool.IntegrityError:
+            if attempt == attempts - 1:
+                raise
+
+
+def nlu_replies(pool):
+    """text -> bot_reply for admin-added examples that have one."""
+    return dict(pool.execute("SELECT text, bot_reply FROM nlu_data WHERE bot_reply IS NOT NULL AND bot_reply != ''"))
+
+
+def delete_nlu_data(pool, data_id):
+    with pool.transaction() as conn:
+        conn.execute("DELETE FROM nlu_data WHERE id=?", (data_id,))
+        _bump_nlu_changes(conn)
@@ -1,124 +1,365 @@
-import csv
+import argparse
+import json
 import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 import spacy
 from spacy.training import Example
 from spacy.util import minibatch, compounding
-import sqlite3
 from pathlib import Path
+# Corpus readers live in corpus.py so the web app can use them without importing spaCy
+from corpus import load_combined_nlu_data, get_intents_from_combined_source
+
 # --- Paths ---
 APP_ROOT = os.path.dirname(__file__)
-CSV_PATH = os.path.join(APP_ROOT, "banking_queries.csv")
-DB_PATH = os.path.join(APP_ROOT, "data.db")
 MODEL_PATH = os.path.join(APP_ROOT, "models", "nlu_model")
 Path(os.path.dirname(MODEL_PATH)).mkdir(parents=True, exist_ok=True) # Ensure models directory exists
 
 
 
-# --- Helper function to load data from CSV ---
-def load_csv_nlu_data():
-    csv_data = []
-    try:
-        with open(CSV_PATH, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                text = row.get('text', '').strip()
-                intent = row.get('intent', '').strip()
-                if text and intent:
-                    csv_data.append((text, intent))
-    except FileNotFoundError:
-        print(f"Warning: {CSV_PATH} not found. Using only DB data.")
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-    return csv_data
-
-# --- Helper function to load data from DB (Admin-added) ---
-def load_db_nlu_data():
-    db_data = []
+# --- Training helpers ---
+TRAINING_DATA_FILE = "training_data.json"   # text -> intent the model was trained on
+TRAIN_REPORT_FILE = "train_report.json"     # mode, wall-clock time, epochs, dev accuracy
+SWEEP_REPORT_FILE = "sweep_report.json"     # every --sweep run with its config and scores
+PARITY_SAMPLE = 1000                        # training texts the compiled model is checked on
+
+def make_examples(nlp, data, labels):
+    examples = []
+    for text, intent in data:
+        cats = {i: 0.0 for i in labels}
+        if intent in cats:
+            cats[intent] = 1.0
+            examples.append(Example.from_dict(nlp.make_doc(text), {"cats": cats}))
+        else:
+            print(f"Warning: Intent '{intent}' not in ALL_INTENTS set.")
+    return examples
+
+def evaluate(nlp, data):
+    """Share of (text, intent) pairs whose top-scoring label is the gold intent."""
+    if not data:
+        return 0.0
+    correct = 0
+    for doc, (_, intent) in zip(nlp.pipe([text for text, _ in data]), data):
+        if doc.cats and max(doc.cats, key=doc.cats.get) == intent:
+            correct += 1
+    return correct / len(data)
+
+def split_holdout(data, fraction, rng):
+    """Returns (train, dev); dev is empty when there is too little data to spare."""
+    n_dev = int(len(data) * fraction)
+    if n_dev < 10:
+        return list(data), []
+    shuffled = list(data)
+    rng.shuffle(shuffled)
+    return shuffled[n_dev:], shuffled[:n_dev]
+
+def fit(nlp, examples, dev_data, iterations, patience, drop=0.2, batch_size=(4.0, 32.0), optimizer=None):
+    """
+    Runs up to `iterations` epochs. With dev data, stops after `patience`
+    epochs without a dev-accuracy gain and restores the best weights.
+    Returns (epochs_run, best_dev_accuracy, best_epoch).
+    """
+    optimizer = optimizer or nlp.begin_training()
+    best_acc, best_weights, stale, epochs, best_epoch = -1.0, None, 0, 0, 0
+    for i in range(iterations):
+        epochs = i + 1
+        losses = {}
+        batches = minibatch(examples, size=compounding(batch_size[0], batch_size[1], 1.001))
+        for batch in batches:
+            nlp.update(batch, drop=drop, losses=losses, sgd=optimizer)
+
+        if not dev_data:
+            continue
+        acc = evaluate(nlp, dev_data)
+        if acc > best_acc:
+            best_acc, best_weights, stale, best_epoch = acc, nlp.get_pipe("textcat_multilabel").to_bytes(), 0, epochs
+        else:
+            stale += 1
+            if stale >= patience:
+                print(f"Early stopping after epoch {epochs} (best dev accuracy {best_acc:.3f}).")
+                break
+
+    if best_weights is not None:
+        nlp.get_pipe("textcat_multilabel").from_bytes(best_weights)
+    return epochs, (best_acc if dev_data else None), (best_epoch if dev_data else epochs)
+
+def build_model(labels):
+    nlp = spacy.blank("en")
+    textcat = nlp.add_pipe("textcat_multilabel", last=True)
+    for intent in labels:
+        textcat.add_label(intent)
+    return nlp
+
+def compile_model(nlp, output_path, data):
+    """
+    Writes the NumPy copy of the textcat (compiled_nlu.COMPILED_FILE, served
+    with BANKBOT_NLU_BACKEND=numpy) next to the model and checks it against
+    spaCy on the training texts, normalized as the app sends them. A copy
+    that does not match is removed, so that backend falls back to spaCy.
+    Returns {"bytes", "max_diff"} or None.
+    """
+    import compiled_nlu
+    from nlu_engine import normalize_message
+
+    path = os.path.join(output_path, compiled_nlu.COMPILED_FILE)
+    texts = list(dict.fromkeys(normalize_message(text) for text, _ in data))[:PARITY_SAMPLE]
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT text, intent FROM nlu_data")
-        db_data = c.fetchall()
-        conn.close()
-    except sqlite3.OperationalError:
-        print("Warning: Database or nlu_data table not found. Using only CSV data.")
-    except Exception as e:
-        print(f"Error reading DB nlu_data: {e}")
-    return db_data
-
-# --- Helper function to load ALL data (CSV + DB) ---
-def load_combined_nlu_data():
-    csv_data = load_csv_nlu_data()
-    db_data = load_db_nlu_data()
-    
-    # Use a dictionary to store combined data and automatically handle duplicates
-    combined = {}
-    for text, intent in csv_data + db_data:
-        # Ensure text is lowercase for consistency
-        combined[text.lower()] = intent
-        
-    return list(combined.items()) # Returns [(text, intent), ...]
-
-# --- Helper function to get intents from ALL data ---
-def get_intents_from_combined_source():
-    intents = set()
-    for _, intent in load_combined_nlu_data():
-        if intent:
-            intents.add(intent)
-    return list(intents)
-
-# --- Training function ---
+        size = compiled_nlu.export(nlp, path)
+        diff = compiled_nlu.verify(nlp, compiled_nlu.load(path), texts)
+    except compiled_nlu.CompiledModelError as e:
+        print(f"Compiled model not written: {e}")
+        return None
+    if diff > compiled_nlu.PARITY_TOLERANCE:
+        os.remove(path)
+        print(f"Compiled model removed: scores differ from spaCy by up to {diff:.2g}.")
+        return None
+    print(f"Compiled model: {path} ({size / 1024:.0f} KiB, max score difference {diff:.1e})")
+    return {"bytes": size, "max_diff": diff}
+
+def save_model(nlp, output_path, data, report):
+    nlp.to_disk(output_path)
+    report["compiled"] = compile_model(nlp, output_path, data)
+    with open(os.path.join(output_path, TRAINING_DATA_FILE), "w", encoding="utf-8") as f:
+        json.dump(dict(data), f)
+    with open(os.path.join(output_path, TRAIN_REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("\nTraining complete.")
+    print(f"Model saved to: {output_path}")
+    print(f"Training time ({report['mode']}): {report['seconds']:.1f}s, {report['epochs']} epochs, "
+          f"{report['examples']} examples, dev accuracy {report['dev_accuracy']}")
 
 # --- Training function (Modified) ---
-def train(iterations=20):
+def train(iterations=20, output_path=MODEL_PATH, patience=3, holdout=0.1):
+    started = time.perf_counter()
     # Load all training data (CSV + DB)
     TRAIN_DATA_LIST = load_combined_nlu_data()
     ALL_INTENTS = get_intents_from_combined_source()
 
     if not TRAIN_DATA_LIST:
         print("No training data found in CSV or DB. Training aborted.")
-        return
+        return None
 
     print(f"Building and training NLU model with {len(TRAIN_DATA_LIST)} combined examples...")
-    
-    # Prepare data for spaCy
-    TRAIN_DATA = []
-    for text, intent in TRAIN_DATA_LIST:
-        cats = {i: 0.0 for i in ALL_INTENTS} 
-        if intent in cats:
-            cats[intent] = 1.0
-            TRAIN_DATA.append((text, {"cats": cats}))
-        else:
-             print(f"Warning: Intent '{intent}' not in ALL_INTENTS set.")
 
-    # Build the model
-    nlp = spacy.blank("en")
-    textcat = nlp.add_pipe("textcat_multilabel", last=True)
-
-    # Add labels
-    for intent in ALL_INTENTS:
-        textcat.add_label(intent)
+    # Build the model and add labels
+    nlp = build_model(ALL_INTENTS)
 
-    # Convert to spaCy's training format
-    examples = [Example.from_dict(nlp.make_doc(text), annotations) for text, annotations in TRAIN_DATA]
+    # Hold out a slice of the data for early stopping
+    train_data, dev_data = split_holdout(TRAIN_DATA_LIST, holdout, random.Random(0))
+    examples = make_examples(nlp, train_data, ALL_INTENTS)
 
     # Start training
-    optimizer = nlp.begin_training()
-    for i in range(iterations):
-        losses = {}
-        batches = minibatch(examples, size=compounding(4.0, 32.0, 1.001))
-        for batch in batches:
-            nlp.update(batch, drop=0.2, losses=losses)
-    
-        # print(f"Epoch {i+1} - Losses: {losses}") # Keep this print optional for clarity
-    
-    # Save the trained model
-    nlp.to_disk(MODEL_PATH)
-    print("\nTraining complete.")
-    print(f"Model saved to: {MODEL_PATH}")
+    epochs, dev_acc, best_epoch = fit(nlp, examples, dev_data, iterations, patience)
+
+    # The held-out rows only chose the epoch count; retrain on every row for that many epochs,
+    # so rare intents whose examples landed in the dev slice are learned too
+    if dev_data:
+        print(f"Retraining on all {len(TRAIN_DATA_LIST)} examples for {best_epoch} epochs...")
+        nlp = build_model(ALL_INTENTS)
+        train_data = TRAIN_DATA_LIST
+        examples = make_examples(nlp, train_data, ALL_INTENTS)
+        fit(nlp, examples, None, best_epoch, patience)
+
+    # Save the trained model (training_data.json lists only the rows it was fitted on)
+    save_model(nlp, output_path, [(text, intent) for text, intent in train_data if intent in ALL_INTENTS], {
+        "mode": "full", "seconds": round(time.perf_counter() - started, 2), "epochs": epochs,
+        "final_epochs": best_epoch, "examples": len(examples), "dev_accuracy": dev_acc,
+    })
+    return output_path
+
+# --- Incremental (warm-start) training ---
+def train_incremental(output_path, base_path=None, iterations=10, patience=2, rehearsal=3, holdout=0.1):
+    """
+    Fine-tunes the live model on nlu_data rows that are new or whose intent
+    changed since it was trained, mixed with `rehearsal` x as many old
+    examples so it does not forget them. Falls back to train() when the label
+    set changed or the base model has no record of its training data.
+    """
+    import model_store
+
+    started = time.perf_counter()
+    base_path = base_path or model_store.model_path(model_store.current_version())
+    data = load_combined_nlu_data()
+    labels = set(get_intents_from_combined_source())
+
+    try:
+        nlp = spacy.load(base_path)
+        with open(os.path.join(base_path, TRAINING_DATA_FILE), "r", encoding="utf-8") as f:
+            trained_on = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"No usable base model at {base_path} ({e}). Falling back to full training.")
+        return train(output_path=output_path)
+
+    if "textcat_multilabel" not in nlp.pipe_names or set(nlp.get_pipe("textcat_multilabel").labels) != labels:
+        print("Intent set changed since the last training run. Falling back to full training.")
+        return train(output_path=output_path)
+
+    new_data = [(text, intent) for text, intent in data if trained_on.get(text) != intent]
+    old_data = [(text, intent) for text, intent in data if trained_on.get(text) == intent]
+    print(f"Incremental training: {len(new_data)} new/changed examples, {len(old_data)} already learned.")
+
+    rng = random.Random(0)
+    rest, dev_data = split_holdout(old_data, holdout, rng)
+    replay = rng.sample(rest, min(len(rest), max(rehearsal * len(new_data), 32))) if new_data else []
+    examples = make_examples(nlp, new_data + replay, labels)
+
+    epochs, dev_acc = 0, None
+    if new_data:
+        epochs, dev_acc, _ = fit(nlp, examples, dev_data, iterations, patience,
+                                 optimizer=nlp.resume_training())
+
+    save_model(nlp, output_path, data, {
+        "mode": "incremental", "seconds": round(time.perf_counter() - started, 2), "epochs": epochs,
+        "examples": len(examples), "new_examples": len(new_data), "dev_accuracy": dev_acc,
+        "base_model": base_path,
+    })
+    return output_path
 
-    # Test the model... (Your existing test logic remains)
+# --- Hyperparameter / epoch sweep ---
+# Every combination is trained in its own process on the same split.
+SWEEP_GRID = {
+    "iterations": [10, 20],
+    "drop": [0.1, 0.2, 0.3],
+    "batch_size": [(4.0, 32.0), (8.0, 64.0)],
+}
+
+def sweep_configs(grid=SWEEP_GRID):
+    configs = [{}]
+    for key, values in grid.items():
+        configs = [dict(c, **{key: v}) for c in configs for v in values]
+    return configs
+
+def score(nlp, data):
+    """Accuracy, per-intent F1 and mean single-message inference latency (ms) on `data`."""
+    gold = [intent for _, intent in data]
+    pred, latencies = [], []
+    for text, _ in data:
+        t0 = time.perf_counter()
+        cats = nlp(text).cats
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        pred.append(max(cats, key=cats.get) if cats else None)
+
+    f1 = {}
+    for intent in sorted(set(gold)):
+        tp = sum(1 for g, p in zip(gold, pred) if g == p == intent)
+        fp = sum(1 for g, p in zip(gold, pred) if p == intent and g != intent)
+        fn = sum(1 for g, p in zip(gold, pred) if g == intent and p != intent)
+        f1[intent] = round(2 * tp / (2 * tp + fp + fn), 4) if tp else 0.0
+    return {
+        "accuracy": round(sum(g == p for g, p in zip(gold, pred)) / len(gold), 4),
+        "macro_f1": round(sum(f1.values()) / len(f1), 4),
+        "per_intent_f1": f1,
+        "latency_ms": round(sum(latencies) / len(latencies), 3),
+    }
+
+def _sweep_worker(config, train_data, dev_data, labels):
+    started = time.perf_counter()
+    nlp = build_model(labels)
+    examples = make_examples(nlp, train_data, labels)
+    # patience = iterations: every epoch runs, and the best one is kept and reported
+    _, _, best_epoch = fit(nlp, examples, dev_data, config["iterations"], patience=config["iterations"],
+                           drop=config["drop"], batch_size=config["batch_size"])
+    seconds = round(time.perf_counter() - started, 2)
+    return dict(score(nlp, dev_data), config=config, best_epoch=best_epoch, train_seconds=seconds)
+
+def sweep(output_path=MODEL_PATH, grid=SWEEP_GRID, workers=None, holdout=0.2):
+    """
+    Trains every SWEEP_GRID combination in parallel and scores each on a
+    held-out split. The most accurate one (faster inference breaks ties) is
+    then retrained on every row for its best epoch count and saved to
+    output_path, with a sweep_report.json of all runs (train_report.json
+    summarises the winner, as for the other modes).
+    """
+    started = time.perf_counter()
+    data = load_combined_nlu_data()
+    labels = get_intents_from_combined_source()
+    if not data:
+        print("No training data found in CSV or DB. Sweep aborted.")
+        return None
+
+    train_data, dev_data = split_holdout(data, holdout, random.Random(0))
+    if not dev_data:
+        print("Not enough data for a held-out split. Sweep aborted.")
+        return None
+
+    configs = sweep_configs(grid)
+    workers = workers or os.cpu_count() or 1
+    print(f"Sweeping {len(configs)} configurations on {workers} processes "
+          f"({len(train_data)} train / {len(dev_data)} held-out examples)...")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_sweep_worker, config, train_data, dev_data, labels) for config in configs]
+        results = [f.result() for f in futures]
+
+    results.sort(key=lambda r: (-r["accuracy"], r["latency_ms"]))
+    print(f"\n{'accuracy':>8} {'macro_f1':>8} {'train_s':>8} {'latency_ms':>10}  config")
+    for r in results:
+        print(f"{r['accuracy']:8.3f} {r['macro_f1']:8.3f} {r['train_seconds']:8.1f} "
+              f"{r['latency_ms']:10.3f}  {r['config']}")
+
+    # The held-out rows only picked the configuration; like train(), the published model
+    # learns every row, so intents whose few examples all landed in the dev slice are not lost
+    best = results[0]
+    print(f"\nRetraining {best['config']} on all {len(data)} examples for {best['best_epoch']} epochs...")
+    nlp = build_model(labels)
+    examples = make_examples(nlp, data, labels)
+    fit(nlp, examples, None, best["best_epoch"], 0, drop=best["config"]["drop"],
+        batch_size=best["config"]["batch_size"])
+    seconds = round(time.perf_counter() - started, 2)
+    save_model(nlp, output_path, [(text, intent) for text, intent in data if intent in labels], {
+        "mode": "sweep", "seconds": seconds, "epochs": best["config"]["iterations"],
+        "final_epochs": best["best_epoch"], "examples": len(examples), "dev_accuracy": best["accuracy"],
+        "best": best, "sweep_report": SWEEP_REPORT_FILE,
+    })
+    with open(os.path.join(output_path, SWEEP_REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump({"seconds": seconds, "grid": grid, "holdout": holdout, "train_examples": len(train_data),
+                   "dev_examples": len(dev_data), "final_examples": len(examples), "best": best,
+                   "runs": results}, f, indent=2)
+
+    print(f"Best configuration: {best['config']} (accuracy {best['accuracy']:.3f})")
+    return output_path
 
 if __name__ == "__main__":
-    train()
+    import model_store
+
+    parser = argparse.ArgumentParser(description="Train the BankBot NLU model from CSV + DB data.")
+    parser.add_argument("--output", help="Directory to save the model to (nothing is published).")
+    parser.add_argument("--iterations", type=int, default=20, help="Maximum epochs (early stopping may end sooner).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Fine-tune the live model on new/changed nlu_data rows instead of training from scratch.")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Train every SWEEP_GRID configuration in parallel and keep the best one.")
+    parser.add_argument("--workers", type=int, help="Processes for --sweep (default: CPU count).")
+    parser.add_argument("--compile", metavar="MODEL_DIR",
+                        help="Only (re)write the compiled NumPy copy of an existing model, then exit.")
+    args = parser.parse_args()
+
+    if args.compile:
+        try:
+            with open(os.path.join(args.compile, TRAINING_DATA_FILE), "r", encoding="utf-8") as f:
+                trained_on = list(json.load(f).items())
+        except OSError:
+            trained_on = load_combined_nlu_data()
+        if not compile_model(spacy.load(args.compile), args.compile, trained_on):
+            raise SystemExit(1)
+        raise SystemExit(0)
+
+    def run(output_path):
+        if args.sweep:
+            return sweep(output_path, workers=args.workers)
+        if args.incremental:
+            return train_incremental(output_path)
+        return train(args.iterations, output_path=output_path)
+
+    if args.output:
+        if not run(args.output):
+            raise SystemExit(1)
+    else:
+        # Train into a new version and make it live for all running workers
+        version, path = model_store.new_version()
+        if not run(path):
+            raise SystemExit(1)
+        model_store.publish(version)
+        print(f"Published model version: {version}")
 
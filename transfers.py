@@ -0,0 +1,178 @@
+import json
+import random
+import time
+from datetime import datetime
+
+# Remembered outcome of every transfer submitted with an idempotency key
+TRANSFER_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS transfer_requests (
+        user_id INTEGER NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        fingerprint TEXT NOT NULL, -- to_account|amount, to spot a key reused for another transfer
+        result TEXT NOT NULL,      -- JSON reply returned to the client
+        timestamp TEXT,
+        PRIMARY KEY (user_id, idempotency_key)
+    )
+    """,
+)
+
+MAX_BATCH_SIZE = 100
+MAX_KEY_LENGTH = 128
+
+BUSY_REPLY = "The bank is busy right now. Please try again in a moment."
+
+
+class TransferError(ValueError):
+    """Raised for malformed transfer requests (bad amount, key or batch)."""
+
+
+def _fingerprint(to_account_number, amount):
+    return f"{to_account_number}|{amount:.2f}"
+
+
+class TransferEngine:
+    """
+    Moves money between users in short write transactions.
+
+    Every transfer takes the write lock up front (BEGIN IMMEDIATE on SQLite), so two
+    workers never both read a balance and then fight over upgrading to a
+    write lock, and the debit is a single conditional UPDATE
+    (balance >= amount), so concurrent transfers can never overdraw an
+    account. If the database stays locked past the busy timeout (or a server
+    database reports a deadlock) the whole transaction is retried with
+    jittered exponential backoff.
+
+    A transfer submitted with an idempotency key records its reply in
+    transfer_requests in the same transaction; resubmitting the key returns
+    that reply instead of posting again.
+
+    on_commit(user_ids) runs after every committed transaction with the users
+    whose balances changed, e.g. to invalidate cached account snapshots.
+    """
+
+    def __init__(self, pool, max_retries=5, backoff=0.02, on_commit=None):
+        self.pool = pool
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_commit = on_commit
+        self.stats = {"committed": 0, "replayed": 0, "rejected": 0, "retries": 0, "busy": 0}
+
+    # --- Public API ---
+    def transfer(self, from_user_id, to_account_number, amount, idempotency_key=None):
+        """One transfer; returns {"success", "reply", ...}."""
+        item = self._validate(to_account_number, amount, idempotency_key)
+        results = self._run(from_user_id, [item])
+        return results[0]
+
+    def transfer_batch(self, from_user_id, items):
+        """
+        Several transfers from one user in a single write transaction.
+        items: dicts with to_account, amount and optional idempotency_key.
+        Each item succeeds or fails on its own (e.g. the balance runs out
+        part way through); results are returned in item order.
+        """
+        if not items:
+            raise TransferError("No transfers given.")
+        if len(items) > MAX_BATCH_SIZE:
+            raise TransferError(f"At most {MAX_BATCH_SIZE} transfers per batch.")
+        validated = [
+            self._validate(item.get("to_account"), item.get("amount"), item.get("idempotency_key"))
+            for item in items
+        ]
+        return self._run(from_user_id, validated)
+
+    def stats_snapshot(self):
+        return dict(self.stats)
+
+    # --- Internals ---
+    @staticmethod
+    def _validate(to_account_number, amount, idempotency_key):
+        try:
+            amount = float(amount)
+        except (TypeError, ValueError):
+            raise TransferError("Enter a valid amount.")
+        if not amount > 0:
+            raise TransferError("Enter a valid amount.")
+        if not to_account_number:
+            raise TransferError("Please provide the account number.")
+        if idempotency_key is not None and not (0 < len(str(idempotency_key)) <= MAX_KEY_LENGTH):
+            raise TransferError("Invalid idempotency key.")
+        return str(to_account_number), amount, idempotency_key and str(idempotency_key)
+
+    def _run(self, from_user_id, items):
+        for attempt in range(self.max_retries + 1):
+            touched = set()
+            try:
+                with self.pool.transaction() as conn:
+                    self.pool.begin(conn, write=True)
+                    results = [self._apply(conn, from_user_id, *item, touched) for item in items]
+                break
+            except self.pool.Error as e:
+                # A duplicate idempotency key means another node posted it first;
+                # the retry finds its row and replays the stored reply
+                if not (self.pool.is_busy(e) or isinstance(e, self.pool.IntegrityError)):
+                    raise
+                if attempt == self.max_retries:
+                    self.stats["busy"] += 1
+                    return [{"success": False, "reply": BUSY_REPLY, "busy": True} for _ in items]
+                self.stats["retries"] += 1
+                time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+        if touched and self.on_commit:
+            self.on_commit(touched)
+        for result in results:
+            key = "replayed" if result.get("replayed") else "committed" if result["success"] else "rejected"
+            self.stats[key] += 1
+        return results
+
+    def _apply(self, conn, from_user_id, to_account_number, amount, idempotency_key, touched):
+        fingerprint = _fingerprint(to_account_number, amount)
+        if idempotency_key:
+            row = conn.execute(
+                "SELECT fingerprint, result FROM transfer_requests WHERE user_id=? AND idempotency_key=?",
+                (from_user_id, idempotency_key),
+            ).fetchone()
+            if row:
+                if row[0] != fingerprint:
+                    return {"success": False, "reply": "This idempotency key was already used for a different transfer.",
+                            "conflict": True}
+                return dict(json.loads(row[1]), replayed=True)
+
+        result = self._post(conn, from_user_id, to_account_number, amount, touched)
+        if idempotency_key:
+            conn.execute(
+                "INSERT INTO transfer_requests (user_id, idempotency_key, fingerprint, result, timestamp) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (from_user_id, idempotency_key, fingerprint, json.dumps(result), datetime.utcnow().isoformat()),
+            )
+        return result
+
+    @staticmethod
+    def _post(conn, from_user_id, to_account_number, amount, touched):
+        rec = conn.execute("SELECT id FROM users WHERE account_number=?", (to_account_number,)).fetchone()
+        if not rec:
+            return {"success": False, "reply": "Recipient account not found."}
+        to_user_id = rec[0]
+
+        # Conditional debit: no separate read, so no window for a double spend
+        debited = conn.execute(
+            "UPDATE users SET balance = balance - ? WHERE id=? AND balance >= ?",
+            (amount, from_user_id, amount),
+        ).rowcount
+        if not debited:
+            exists = conn.execute("SELECT 1 FROM users WHERE id=?", (from_user_id,)).fetchone()
+            return {"success": False, "reply": "Insufficient balance." if exists else "Sender not found."}
+        conn.execute("UPDATE users SET balance = balance + ? WHERE id=?", (amount, to_user_id))
+
+        ts = datetime.utcnow().isoformat()
+        conn.executemany(
+            "INSERT INTO transactions (user_id,type,amount,description,timestamp) VALUES (?,?,?,?,?)",
+            [(from_user_id, "debit", amount, f"Transfer to {to_account_number}", ts),
+             (to_user_id, "credit", amount, f"Transfer from user {from_user_id}", ts)],
+        )
+        # Tells the other workers' account caches to drop their snapshots
+        conn.execute("UPDATE change_counters SET value = value + 1 WHERE name='accounts'")
+        touched.update((from_user_id, to_user_id))
+        return {"success": True, "reply": f"Transferred ₹{amount:.2f} to account {to_account_number}.",
+                "to_user_id": to_user_id}